@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""In-memory caches with stats, shared by the objects of a process"""
+
+import collections
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 4096
+CACHE_POLICY_LRU = 'lru'
+CACHE_POLICY_FIFO = 'fifo'
+CACHE_POLICIES = [CACHE_POLICY_LRU, CACHE_POLICY_FIFO]
+
+# Settings of the caches created from now on and of the existing ones
+CACHE_SETTINGS = {
+    'size': CACHE_SIZE,
+    'ttl': None,
+    'policy': CACHE_POLICY_LRU
+}
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+
+class Cache:
+    """Cache of values with a max size, a time to live and stats.
+
+    When the cache is full, the least recently used entry (`lru`
+    policy) or the oldest one (`fifo` policy) is evicted. The entries
+    older than `ttl` seconds are not returned. The cache can be used
+    from several threads.
+
+    :param name: name of the cache shown in the stats
+    :param size: max number of entries
+    :param ttl: seconds an entry is valid (None = no expiration)
+    :param policy: eviction policy, `lru` or `fifo`
+    """
+    def __init__(self, name, size=CACHE_SIZE, ttl=None, policy=CACHE_POLICY_LRU):
+        self.name = name
+        self.entries = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self.configure(size, ttl, policy)
+
+    def configure(self, size=CACHE_SIZE, ttl=None, policy=CACHE_POLICY_LRU):
+        """Set the size, time to live and eviction policy of the cache"""
+
+        if policy not in CACHE_POLICIES:
+            raise ValueError("Unknown cache policy {}; valid ones are {}".format(policy, CACHE_POLICIES))
+
+        with self._lock:
+            self.size = size
+            self.ttl = ttl
+            self.policy = policy
+            self.__evict()
+
+    def get(self, key, default=None):
+        """Get the value of a key, or `default` when it is not cached or expired"""
+
+        found, value = self.__lookup(key)
+        return value if found else default
+
+    def set(self, key, value):
+        """Store the value of a key, evicting the entries which don't fit"""
+
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            self.__evict()
+
+    def get_or_call(self, key, func):
+        """Get the value of a key, calling `func` to get it when it is not cached.
+
+        The value returned by `func` is stored, even if it is None. The
+        errors raised are not cached.
+        """
+        found, value = self.__lookup(key)
+        if not found:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def invalidate(self):
+        """Remove all the entries, keeping the stats"""
+
+        with self._lock:
+            self.entries.clear()
+
+    def clear(self):
+        """Remove all the entries and reset the stats"""
+
+        with self._lock:
+            self.entries.clear()
+            self.stats.clear()
+
+    def __contains__(self, key):
+        return self.__lookup(key, count=False)[0]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __lookup(self, key, count=True):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] is not None and entry[1] < time.monotonic():
+                del self.entries[key]
+                entry = None
+                if count:
+                    self.stats['expirations'] += 1
+
+            if entry is None:
+                if count:
+                    self.stats['misses'] += 1
+                return False, None
+
+            if count:
+                self.stats['hits'] += 1
+            if self.policy == CACHE_POLICY_LRU:
+                self.entries.move_to_end(key)
+            return True, entry[0]
+
+    def __evict(self):
+        while len(self.entries) > max(self.size, 0):
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def summary(self):
+        """Text with the stats of the cache"""
+
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = 100.0 * self.stats['hits'] / lookups if lookups else 0.0
+        return "{}: {} entries, {} hits, {} misses ({:.1f}% hit rate), {} evictions, {} expirations".format(
+            self.name, len(self.entries), self.stats['hits'], self.stats['misses'], hit_rate,
+            self.stats['evictions'], self.stats['expirations'])
+
+
+def get_cache(name):
+    """Get the shared cache of a given name, creating it if needed"""
+
+    with CACHES_LOCK:
+        if name not in CACHES:
+            CACHES[name] = Cache(name, **CACHE_SETTINGS)
+        return CACHES[name]
+
+
+def configure_caches(size=None, ttl=None, policy=None):
+    """Set the size, time to live and eviction policy of the shared caches.
+
+    :param size: max number of entries of each cache
+    :param ttl: seconds the entries are valid
+    :param policy: eviction policy, `lru` or `fifo`
+    """
+    with CACHES_LOCK:
+        if size is not None:
+            CACHE_SETTINGS['size'] = size
+        if ttl is not None:
+            CACHE_SETTINGS['ttl'] = ttl or None
+        if policy is not None:
+            CACHE_SETTINGS['policy'] = policy
+
+        for cache in CACHES.values():
+            cache.configure(**CACHE_SETTINGS)
+
+
+def clear_caches():
+    """Remove the entries and stats of all the shared caches"""
+
+    with CACHES_LOCK:
+        for cache in CACHES.values():
+            cache.clear()
+
+
+def invalidate_caches(names):
+    """Remove the entries of some shared caches, keeping their stats.
+
+    :param names: names of the caches
+    """
+    with CACHES_LOCK:
+        caches = [CACHES[name] for name in names if name in CACHES]
+
+    for cache in caches:
+        cache.invalidate()
+
+
+def log_caches_stats(level=logging.INFO):
+    """Log the stats of the shared caches which were used"""
+
+    with CACHES_LOCK:
+        caches = list(CACHES.values())
+
+    for cache in caches:
+        if cache.stats:
+            logger.log(level, "Cache {}".format(cache.summary()))
+
+
+def cached(name, key=None):
+    """Decorator which caches the results of a method in a shared cache.
+
+    The results are stored in the cache `name`, using the arguments of
+    the method as the key. The object is not part of the key, so the
+    results are shared by all the objects of the class, and the objects
+    are not kept alive by the cache. When the result depends on the
+    object, `key` is called with it to get a value added to the key.
+
+    :param name: name of the shared cache
+    :param key: function which gets the part of the key of an object
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            cache_key = (key(self),) + args if key else args
+            return get_cache(name).get_or_call(cache_key, lambda: func(self, *args))
+
+        wrapper.cache_name = name
+        return wrapper
+
+    return decorator
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""JSON encoding and decoding of the documents exchanged with ElasticSearch.
+
+When orjson is installed it is used to encode and decode the documents,
+falling back to the standard json module for the data orjson doesn't
+support (i.e. integers bigger than 64 bits or lone surrogates).
+"""
+
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    ORJSON_LIB = True
+except ImportError:
+    orjson = None
+    ORJSON_LIB = False
+
+# Escaped backslashes and valid surrogate pairs are kept, the lone
+# surrogates are removed. Matching the escaped backslashes avoids
+# taking `\\ud800` (a backslash followed by 'ud800') as a surrogate.
+SURROGATE_REGEX = re.compile(r'\\u[dD][89a-fA-F]')
+SURROGATES_REGEX = re.compile(r'(\\\\)'
+                              r'|(\\u[dD][89abAB][0-9a-fA-F]{2}\\u[dD][c-fC-F][0-9a-fA-F]{2})'
+                              r'|\\u[dD][89a-fA-F][0-9a-fA-F]{2}')
+
+# orjson decodes the integers out of the 64 bits range as floats, so
+# the json module is used for the documents with 19 or more digits in
+# a row. The digits are found translating the document, which is much
+# faster than a regular expression.
+DIGITS_TABLE = bytes(ord('0') if chr(i).isdigit() and i < 128 else ord(' ') for i in range(256))
+LONG_NUMBER = b'0' * 19
+
+
+def use_orjson(enabled):
+    """Enable or disable the use of orjson when it is installed.
+
+    :param enabled: if False, only the json module is used
+
+    :returns: whether orjson is used
+    """
+    global ORJSON_LIB
+
+    ORJSON_LIB = bool(enabled) and orjson is not None
+
+    return ORJSON_LIB
+
+
+def dumps(obj):
+    """Encode `obj` as a JSON string.
+
+    :param obj: object to encode
+
+    :returns: the JSON representation of obj
+    """
+    if ORJSON_LIB:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            pass
+
+    return json.dumps(obj)
+
+
+def remove_surrogates(text):
+    """Remove the escaped lone surrogates of a JSON text, which
+    can't be encoded in UTF-8.
+
+    :param text: JSON text
+
+    :returns: the JSON text without lone surrogates
+    """
+    if not SURROGATE_REGEX.search(text):
+        return text
+
+    return SURROGATES_REGEX.sub(lambda m: m.group(1) or m.group(2) or '', text)
+
+
+def loads(data):
+    """Decode a JSON document removing the invalid characters.
+
+    The invalid UTF-8 sequences are replaced by U+FFFD and the
+    lone surrogates are removed from the strings.
+
+    :param data: JSON document, as bytes or str
+
+    :returns: the decoded object
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8', errors='ignore')
+
+    if ORJSON_LIB and data.translate(DIGITS_TABLE).find(LONG_NUMBER) < 0:
+        try:
+            # orjson rejects invalid UTF-8 and lone surrogates,
+            # so the cleanup is only needed when it fails
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+
+    text = data.decode('utf-8', errors='replace')
+
+    return json.loads(remove_surrogates(text))
+
+
+def loads_response(res):
+    """Decode the JSON body of an HTTP response.
+
+    :param res: requests response
+
+    :returns: the decoded object
+    """
+    return loads(res.content)
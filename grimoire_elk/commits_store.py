@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Local set of the hashes of the commits of a git origin stored in the raw index"""
+
+import collections
+import hashlib
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+COMMITS_FILE_EXTENSION = ".commits"
+
+
+class CommitsStore:
+    """Sorted set of the hashes of the commits of an origin.
+
+    The hashes are stored in binary in a file, sorted, after a first
+    byte with the size of each hash (20 bytes for SHA-1 repositories,
+    32 for SHA-256 ones). The file is replaced atomically every time
+    it is updated, so it can be read while other process updates it.
+
+    The store doesn't know whether it has the commits of all the items
+    of the origin; its number of commits must be compared with the
+    number of items of the origin in the raw index before using it.
+
+    :param path: root directory of the stores
+    :param index: name of the raw index
+    :param origin: origin of the commits
+    """
+    def __init__(self, path, index, origin):
+        digest = hashlib.sha1(str(origin).encode('utf-8')).hexdigest()
+        self.dir_path = os.path.join(path, index)
+        self.file_path = os.path.join(self.dir_path, digest + COMMITS_FILE_EXTENSION)
+
+    def load(self):
+        """Get the hashes of the commits stored.
+
+        :returns: sorted list of hashes, or None when the store
+            doesn't exist or it is corrupted
+        """
+        try:
+            with open(self.file_path, 'rb') as fd:
+                data = fd.read()
+        except OSError:
+            return None
+
+        if not data or not data[0] or (len(data) - 1) % data[0]:
+            logger.warning("Invalid commits store {}".format(self.file_path))
+            return None
+
+        size = data[0]
+        return [data[i:i + size].hex() for i in range(1, len(data), size)]
+
+    def save(self, hashes):
+        """Replace the hashes of the commits stored.
+
+        The hashes which are not hexadecimal or whose size is not
+        the one of most of them are not stored.
+
+        :param hashes: iterable of hashes
+        """
+        digests = set()
+        for _hash in hashes:
+            try:
+                digests.add(bytes.fromhex(_hash))
+            except (TypeError, ValueError):
+                continue
+
+        sizes = collections.Counter(len(digest) for digest in digests)
+        size = sizes.most_common(1)[0][0] if sizes else 20
+        if len(sizes) > 1:
+            logger.warning("Commits with hashes of several sizes in {}; only the ones of {} bytes are stored".format(
+                           self.file_path, size))
+
+        data = bytes([size]) + b''.join(sorted(digest for digest in digests if len(digest) == size))
+
+        os.makedirs(self.dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir_path)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, self.file_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def add(self, hashes):
+        """Add the hashes of new commits to the store"""
+
+        self.save((self.load() or []) + list(hashes))
+
+    def remove(self, hashes):
+        """Remove the hashes of deleted commits from the store, when it exists"""
+
+        stored = self.load()
+        if stored is None:
+            return
+
+        hashes = set(hashes)
+        self.save(_hash for _hash in stored if _hash not in hashes)
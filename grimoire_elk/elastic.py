@@ -19,10 +19,13 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
+import contextlib
+import functools
+import hashlib
 import json
 import logging
-import sys
-from time import time
+import threading
+import time
 
 import requests
 
@@ -30,20 +33,46 @@ from grimoirelab_toolkit.datetime import (str_to_datetime,
                                           unixtime_to_datetime,
                                           InvalidDateError)
 
-from grimoire_elk.errors import ELKError, ElasticError
-from grimoire_elk.enriched.utils import (grimoire_con,
+from grimoire_elk.codec import loads_response
+from grimoire_elk.elastic_bulk import BulkResult, BulkWriter, MAX_BULK_BYTES
+from grimoire_elk.errors import ElasticError
+from grimoire_elk.enriched.utils import (get_session,
                                          get_diff_current_date,
                                          anonymize_url)
 
 logger = logging.getLogger(__name__)
 
 HEADER_JSON = {"Content-Type": "application/json"}
+HEADER_NDJSON = {"Content-Type": "application/x-ndjson"}
+
+TRANSIENT_STATUS = [429, 503]  # items rejected by the cluster which can be retried
+MAX_BULK_RETRY_WAIT = 60
+
+REFRESH_TRUE = 'true'
+REFRESH_WAIT_FOR = 'wait_for'
+REFRESH_NONE = 'none'
+REFRESH_POLICIES = [REFRESH_TRUE, REFRESH_WAIT_FOR, REFRESH_NONE]
+
+BULK_LOAD_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0
+}
 
 
 class ElasticSearch(object):
 
     max_items_bulk = 1000
+    max_bytes_bulk = MAX_BULK_BYTES  # max size of the bulk requests
+    bulk_queue_size = 2  # bulks sent in background (0 = send them in the caller thread)
     max_items_clause = 1000  # max items in search clause (refresh identities)
+    refresh_policy = REFRESH_TRUE  # refresh done after each bulk (true, wait_for or none)
+    max_bulk_retries = 5  # times the items rejected in a bulk are sent again
+    skip_index_setup = False  # don't update the settings, mappings and aliases of existing indexes
+    metadata_ttl = 300  # seconds the setup of the instances and indexes is cached
+    metadata_lock = threading.Lock()
+    instances_cache = {}
+    metadata_cache = {}
+    bulk_retry_wait = 1  # seconds to wait before the first retry of the rejected items
 
     def __init__(self, url, index, mappings=None, clean=False,
                  insecure=True, analyzers=None, aliases=None):
@@ -59,7 +88,7 @@ class ElasticSearch(object):
         :param aliases: list of aliases, defined as strings, to be added to the index
         """
         # Get major version of Elasticsearch instance
-        major, distribution = self.check_instance(url, insecure)
+        major, distribution = self.get_instance(url, insecure)
         self.major = major
         self.distribution = distribution
         logger.debug("Found version of {} instance at {}: {}.".format(
@@ -74,20 +103,29 @@ class ElasticSearch(object):
         self.index_url = self.url + "/" + self.index
         self.wait_bulk_seconds = 2  # time to wait to complete a bulk operation
 
-        self.requests = grimoire_con(insecure)
+        self.requests = get_session(url, insecure)
 
         analyzer_settings = None
+        map_dict = None
 
         if analyzers:
             analyzers_dict = analyzers.get_elastic_analyzers(es_major=self.major)
             analyzer_settings = analyzers_dict['items']
+        if mappings:
+            map_dict = mappings.get_elastic_mappings(es_major=self.major)
+
+        metadata_key = self.get_metadata_key(analyzer_settings, map_dict, aliases)
+        if clean:
+            self.__clear_index_metadata()
+        elif not self.__index_setup_needed(metadata_key):
+            logger.debug("Index {} already set up".format(anonymize_url(self.index_url)))
+            return
 
         self.create_index(analyzer_settings, clean)
 
         if analyzers:
             self.update_analyzers(analyzer_settings)
         if mappings:
-            map_dict = mappings.get_elastic_mappings(es_major=self.major)
             self.create_mappings(map_dict)
 
         if aliases:
@@ -99,6 +137,92 @@ class ElasticSearch(object):
 
                 self.add_alias(alias)
 
+        with self.metadata_lock:
+            self.metadata_cache[metadata_key] = time.time()
+
+    @classmethod
+    def get_instance(cls, url, insecure):
+        """Get the major version and the distribution of the instance in url.
+        The result is cached during `metadata_ttl` seconds.
+
+        :param url: url of the instance
+        :param insecure: don't verify ssl connection (boolean)
+
+        :returns: major version, as str and the distribution name
+        """
+        key = (url, insecure)
+
+        with cls.metadata_lock:
+            cached = cls.instances_cache.get(key)
+        if cached and time.time() - cached[0] < cls.metadata_ttl:
+            return cached[1]
+
+        instance = cls.check_instance(url, insecure)
+
+        with cls.metadata_lock:
+            cls.instances_cache[key] = (time.time(), instance)
+
+        return instance
+
+    @classmethod
+    def clear_metadata_cache(cls):
+        """Remove the instances and indexes metadata cached"""
+
+        with cls.metadata_lock:
+            cls.instances_cache.clear()
+            cls.metadata_cache.clear()
+
+    def get_metadata_key(self, analyzers=None, mappings=None, aliases=None):
+        """Get the key which identifies the setup of the index in the metadata cache.
+
+        :param analyzers: analyzers settings of the index
+        :param mappings: dict with the mappings of the index
+        :param aliases: list of aliases of the index
+
+        :returns: tuple with the url, the index and the hashes of
+            the analyzers, mappings and aliases
+        """
+        def digest(value):
+            data = json.dumps(value, sort_keys=True).encode('utf-8')
+            return hashlib.sha1(data).hexdigest()
+
+        return (self.url, self.index, digest(analyzers), digest(mappings), digest(sorted(aliases or [])))
+
+    def __index_setup_needed(self, metadata_key):
+        """Check whether the index has to be set up, because it doesn't
+        exist or it wasn't set up recently with the same metadata. When
+        `skip_index_setup` is set, only the existence of the index is
+        checked."""
+
+        with self.metadata_lock:
+            cached = self.metadata_cache.get(metadata_key)
+        cached = cached and time.time() - cached < self.metadata_ttl
+
+        if not cached and not self.skip_index_setup:
+            return True
+
+        # The index could have been deleted by other process
+        if not self.index_exists():
+            return True
+
+        if not cached:
+            logger.debug("Skipping setup of index {}".format(anonymize_url(self.index_url)))
+            with self.metadata_lock:
+                self.metadata_cache[metadata_key] = time.time()
+
+        return False
+
+    def __clear_index_metadata(self):
+        with self.metadata_lock:
+            for key in [key for key in self.metadata_cache if key[:2] == (self.url, self.index)]:
+                del self.metadata_cache[key]
+
+    def index_exists(self):
+        """Check whether the index exists"""
+
+        res = self.requests.head(self.index_url)
+        return res.status_code == 200
+
     @classmethod
     def safe_index(cls, unique_id):
         """Return a valid elastic index generated from unique_id
@@ -124,7 +248,7 @@ class ElasticSearch(object):
 
         :returns:        major version, as str and the distribution name.
         """
-        res = grimoire_con(insecure).get(url)
+        res = get_session(url, insecure).get(url)
         if res.status_code != 200:
             msg = "Got {} from url {}".format(res.status_code, url)
             logger.error(msg)
@@ -172,45 +296,92 @@ class ElasticSearch(object):
                 logger.info("Deleted and created index {}".format(anonymize_url(self.index_url)))
 
     def safe_put_bulk(self, url, bulk_json):
-        """Bulk items to a target index `url`. In case of UnicodeEncodeError,
-        the bulk is encoded with iso-8859-1.
+        """Bulk items to a target index `url`. The bulk is sent encoded
+        with UTF-8; in case of UnicodeEncodeError, the characters which
+        can't be encoded are removed.
 
         :param url: target index where to bulk the items
         :param bulk_json: str representation of the items to upload
+
+        :returns: number of items inserted
+        """
+        return self.put_bulk(url, bulk_json).inserted
+
+    def put_bulk(self, url, bulk_json):
+        """Bulk items to a target index `url` retrying the rejected ones.
+
+        The items rejected with a transient error (429 or 503 status) are
+        sent again, with an exponential backoff, up to `max_bulk_retries`
+        times. The rest of errors are considered permanent and the items
+        are not sent again. The errors are logged grouped by type.
+
+        :param url: target index where to bulk the items
+        :param bulk_json: str representation of the items to upload; each
+            item must be defined by an action and a document lines
+
+        :returns: a BulkResult with the number of items inserted and failed
         """
-        headers = {"Content-Type": "application/x-ndjson"}
+        if self.refresh_policy != REFRESH_NONE:
+            url += '?refresh=' + self.refresh_policy
 
         try:
-            res = self.requests.put(url + '?refresh=true', data=bulk_json, headers=headers)
-            res.raise_for_status()
+            if isinstance(bulk_json, str):
+                bulk_json = bulk_json.encode('utf-8')
         except UnicodeEncodeError:
-            # Related to body.encode('iso-8859-1'). mbox data
-            logger.warning("Encondig error ... converting bulk to iso-8859-1")
-            bulk_json = bulk_json.encode('iso-8859-1', 'ignore')
-            res = self.requests.put(url, data=bulk_json, headers=headers)
+            # Lone surrogates can't be encoded in UTF-8. mbox data
+            logger.warning("Encondig error ... removing invalid characters from bulk")
+            bulk_json = bulk_json.encode('utf-8', 'ignore')
+
+        bulk_result = BulkResult()
+        retries = 0
+
+        while True:
+            res = self.requests.put(url, data=bulk_json, headers=HEADER_NDJSON)
             res.raise_for_status()
+            result = loads_response(res)
+
+            lines = None
+            retry_lines = []
+            for i, item in enumerate(result['items']):
+                status = next(iter(item.values()))
+                if 'error' not in status:
+                    bulk_result.inserted += 1
+                    continue
 
-        result = res.json()
-        failed_items = []
-        error = ""
-        if result['errors']:
-            # Due to multiple errors that may be thrown when inserting bulk data, only the first error is returned
-            failed_items = [item['index'] for item in result['items'] if 'error' in item['index']]
-            error = str(failed_items[0]['error'])
+                error = status['error']
+                error_type = error.get('type') if isinstance(error, dict) else str(error)
 
-            logger.error("Failed to insert data to ES: {}, {}".format(error, anonymize_url(url)))
+                if status.get('status') in TRANSIENT_STATUS:
+                    bulk_result.rejected += 1
+                    if retries < self.max_bulk_retries:
+                        lines = lines or bulk_json.split(b'\n')
+                        retry_lines.extend(lines[2 * i:2 * i + 2])
+                        continue
+                    bulk_result.transient += 1
+                else:
+                    bulk_result.permanent += 1
 
-        inserted_items = len(result['items']) - len(failed_items)
+                bulk_result.add_error(error_type, error)
 
-        # The exception is currently not thrown to avoid stopping ocean uploading processes
-        try:
-            if failed_items:
-                raise ELKError(cause=error)
-        except ELKError:
-            pass
+            if not retry_lines:
+                break
+
+            retries += 1
+            wait = min(self.bulk_retry_wait * 2 ** (retries - 1), MAX_BULK_RETRY_WAIT)
+            logger.warning("{} items rejected by {}, retrying them in {} seconds ({}/{})".format(
+                           len(retry_lines) // 2, anonymize_url(url), wait, retries, self.max_bulk_retries))
+            time.sleep(wait)
 
-        logger.debug("{} items uploaded to ES ({})".format(inserted_items, anonymize_url(url)))
-        return inserted_items
+            bulk_json = b'\n'.join(retry_lines) + b'\n'
+
+        if bulk_result.failed:
+            errors = ["{} ({} items): {}".format(error_type, count, sample)
+                      for error_type, (count, sample) in bulk_result.errors.items()]
+            logger.error("Failed to insert data to ES: {} transient, {} permanent errors, {}. {}".format(
+                         bulk_result.transient, bulk_result.permanent, anonymize_url(url), "; ".join(errors)))
+
+        logger.debug("{} items uploaded to ES ({})".format(bulk_result.inserted, anonymize_url(url)))
+        return bulk_result
 
     def all_es_aliases(self):
         """List all aliases used in ES"""
@@ -317,45 +488,174 @@ class ElasticSearch(object):
 
         return mapping_url
 
+    def get_bulk_writer(self, url=None, on_sent=None):
+        """Get a writer to upload documents to the index using the bulk API.
+        The size of the bulks and the number of bulks sent in background are
+        set by `max_items_bulk`, `max_bytes_bulk` and `bulk_queue_size`.
+
+        :param url: bulk URL endpoint; by default the one of the index
+        :param on_sent: function called with the mark of each bulk once it is sent
+        """
+        url = url or self.get_bulk_url()
+        writer = BulkWriter(functools.partial(self.put_bulk, url),
+                            max_items=self.max_items_bulk,
+                            max_bytes=self.max_bytes_bulk,
+                            queue_size=self.bulk_queue_size,
+                            description=anonymize_url(url),
+                            adaptive=True,
+                            on_sent=on_sent)
+        return writer
+
     def bulk_upload(self, items, field_id):
         """Upload in controlled packs items to ES using bulk API
 
         :param items: list of items to be uploaded
         :param field_id: unique ID attribute used to differentiate the items
+
+        :returns: number of items inserted
         """
-        current = 0
-        new_items = 0  # total items added with bulk
-        bulk_json = ""
+        return self.bulk_upload_result(items, field_id).inserted
+
+    def bulk_upload_result(self, items, field_id):
+        """Upload in controlled packs items to ES using bulk API
+
+        :param items: list of items to be uploaded
+        :param field_id: unique ID attribute used to differentiate the items
 
+        :returns: a BulkResult with the number of items inserted and failed
+        """
         if not items:
-            return new_items
+            return BulkResult()
 
         url = self.get_bulk_url()
 
         logger.debug("Adding items to {} (in {} packs)".format(anonymize_url(url), self.max_items_bulk))
-        task_init = time()
-
-        for item in items:
-            if current >= self.max_items_bulk:
-                task_init = time()
-                new_items += self.safe_put_bulk(url, bulk_json)
-                current = 0
-                json_size = sys.getsizeof(bulk_json) / (1024 * 1024)
-                logger.debug("bulk packet sent ({:.2f} sec, {} total, {:.2f} MB)".format(
-                             time() - task_init, new_items, json_size))
-                bulk_json = ""
-            data_json = json.dumps(item)
-            bulk_json += '{{"index" : {{"_id" : "{}" }} }}\n'.format(item[field_id])
-            bulk_json += data_json + "\n"  # Bulk document
-            current += 1
-
-        if current > 0:
-            new_items += self.safe_put_bulk(url, bulk_json)
-            json_size = sys.getsizeof(bulk_json) / (1024 * 1024)
-            logger.debug("bulk packet sent ({:.2f} sec prev, {} total, {:.2f} MB)".format(
-                         time() - task_init, new_items, json_size))
-
-        return new_items
+
+        with self.get_bulk_writer(url) as writer:
+            for item in items:
+                writer.add(item[field_id], item)
+
+        return writer.result
+
+    def get_documents(self, ids, fields=None):
+        """Get several documents of the index at once with the multi get API.
+
+        :param ids: list of ids of the documents
+        :param fields: list of fields of the documents to get; all of them by default
+
+        :returns: dict with the source of the documents found by id
+        """
+        documents = {}
+
+        if not self.is_legacy():
+            mget_url = self.index_url + '/_mget'
+        else:
+            mget_url = self.index_url + '/items/_mget'
+
+        headers = {"Content-Type": "application/json"}
+
+        for i in range(0, len(ids), self.max_items_clause):
+            docs = [{"_id": _id} for _id in ids[i:i + self.max_items_clause]]
+            if fields is not None:
+                for doc in docs:
+                    doc['_source'] = fields
+
+            res = self.requests.post(mget_url, data=json.dumps({"docs": docs}), headers=headers)
+            res.raise_for_status()
+
+            for doc in loads_response(res)['docs']:
+                if doc.get('found'):
+                    documents[doc['_id']] = doc.get('_source', {})
+
+        return documents
+
+    def count_documents(self, filters_=None):
+        """Count the documents of the index with the count API.
+
+        :param filters_: list of filters, with the name of a field and its value
+
+        :returns: number of documents
+        """
+        terms = [{"term": {filter_['name']: filter_['value']}} for filter_ in filters_ or [] if filter_]
+        query = {"query": {"bool": {"filter": terms}}}
+
+        headers = {"Content-Type": "application/json"}
+        res = self.requests.post(self.index_url + '/_count', data=json.dumps(query), headers=headers)
+        res.raise_for_status()
+
+        return res.json()['count']
+
+    def refresh_index(self):
+        """Refresh the index to make visible the documents uploaded
+        since the last refresh."""
+
+        res = self.requests.post(self.index_url + "/_refresh")
+        try:
+            res.raise_for_status()
+        except requests.exceptions.HTTPError:
+            logger.error("Error refreshing the index {}: {}".format(anonymize_url(self.index_url), res.text))
+
+    def refresh_pending(self):
+        """Refresh the index when the bulks are uploaded without refreshing it"""
+
+        if self.refresh_policy == REFRESH_NONE:
+            self.refresh_index()
+
+    def get_index_settings(self, settings):
+        """Get the current value of some settings of the index.
+
+        :param settings: list of index settings (i.e. `refresh_interval`)
+
+        :returns: a dict with the value of each setting; None when
+            the setting is not explicitly defined in the index
+        """
+        res = self.requests.get(self.index_url + "/_settings", params={"flat_settings": "true"})
+        res.raise_for_status()
+
+        index_settings = res.json()[self.index]['settings']
+
+        return {setting: index_settings.get('index.' + setting) for setting in settings}
+
+    def update_index_settings(self, settings):
+        """Update some dynamic settings of the index.
+
+        :param settings: dict with the new value of the settings; None
+            resets the setting to its default value
+        """
+        url_set = "{}/_settings".format(self.index_url)
+        res = self.requests.put(url_set, data=json.dumps({"index": settings}), headers=HEADER_JSON)
+        res.raise_for_status()
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """Context to load many documents in the index.
+
+        While the context is active, the refresh of the index is disabled and
+        the replicas are removed. When the context ends, even due to an error,
+        the original settings are restored and the index is refreshed.
+
+        When the index is found with the refresh disabled, it is assumed that
+        a previous bulk load was interrupted, so the default refresh interval
+        is restored at the end.
+        """
+        original = self.get_index_settings(list(BULK_LOAD_SETTINGS.keys()))
+        if original['refresh_interval'] == BULK_LOAD_SETTINGS['refresh_interval']:
+            original['refresh_interval'] = None
+
+        logger.info("Bulk load mode enabled on {}".format(anonymize_url(self.index_url)))
+        self.update_index_settings(BULK_LOAD_SETTINGS)
+
+        try:
+            yield self
+        finally:
+            try:
+                self.update_index_settings(original)
+                logger.info("Bulk load mode disabled on {}, settings restored: {}".format(
+                            anonymize_url(self.index_url), original))
+            except Exception as e:
+                logger.error("Error restoring the settings {} on {}: {}".format(
+                             original, anonymize_url(self.index_url), e))
+            self.refresh_index()
 
     def update_analyzers(self, analyzers):
         """Update the settings with the analyzer for a given index.
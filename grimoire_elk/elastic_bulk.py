@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Writer of documents using the bulk API"""
+
+import logging
+import queue
+import threading
+from time import time
+
+from .codec import dumps
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_ITEMS = 1000
+MAX_BULK_BYTES = 10 * 1024 * 1024  # 10 MB
+MIN_BULK_ITEMS = 10  # min number of documents per bulk when it is adapted
+BULK_ACTION = '{"index" : {"_id" : "%s" } }\n'
+
+
+class BulkResult:
+    """Result of uploading documents with the bulk API.
+
+    The failed documents are classified as transient, when they were
+    rejected by a temporary condition of the cluster (i.e. 429 Too Many
+    Requests) and they couldn't be uploaded after retrying them, or
+    as permanent, when they will fail again (i.e. mapping errors).
+
+    :param inserted: number of documents inserted
+    :param transient: number of documents not inserted due to transient errors
+    :param permanent: number of documents not inserted due to permanent errors
+    :param rejected: number of times a document was rejected with a transient error
+    """
+    def __init__(self, inserted=0, transient=0, permanent=0, rejected=0):
+        self.inserted = inserted
+        self.transient = transient
+        self.permanent = permanent
+        self.rejected = rejected
+        self.errors = {}
+
+    @property
+    def failed(self):
+        return self.transient + self.permanent
+
+    def add_error(self, error_type, error):
+        """Count an error, keeping the first one of each type as sample"""
+
+        count, sample = self.errors.get(error_type, (0, error))
+        self.errors[error_type] = (count + 1, sample)
+
+    def update(self, result):
+        """Add the counters of another result to this one"""
+
+        self.inserted += result.inserted
+        self.transient += result.transient
+        self.permanent += result.permanent
+        self.rejected += result.rejected
+        for error_type, (count, sample) in result.errors.items():
+            current, sample = self.errors.get(error_type, (0, sample))
+            self.errors[error_type] = (current + count, sample)
+
+    def __repr__(self):
+        return "BulkResult(inserted={}, transient={}, permanent={}, rejected={})".format(
+               self.inserted, self.transient, self.permanent, self.rejected)
+
+
+class BulkWriter:
+    """Group documents in bulk requests and send them using the function `send`.
+
+    A bulk is sent when it reaches `max_items` documents or when adding a new
+    document would exceed `max_bytes`. The body of the bulk is built joining
+    the actions and documents only when it is sent.
+
+    When `queue_size` is greater than 0, the bulks are sent by a background
+    thread. Up to `queue_size` bulks can be pending to be sent; once the
+    queue is full, adding new documents blocks until a bulk is sent. Errors
+    raised by the background thread are raised again by the writer.
+
+    When `adaptive` is set, the number of documents per bulk is halved
+    every time documents are rejected with a transient error, and it
+    grows again, up to `max_items`, with the bulks without rejections.
+
+    A mark (i.e. the position of the last item processed) can be attached to
+    the documents added. Once the bulk with those documents is sent, the
+    function `on_sent` is called with the mark of the bulk, so the progress
+    can be saved knowing the documents are already stored.
+
+    The writer must be closed to send the pending documents and to get the
+    total number of documents inserted.
+
+    :param send: function which receives the body of a bulk and returns
+        a `BulkResult` or the number of documents inserted
+    :param max_items: max number of documents per bulk
+    :param max_bytes: max size of the body of a bulk
+    :param queue_size: max number of bulks pending to be sent in background;
+        0 sends the bulks in the calling thread
+    :param description: text to identify the writer in the logs
+    :param adaptive: adapt the number of documents per bulk to the rejections
+    :param on_sent: function called with the mark of each bulk once it is sent
+    """
+    def __init__(self, send, max_items=MAX_BULK_ITEMS, max_bytes=MAX_BULK_BYTES,
+                 queue_size=0, description=None, adaptive=False, on_sent=None):
+        self.send = send
+        self.on_sent = on_sent
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.description = description
+        self.adaptive = adaptive
+
+        self.bulk_items = max_items
+        self.result = BulkResult()
+        self.total = 0
+        self.bulks = 0
+        self.send_time = 0.0  # seconds sending the bulks
+        self.wait_time = 0.0  # seconds waiting for the background thread
+
+        self._parts = []
+        self._current = 0
+        self._size = 0
+        self._mark = None
+        self._error = None
+
+        self._queue = None
+        self._thread = None
+        if queue_size > 0:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self.__upload_worker, daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.__stop()
+        else:
+            self.close()
+
+    def add(self, _id, item):
+        """Add a document to the writer.
+
+        :param _id: id of the document
+        :param item: document to add
+        """
+        self.add_json(_id, dumps(item))
+
+    def mark(self, value):
+        """Attach a mark to the documents added until now which
+        are not sent yet.
+
+        :param value: mark passed to `on_sent` once they are sent
+        """
+        self._mark = value
+
+    def add_json(self, _id, data_json):
+        """Add a document already serialized to the writer.
+
+        :param _id: id of the document
+        :param data_json: JSON representation of the document
+        """
+        action = BULK_ACTION % _id
+        size = len(action) + 1
+        size += len(data_json) if data_json.isascii() else len(data_json.encode('utf-8'))
+
+        if self._current and (self._current >= self.bulk_items or self._size + size > self.max_bytes):
+            self.flush()
+
+        self._parts.append(action)
+        self._parts.append(data_json)
+        self._parts.append('\n')
+        self._current += 1
+        self._size += size
+
+    def flush(self):
+        """Send the documents added since the last bulk"""
+
+        self.__check_error()
+
+        if not self._current:
+            return
+
+        body = ''.join(self._parts)
+        mark = self._mark
+
+        self._parts = []
+        self._current = 0
+        self._size = 0
+        self._mark = None
+
+        if self._queue is not None:
+            task_init = time()
+            self._queue.put((body, mark))
+            self.wait_time += time() - task_init
+        else:
+            self.__upload(body, mark)
+
+    def close(self):
+        """Send the pending documents and wait until all the bulks are sent.
+
+        :returns: total number of documents inserted
+        """
+        try:
+            self.flush()
+        finally:
+            self.__stop()
+
+        self.__check_error()
+
+        return self.total
+
+    def __stop(self):
+        if not self._thread:
+            return
+
+        task_init = time()
+        self._queue.put(None)
+        self._thread.join()
+        self.wait_time += time() - task_init
+        self._thread = None
+        self._queue = None
+
+    def __check_error(self):
+        if self._error:
+            error, self._error = self._error, None
+            self.__stop()
+            raise error
+
+    def __upload(self, body, mark=None):
+        task_init = time()
+
+        result = self.send(body)
+        if not isinstance(result, BulkResult):
+            result = BulkResult(inserted=result)
+
+        self.result.update(result)
+        self.total += result.inserted
+        self.bulks += 1
+        self.send_time += time() - task_init
+
+        if self.adaptive:
+            self.__adapt(result)
+
+        if self.on_sent:
+            self.on_sent(mark)
+
+        logger.debug("{}bulk packet sent ({:.2f} sec, {} total, {:.2f} MB)".format(
+                     "[{}] ".format(self.description) if self.description else "",
+                     time() - task_init, self.total, len(body) / (1024 * 1024)))
+
+    def __adapt(self, result):
+        if result.rejected:
+            bulk_items = min(self.bulk_items, max(MIN_BULK_ITEMS, self.bulk_items // 2))
+        else:
+            bulk_items = min(self.max_items, self.bulk_items + max(1, self.max_items // 10))
+
+        if bulk_items != self.bulk_items:
+            logger.debug("{}bulk size changed from {} to {} items".format(
+                         "[{}] ".format(self.description) if self.description else "",
+                         self.bulk_items, bulk_items))
+            self.bulk_items = bulk_items
+
+    def __upload_worker(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            # Once an error happens, the remaining bulks are discarded
+            if self._error:
+                continue
+            try:
+                self.__upload(*task)
+            except Exception as e:
+                self._error = e
@@ -22,17 +22,35 @@
 """Generates items from ElasticSearch based on filters """
 
 
+import heapq
 import json
 import logging
+import queue
 import re
+import threading
 import time
 
 from .enriched.utils import get_repository_filter, get_confluence_spaces_filter, grimoire_con, anonymize_url
+from .codec import dumps, loads_response
 from .elastic_mapping import Mapping
 
 HEADER_JSON = {"Content-Type": "application/json"}
 MAX_BULK_UPDATE_SIZE = 1000
 
+# Pages buffered per slice when fetching with a sliced scroll
+SLICE_QUEUE_SIZE = 2
+SLICE_END = object()
+
+# Pagination modes to read the items from an index
+PAGINATION_SCROLL = 'scroll'
+PAGINATION_PIT = 'pit'
+PIT_KEEP_ALIVE = "10m"
+PIT_MIN_MAJOR_ELASTICSEARCH = 7  # point in time readers are available since 7.10
+PIT_MIN_MAJOR_OPENSEARCH = 2  # point in time readers are available since 2.4
+PIT_UNSUPPORTED_STATUS = (400, 405)
+# Wait between attempts to acquire a scroll (seconds)
+SCROLL_WAIT_MAX_SLEEP = 30
+
 FILTER_DATA_ATTR = 'data.'
 FILTER_SEPARATOR = r",\s*%s" % FILTER_DATA_ATTR
 PROJECTS_JSON_LABELS_PATTERN = r".*(--labels=\[(.*)\]).*"
@@ -41,6 +59,30 @@ PROJECTS_JSON_SPACES_PATTERN = r".*(--spaces=\[(.*)\]).*"
 logger = logging.getLogger(__name__)
 
 
+def include_source_field(_source, field):
+    """Add a field to the fields included by a source filtering.
+
+    :param _source: source filtering; a list of fields to include or a dict
+        with the lists of fields to include and exclude
+    :param field: field to include
+
+    :returns: the source filtering including the field
+    """
+    if not _source:
+        return _source
+
+    if isinstance(_source, dict):
+        includes = _source.get('includes')
+        if not includes or field in includes:
+            return _source
+        _source = dict(_source)
+        _source['includes'] = list(includes) + [field]
+    elif field not in _source:
+        _source = list(_source) + [field]
+
+    return _source
+
+
 class ElasticItems:
 
     mapping = Mapping
@@ -49,6 +91,12 @@ class ElasticItems:
     # Change it from p2o command line or mordred config
     scroll_size = 100
     scroll_wait = 900
+    # Number of slices used to read an index in parallel (1 = no slicing)
+    scroll_slices = 1
+    # Read the indexes using scrolls or point in time readers with search_after
+    pagination = PAGINATION_SCROLL
+    # URLs of clusters that don't support point in time readers
+    pit_unsupported = set()
 
     def __init__(self, perceval_backend, from_date=None, insecure=True, offset=None, to_date=None):
         """Class to perform operations over the items stored in a ES index.
@@ -66,10 +114,13 @@ class ElasticItems:
         self.offset = offset  # fetch from offset
         self.filter_raw = None  # to filter raw items from Ocean
         self.filter_raw_dict = []
+        self.search_after = None  # sort values to start fetching after them
+        self.cursor = None  # sort values of the last item fetched
         self.projects_json_repo = None
         self.repo_labels = None
         self.repo_spaces = None
 
+        self.insecure = insecure
         self.requests = grimoire_con(insecure)
         self.elastic = None
         self.elastic_url = None
@@ -197,43 +248,104 @@ class ElasticItems:
         """
         self.from_date = last_enrich_date
 
-    def free_scroll(self, scroll_id=None):
+    def set_search_after(self, search_after):
+        """Set the sort values used to resume the next fetch when
+        point in time readers are used. They are the values of `cursor`
+        after fetching the last item processed. The next fetch opens
+        another point in time, so it reads the items from the date of
+        the cursor, including the ones with that date already read.
+
+        :param search_after: list of sort values
+        """
+        self.search_after = search_after
+
+    def free_scroll(self, scroll_id=None, session=None):
         """ Free scroll after use"""
         if not scroll_id:
             return
 
+        session = session or self.requests
+
         logger.debug("Releasing scroll_id={}".format(scroll_id))
         url = self.elastic.url + "/_search/scroll"
         headers = {"Content-Type": "application/json"}
         scroll_data = {"scroll_id": scroll_id}
         query_data = json.dumps(scroll_data)
         try:
-            res = self.requests.delete(url, data=query_data, headers=headers)
+            res = session.delete(url, data=query_data, headers=headers)
             res.raise_for_status()
         except Exception:
             logger.debug("Error releasing scroll: {}/{}".format(anonymize_url(url), scroll_id))
             logger.debug("Error releasing scroll: {}".format(res.json()))
 
     # Items generator
-    def fetch(self, _filter=None, ignore_incremental=False):
+    def fetch(self, _filter=None, ignore_incremental=False, ordered=True, _source=None):
         """Fetch the items from raw or enriched index. An optional _filter can be
-        provided to filter the data collected
+        provided to filter the data collected.
+
+        When `scroll_slices` is greater than 1, the index is read using a sliced
+        scroll where each slice is consumed by its own worker thread.
 
         :param _filter: optional filter of data collected
         :param ignore_incremental: if True, incremental collection is ignored
+        :param ordered: if True, items are returned sorted by the incremental
+            date field (ascending), otherwise they are returned as soon as
+            they are received
+        :param _source: optional source filtering of the items; a list of fields
+            to include or a dict with the lists of fields to include and exclude
+            (e.g., {"includes": ["data.commit"], "excludes": ["data.files"]})
         """
-
         logger.debug("Creating a elastic items generator.")
 
+        if not self.elastic:
+            return
+
+        self.cursor = None
+        search_after, self.search_after = self.search_after, None
+
+        if self.pagination == PAGINATION_PIT:
+            pit_id = self.open_point_in_time()
+            if pit_id:
+                yield from self.__fetch_pit(pit_id, _filter=_filter, ignore_incremental=ignore_incremental,
+                                            search_after=search_after, _source=_source)
+                return
+
+        if self.scroll_slices > 1:
+            yield from self.__fetch_sliced(_filter=_filter, ignore_incremental=ignore_incremental,
+                                           ordered=ordered, _source=_source)
+            return
+
+        for page in self.__fetch_pages(_filter=_filter, ignore_incremental=ignore_incremental,
+                                       ordered=ordered, _source=_source):
+            yield from page
+
+    def __fetch_pages(self, _filter=None, ignore_incremental=False, ordered=True, _slice=None, session=None,
+                      _source=None):
+        """Generator of pages of items (i.e., `_source` of the hits) retrieved
+        with a scroll. If `_slice` is set, only the given slice of the scroll
+        is retrieved.
+
+        :param _filter: optional filter of data collected
+        :param ignore_incremental: if True, incremental collection is ignored
+        :param ordered: if True, sort the items by the incremental date field
+        :param _slice: tuple (slice id, max slices) of the sliced scroll
+        :param session: requests session used to retrieve the pages
+        :param _source: optional source filtering of the items
+        """
         scroll_id = None
-        page = self.get_elastic_items(scroll_id, _filter=_filter, ignore_incremental=ignore_incremental)
+        page = self.get_elastic_items(scroll_id, _filter=_filter, ignore_incremental=ignore_incremental,
+                                      ordered=ordered, _slice=_slice, session=session, _source=_source)
         if page and 'too_many_scrolls' in page:
             sec = self.scroll_wait
+            sleep = 1
             while sec > 0:
                 logger.debug("Too many scrolls open, waiting up to {} seconds".format(sec))
-                time.sleep(1)
-                sec -= 1
-                page = self.get_elastic_items(scroll_id, _filter=_filter, ignore_incremental=ignore_incremental)
+                sleep = min(sleep, sec)
+                time.sleep(sleep)
+                sec -= sleep
+                sleep = min(sleep * 2, SCROLL_WAIT_MAX_SLEEP)
+                page = self.get_elastic_items(scroll_id, _filter=_filter, ignore_incremental=ignore_incremental,
+                                              ordered=ordered, _slice=_slice, session=session, _source=_source)
                 if not page:
                     logger.debug("Waiting for scroll terminated")
                     break
@@ -242,7 +354,7 @@ class ElasticItems:
                     break
 
         if not page:
-            return []
+            return
 
         scroll_id = page["_scroll_id"]
         total = page['hits']['total']
@@ -251,36 +363,287 @@ class ElasticItems:
         if scroll_size == 0:
             logger.debug("No results found from {} and filter {}".format(
                          anonymize_url(self.elastic.index_url), _filter))
-            self.free_scroll(scroll_id)
+            self.free_scroll(scroll_id, session=session)
             return
 
-        while scroll_size > 0:
+        try:
+            while scroll_size > 0:
 
-            logger.debug("Fetching from {}: {} received".format(
-                         anonymize_url(self.elastic.index_url), len(page['hits']['hits'])))
-            for item in page['hits']['hits']:
-                eitem = item['_source']
-                yield eitem
+                logger.debug("Fetching from {}: {} received".format(
+                             anonymize_url(self.elastic.index_url), len(page['hits']['hits'])))
+                yield [item['_source'] for item in page['hits']['hits']]
 
-            page = self.get_elastic_items(scroll_id, _filter=_filter, ignore_incremental=ignore_incremental)
+                page = self.get_elastic_items(scroll_id, _filter=_filter, ignore_incremental=ignore_incremental,
+                                              session=session)
 
-            if not page:
-                break
+                if not page:
+                    break
 
-            scroll_size = len(page['hits']['hits'])
+                scroll_size = len(page['hits']['hits'])
+        finally:
+            self.free_scroll(scroll_id, session=session)
 
-        self.free_scroll(scroll_id)
         logger.debug("Fetching from {}: done receiving".format(anonymize_url(self.elastic.index_url)))
 
-    def get_elastic_items(self, elastic_scroll_id=None, _filter=None, ignore_incremental=False):
+    def __fetch_sliced(self, _filter=None, ignore_incremental=False, ordered=True, _source=None):
+        """Fetch the items using a sliced scroll. Every slice is read by a
+        worker thread which puts the pages in a bounded queue.
+
+        When `ordered` is set, each slice is sorted by the incremental date
+        field and the slices are merged keeping that order; otherwise, items
+        are returned as soon as any of the slices receives them.
+
+        :param _filter: optional filter of data collected
+        :param ignore_incremental: if True, incremental collection is ignored
+        :param ordered: if True, items are returned sorted by the incremental date field
+        :param _source: optional source filtering of the items
+        """
+        n_slices = self.scroll_slices
+        order_field = self.get_incremental_date() if self.perceval_backend else None
+        ordered = ordered and order_field is not None
+
+        # The slices are merged using the incremental date field
+        if ordered:
+            _source = include_source_field(_source, order_field)
+
+        n_queues = n_slices if ordered else 1
+        queues = [queue.Queue(maxsize=SLICE_QUEUE_SIZE * (1 if ordered else n_slices)) for _ in range(n_queues)]
+        stop = threading.Event()
+
+        def put(out_queue, value):
+            while not stop.is_set():
+                try:
+                    out_queue.put(value, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(slice_id, out_queue):
+            session = grimoire_con(self.insecure)
+            try:
+                pages = self.__fetch_pages(_filter=_filter, ignore_incremental=ignore_incremental,
+                                           ordered=ordered, _slice=(slice_id, n_slices), session=session,
+                                           _source=_source)
+                for page in pages:
+                    if not put(out_queue, page):
+                        pages.close()
+                        break
+            except Exception as e:
+                put(out_queue, e)
+            finally:
+                put(out_queue, SLICE_END)
+                session.close()
+
+        logger.debug("Fetching from {} using {} slices".format(anonymize_url(self.elastic.index_url), n_slices))
+
+        workers = []
+        for slice_id in range(n_slices):
+            out_queue = queues[slice_id] if ordered else queues[0]
+            thread = threading.Thread(target=worker, args=(slice_id, out_queue), daemon=True)
+            thread.start()
+            workers.append(thread)
+
+        def read_queue(in_queue, n_producers):
+            ended = 0
+            while ended < n_producers:
+                page = in_queue.get()
+                if page is SLICE_END:
+                    ended += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+
+        try:
+            if ordered:
+                readers = [read_queue(q, 1) for q in queues]
+                yield from heapq.merge(*readers, key=lambda item: item.get(order_field) or '')
+            else:
+                yield from read_queue(queues[0], n_slices)
+        finally:
+            stop.set()
+            for thread in workers:
+                thread.join()
+
+    def __fetch_pit(self, pit_id, _filter=None, ignore_incremental=False, search_after=None, _source=None):
+        """Fetch the items using a point in time reader. Pages are retrieved
+        with `search_after`, sorting the items by the incremental date field
+        and the position of the documents in the point in time. The sort
+        values of the last item returned are available in `cursor`.
+
+        :param pit_id: id of the point in time reader
+        :param _filter: optional filter of data collected
+        :param ignore_incremental: if True, incremental collection is ignored
+        :param search_after: sort values to start fetching after them
+        :param _source: optional source filtering of the items
+        """
+        url = self.elastic.url + "/_search"
+
+        query = self.get_elastic_query(_filter=_filter, ignore_incremental=ignore_incremental,
+                                       ordered=False, _source=_source)
+        query['sort'] = self.get_search_after_sort()
+        query['size'] = self.scroll_size
+        query['pit'] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+
+        # The tiebreaker of the cursor belongs to another point in time,
+        # so the items are read again from the date of the cursor
+        if search_after:
+            date_range = {"gte": search_after[0], "format": "epoch_millis"}
+            query['query']['bool']['filter'].append({"range": {self.get_incremental_date(): date_range}})
+            search_after = None
+
+        logger.debug("Raw query to {}\n{}".format(anonymize_url(self.elastic.index_url),
+                     json.dumps(query, indent=4)))
+
+        try:
+            while True:
+                if search_after:
+                    query['search_after'] = search_after
+
+                # The index exists while the point in time is open, so the
+                # errors are raised instead of ending the items early
+                page = self.__search(url, query, raise_errors=True)
+
+                # The id of the point in time can change between searches
+                query['pit']['id'] = page.get('pit_id', query['pit']['id'])
+
+                hits = page['hits']['hits']
+                if not hits:
+                    break
+
+                logger.debug("Fetching from {}: {} received".format(
+                             anonymize_url(self.elastic.index_url), len(hits)))
+                for hit in hits:
+                    self.cursor = hit['sort']
+                    yield hit['_source']
+
+                search_after = self.cursor
+        finally:
+            self.close_point_in_time(query['pit']['id'])
+
+        logger.debug("Fetching from {}: done receiving".format(anonymize_url(self.elastic.index_url)))
+
+    def get_search_after_sort(self):
+        """Sort used to paginate the items of a point in time with
+        `search_after`. The tiebreaker of the incremental date field is
+        `_shard_doc`, the position of the documents in the point in time,
+        which is unique in any index, unlike fields such as `uuid`."""
+
+        sort = [
+            {self.get_incremental_date(): {"order": "asc", "unmapped_type": "date"}},
+            {"_shard_doc": "asc"}
+        ]
+        return sort
+
+    def __is_opensearch(self):
+        return getattr(self.elastic, 'distribution', None) == 'opensearch'
+
+    def open_point_in_time(self):
+        """Open a point in time reader over the index.
+
+        :returns: the id of the point in time, or None if it couldn't be
+            opened. In that case, the cluster is flagged to not support
+            point in time readers only when its version or its answer
+            (400 or 405) says so; other errors, like timeouts, fall back
+            to scroll only this time
+        """
+        if self.elastic.url in self.pit_unsupported:
+            return None
+
+        if self.__is_opensearch():
+            url = self.elastic.index_url + "/_search/point_in_time?keep_alive=" + PIT_KEEP_ALIVE
+            min_major = PIT_MIN_MAJOR_OPENSEARCH
+        else:
+            url = self.elastic.index_url + "/_pit?keep_alive=" + PIT_KEEP_ALIVE
+            min_major = PIT_MIN_MAJOR_ELASTICSEARCH
+
+        try:
+            unsupported = int(self.elastic.major) < min_major
+        except (AttributeError, TypeError, ValueError):
+            unsupported = False
+
+        pit_id = None
+        if not unsupported:
+            try:
+                res = self.requests.post(url)
+                if res.status_code == 404 and 'index_not_found_exception' in res.text:
+                    logger.debug("No results found from {}".format(anonymize_url(url)))
+                    return None
+                unsupported = res.status_code in PIT_UNSUPPORTED_STATUS
+                res.raise_for_status()
+                rjson = res.json()
+                pit_id = rjson.get('pit_id', rjson.get('id'))
+            except Exception as e:
+                logger.debug("Error opening point in time {}: {}".format(anonymize_url(url), e))
+
+        if unsupported:
+            logger.info("Point in time not supported by {}, using scroll".format(
+                        anonymize_url(self.elastic.url)))
+            self.pit_unsupported.add(self.elastic.url)
+        elif not pit_id:
+            logger.warning("Point in time can't be opened in {}, using scroll".format(
+                           anonymize_url(self.elastic.index_url)))
+
+        return pit_id
+
+    def close_point_in_time(self, pit_id):
+        """Release a point in time reader
+
+        :param pit_id: id of the point in time
+        """
+        if not pit_id:
+            return
+
+        logger.debug("Releasing point in time {}".format(pit_id))
+        if self.__is_opensearch():
+            url = self.elastic.url + "/_search/point_in_time"
+            pit_data = {"pit_id": [pit_id]}
+        else:
+            url = self.elastic.url + "/_pit"
+            pit_data = {"id": pit_id}
+
+        try:
+            res = self.requests.delete(url, data=json.dumps(pit_data), headers=HEADER_JSON)
+            res.raise_for_status()
+        except Exception as e:
+            logger.debug("Error releasing point in time {}: {}".format(anonymize_url(url), e))
+
+    def __search(self, url, query, session=None, raise_errors=False):
+        """Run a search and return its result, or None if it failed
+        and `raise_errors` is not set"""
+
+        session = session or self.requests
+
+        rjson = None
+        try:
+            res = session.post(url, data=dumps(query), headers=HEADER_JSON)
+            res.raise_for_status()
+            rjson = loads_response(res)
+        except Exception:
+            if raise_errors:
+                raise
+            # The index could not exists yet or it could be empty
+            logger.debug("No results found from {}".format(anonymize_url(url)))
+
+        return rjson
+
+    def get_elastic_items(self, elastic_scroll_id=None, _filter=None, ignore_incremental=False,
+                          ordered=True, _slice=None, session=None, _source=None):
         """Get the items from the index related to the backend applying and
         optional _filter if provided
 
         :param elastic_scroll_id: If not None, it allows to continue scrolling the data
         :param _filter: if not None, it allows to define a terms filter (e.g., "uuid": ["hash1", "hash2, ...]
         :param ignore_incremental: if True, incremental collection is ignored
+        :param ordered: if True, sort the items by the incremental date field
+        :param _slice: if not None, tuple (slice id, max slices) to retrieve only a slice of the scroll
+        :param session: requests session to use, by default the one of the object
+        :param _source: if not None, fields to include, or dict with the fields to include
+            and exclude, in the `_source` of the items
         """
         headers = {"Content-Type": "application/json"}
+        session = session or self.requests
 
         if not self.elastic:
             return None
@@ -302,94 +665,22 @@ class ElasticItems:
             }
             query_data = json.dumps(scroll_data)
         else:
-            # If using a perceval backends always filter by repository
-            # to support multi repository indexes
-            filters_dict = self.get_repository_filter_raw(term=True)
-            if filters_dict:
-                filters = json.dumps(filters_dict)
-            else:
-                filters = ''
-
-            if self.filter_raw:
-                for fltr in self.filter_raw_dict:
-                    filters += '''
-                        , {"term":
-                            { "%s":"%s"  }
-                        }
-                    ''' % (fltr['name'], fltr['value'])
-
-            if _filter:
-                filter_str = '''
-                    , {"terms":
-                        { "%s": %s }
-                    }
-                ''' % (_filter['name'], _filter['value'])
-                # List to string conversion uses ' that are not allowed in JSON
-                filter_str = filter_str.replace("'", "\"")
-                filters += filter_str
-
-            filters_spaces_dict = self.get_confluence_spaces(self.repo_spaces)
-            if filters_spaces_dict:
-                filters_spaces = json.dumps(filters_spaces_dict)
-                filters += '''
-                    , {"bool":%s}
-                ''' % (filters_spaces)
-
-            # The code below performs the incremental enrichment based on the last value of `metadata__timestamp`
-            # in the enriched index, which is calculated in the TaskEnrich before enriching the single repos that
-            # belong to a given data source. The old implementation of the incremental enrichment, which consisted in
-            # collecting the last value of `metadata__timestamp` in the enriched index for each repo, didn't work
-            # for global data source (which are collected globally and only partially enriched).
-            if self.from_date and not ignore_incremental:
-                date_field = self.get_incremental_date()
-                from_date = self.from_date.isoformat()
-
-                filters += '''
-                    , {"range":
-                        {"%s": {"gte": "%s"}}
-                    }
-                ''' % (date_field, from_date)
-            elif self.offset and not ignore_incremental:
-                filters += '''
-                    , {"range":
-                        {"offset": {"gte": %i}}
-                    }
-                ''' % self.offset
-
-            # Order the raw items from the old ones to the new so if the
-            # enrich process fails, it could be resume incrementally
-            order_query = ''
-            order_field = None
-            if self.perceval_backend:
-                order_field = self.get_incremental_date()
-            if order_field is not None:
-                order_query = ', "sort": { "%s": { "order": "asc" }} ' % order_field
-
-            # Fix the filters string if it starts with "," (empty first filter)
-            filters = filters.lstrip()[1:] if filters.lstrip().startswith(',') else filters
-
-            query = """
-            {
-                "query": {
-                    "bool": {
-                        "filter": [%s]
-                    }
-                } %s
-            }
-            """ % (filters, order_query)
+            query = self.get_elastic_query(_filter=_filter, ignore_incremental=ignore_incremental,
+                                           ordered=ordered, _source=_source)
+            if _slice:
+                query['slice'] = {"id": _slice[0], "max": _slice[1]}
 
             logger.debug("Raw query to {}\n{}".format(anonymize_url(url),
-                         json.dumps(json.loads(query), indent=4)))
-            query_data = query
+                         json.dumps(query, indent=4)))
+            query_data = dumps(query)
 
         rjson = None
         try:
-            res = self.requests.post(url, data=query_data, headers=headers)
+            res = session.post(url, data=query_data, headers=headers)
             if self.too_many_scrolls(res):
                 return {'too_many_scrolls': True}
             res.raise_for_status()
-            rjson = json.loads(json.dumps(res.json(), ensure_ascii=False)
-                               .encode('utf-8', errors='ignore').decode('utf-8'))
+            rjson = loads_response(res)
 
         except Exception:
             # The index could not exists yet or it could be empty
@@ -397,6 +688,68 @@ class ElasticItems:
 
         return rjson
 
+    def get_elastic_query(self, _filter=None, ignore_incremental=False, ordered=True, _source=None):
+        """Build the query to retrieve the items from the index related to
+        the backend, applying the optional _filter if provided.
+
+        :param _filter: if not None, it allows to define a terms filter (e.g., "uuid": ["hash1", "hash2, ...]
+        :param ignore_incremental: if True, incremental collection is ignored
+        :param ordered: if True, sort the items by the incremental date field
+        :param _source: if not None, fields to include, or dict with the fields to include
+            and exclude, in the `_source` of the items
+
+        :returns: a dict with the query
+        """
+        filters = []
+
+        # If using a perceval backends always filter by repository
+        # to support multi repository indexes
+        filters_dict = self.get_repository_filter_raw(term=True)
+        if filters_dict:
+            filters.append(filters_dict)
+
+        if self.filter_raw:
+            for fltr in self.filter_raw_dict:
+                filters.append({"term": {fltr['name']: fltr['value']}})
+
+        if _filter:
+            filters.append({"terms": {_filter['name']: _filter['value']}})
+
+        filters_spaces_dict = self.get_confluence_spaces(self.repo_spaces)
+        if filters_spaces_dict:
+            filters.append({"bool": filters_spaces_dict})
+
+        # The code below performs the incremental enrichment based on the last value of `metadata__timestamp`
+        # in the enriched index, which is calculated in the TaskEnrich before enriching the single repos that
+        # belong to a given data source. The old implementation of the incremental enrichment, which consisted in
+        # collecting the last value of `metadata__timestamp` in the enriched index for each repo, didn't work
+        # for global data source (which are collected globally and only partially enriched).
+        if self.from_date and not ignore_incremental:
+            date_field = self.get_incremental_date()
+            from_date = self.from_date.isoformat()
+            filters.append({"range": {date_field: {"gte": from_date}}})
+        elif self.offset and not ignore_incremental:
+            filters.append({"range": {"offset": {"gte": int(self.offset)}}})
+
+        query = {
+            "query": {
+                "bool": {
+                    "filter": filters
+                }
+            }
+        }
+
+        # Order the raw items from the old ones to the new so if the
+        # enrich process fails, it could be resume incrementally
+        if self.perceval_backend and ordered:
+            order_field = self.get_incremental_date()
+            query['sort'] = {order_field: {"order": "asc"}}
+
+        if _source is not None:
+            query['_source'] = _source
+
+        return query
+
     def too_many_scrolls(self, res):
         """Check if result conatins 'too many scroll contexts' error"""
         r = res.json()
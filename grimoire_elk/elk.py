@@ -20,25 +20,29 @@
 #   Quan Zhou <quan@bitergia.com>
 #
 
+import concurrent.futures
 import inspect
 import logging
-from functools import lru_cache
-
-from opensearchpy import OpenSearch, RequestsHttpConnection
+import time
 
 from perceval.backend import find_signature_parameters, Archive
 from perceval.errors import RateLimitError
-from grimoirelab_toolkit.datetime import (datetime_utcnow, str_to_datetime)
+from grimoirelab_toolkit.datetime import (datetime_to_utc, datetime_utcnow, str_to_datetime)
 
+from .cache import CACHE_SETTINGS, Cache, log_caches_stats
 from .elastic_mapping import Mapping as BaseMapping
 from .elastic_items import ElasticItems
+from .enriched.checkpoint import CheckpointStore
+from .enriched.enrich import PHASE_IDENTITIES, invalidate_identities_caches
 from .enriched.sortinghat_gelk import SortingHat
-from .enriched.utils import get_last_enrich, grimoire_con, get_diff_current_date, anonymize_url
+from .enriched.utils import (get_last_enrich, grimoire_con, get_diff_current_date, anonymize_url,
+                             get_es_client, log_compression_stats, log_pool_stats)
 from .utils import get_connectors, get_connector_from_name, get_elastic
 
 IDENTITIES_INDEX = "grimoirelab_identities_cache"
 SECRET_PARAMETERS = ["--api-token", "--backend-password"]
 SIZE_SCROLL_IDENTITIES_INDEX = 1000
+FEED_WORKERS = 4
 
 logger = logging.getLogger(__name__)
 
@@ -70,8 +74,15 @@ def anonymize_params(parameters):
 def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
                  es_index=None, es_index_enrich=None, project=None,
                  es_aliases=None, projects_json_repo=None, repo_labels=None,
-                 anonymize=False):
-    """ Feed Ocean with backend data """
+                 anonymize=False, bulk_load=False, stats=None):
+    """ Feed Ocean with backend data
+
+    When `bulk_load` is set and the raw index is recreated (`clean`), the
+    refresh and the replicas of the index are disabled while it is fed.
+
+    When `stats` is a dict, it is updated with the `origin` fed and the
+    number of `items` inserted and `failed`.
+    """
 
     error_msg = None
     backend = None
@@ -206,7 +217,15 @@ def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
         if no_update:
             params['no_update'] = no_update
 
-        ocean_backend.feed(**params)
+        if clean and bulk_load:
+            with elastic_ocean.bulk_load():
+                ocean_backend.feed(**params)
+        else:
+            ocean_backend.feed(**params)
+
+        if stats is not None:
+            stats['items'] = ocean_backend.feed_result.inserted
+            stats['failed'] = ocean_backend.feed_result.failed
 
     except RateLimitError as ex:
         logger.error("Error feeding raw from {} ({}): rate limit exceeded".format(backend_name, backend.origin))
@@ -229,10 +248,59 @@ def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
     except AttributeError:
         msg = "[{}] Done collection for {}".format(backend_name, anonymize_url(projects_json_repo))
     logger.info(msg)
+    log_compression_stats()
+    log_pool_stats()
+
+    if stats is not None and backend:
+        stats['origin'] = backend.origin
 
     return error_msg
 
 
+def feed_backends(url, clean, fetch_archive, backends, workers=FEED_WORKERS, **kwargs):
+    """Feed Ocean with the data of several backends at the same time.
+
+    Each backend is fed with `feed_backend` by a pool of `workers`
+    threads, which share the connections to ES. The errors of a backend
+    don't stop the feeding of the rest of backends.
+
+    :param url: ES url
+    :param clean: remove the raw indexes before feeding them
+    :param fetch_archive: fetch the items from the archive
+    :param backends: list of (backend_name, backend_params, es_index) tuples
+    :param workers: max number of backends fed at the same time
+    :param kwargs: other params of `feed_backend`, common to all the backends
+
+    :returns: list of dicts with the `backend_name`, `origin`, `items`,
+        `failed`, `seconds` and `error` of each backend, in the order
+        of `backends`
+    """
+    def feed(backend_name, backend_params, es_index):
+        stats = {'backend_name': backend_name, 'origin': None, 'items': 0, 'failed': 0, 'error': None}
+        start = time.monotonic()
+        try:
+            stats['error'] = feed_backend(url, clean, fetch_archive, backend_name, backend_params,
+                                          es_index=es_index, stats=stats, **kwargs)
+        except Exception as ex:
+            stats['error'] = "Error feeding raw from {}: {}".format(backend_name, ex)
+            logger.error(stats['error'], exc_info=True)
+        stats['seconds'] = time.monotonic() - start
+        return stats
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(feed, *backend) for backend in backends]
+        results = [future.result() for future in futures]
+
+    for stats in results:
+        origin = anonymize_url(stats['origin']) if stats['origin'] else None
+        rate = stats['items'] / stats['seconds'] if stats['seconds'] else 0.0
+        logger.info("[{}] Fed {} items ({} failed) in {:.2f} s ({:.1f} items/s) for {}{}".format(
+                    stats['backend_name'], stats['items'], stats['failed'], stats['seconds'], rate, origin,
+                    ": {}".format(stats['error']) if stats['error'] else ""))
+
+    return results
+
+
 def refresh_projects(enrich_backend):
     logger.debug("Refreshing project field in {}".format(
                  anonymize_url(enrich_backend.elastic.index_url)))
@@ -326,6 +394,8 @@ def refresh_identities(enrich_backend, author_fields=None, individuals=None):
     else:
         to_refresh = []
         author_values = get_author_uuids(individuals)
+        # Find the individuals of the items without scanning the list
+        individuals = enrich_backend.index_individuals(individuals)
         for author_value in author_values:
             to_refresh.append(author_value)
 
@@ -351,8 +421,9 @@ def load_identities(ocean_backend, enrich_backend):
     items_count = 0
     identities_count = 0
     new_identities = []
+    # Identities already added in this load, not shared with other loads
+    identities_cache = Cache('load_identities', **CACHE_SETTINGS)
 
-    @lru_cache(4096)
     def insert_identity_cache(identity_tuple):
         uid = dict((x, y) for x, y in identity_tuple)
         new_identities.append(uid)
@@ -361,7 +432,7 @@ def load_identities(ocean_backend, enrich_backend):
     if isinstance(ocean_backend, list):
         items = ocean_backend
     else:
-        items = ocean_backend.fetch()
+        items = ocean_backend.fetch(_source=enrich_backend.get_raw_source(PHASE_IDENTITIES))
 
     for item in items:
         items_count += 1
@@ -374,7 +445,7 @@ def load_identities(ocean_backend, enrich_backend):
         for identity in identities:
             # Insert the identity in new_identities with cache
             identity_tuple = tuple(identity.items())
-            insert_identity_cache(identity_tuple)
+            identities_cache.get_or_call(identity_tuple, lambda: insert_identity_cache(identity_tuple))
 
             if len(new_identities) >= 100:
                 SortingHat.add_identities(enrich_backend.sh_db,
@@ -389,6 +460,8 @@ def load_identities(ocean_backend, enrich_backend):
                                   enrich_backend.get_sh_backend_name())
         identities_count += len(new_identities)
 
+    logger.debug("Cache {}".format(identities_cache.summary()))
+
     return identities_count
 
 
@@ -397,9 +470,11 @@ def enrich_items(ocean_backend, enrich_backend, events=False):
 
     if not events:
         total = enrich_backend.enrich_items(ocean_backend)
+        enrich_backend.elastic.refresh_pending()
         enrich_backend.update_items(ocean_backend, enrich_backend)
     else:
         total = enrich_backend.enrich_events(ocean_backend)
+        enrich_backend.elastic.refresh_pending()
     return total
 
 
@@ -453,6 +528,48 @@ def get_ocean_backend(backend_cmd, enrich_backend, no_incremental, filter_raw=No
     return ocean_backend
 
 
+def init_checkpoints(enrich_backend, url, backend_name, origin, filter_raw, enrich_index):
+    """Set the store of the checkpoints of the enrichment and get the
+    checkpoint of a previous enrichment which didn't finish.
+
+    :param enrich_backend: enrich backend
+    :param url: url of the ES/OpenSearch instance of the enriched index
+    :param backend_name: name of the connector
+    :param origin: origin of the raw items
+    :param filter_raw: filter raw of the raw items
+    :param enrich_index: name of the enriched index
+
+    :returns: the checkpoint to resume the enrichment or None
+    """
+    store = CheckpointStore(url, insecure=enrich_backend.insecure)
+    checkpoint_id = store.get_checkpoint_id(backend_name, origin, filter_raw, enrich_index)
+    enrich_backend.set_checkpoint_store(store, checkpoint_id)
+
+    checkpoint = enrich_backend.get_resume_checkpoint()
+    if checkpoint and not store.index_exists(enrich_index):
+        logger.debug("Checkpoint of {} ignored, the index doesn't exist".format(enrich_index))
+        checkpoint = None
+
+    return checkpoint
+
+
+def resume_enrichment(ocean_backend, checkpoint):
+    """Set the ocean backend to read the raw items from the position of
+    a checkpoint, when it is after the position of the ocean backend.
+
+    :param ocean_backend: backend to access raw items
+    :param checkpoint: checkpoint of the enrichment
+    """
+    # The raw items are read sorted by date, also in the backends with
+    # offset, so the date is used to resume all of them; it replaces the
+    # offset filter of the raw items
+    if checkpoint.get('timestamp'):
+        from_date = datetime_to_utc(str_to_datetime(checkpoint['timestamp']))
+        if not ocean_backend.from_date or datetime_to_utc(ocean_backend.from_date) < from_date:
+            ocean_backend.from_date = from_date
+            logger.info("Resuming enrichment from {}".format(from_date.isoformat()))
+
+
 def do_studies(ocean_backend, enrich_backend, studies_args, retention_time=None):
     """Execute studies related to a given enrich backend. If `retention_time` is not None, the
     study data is deleted based on the number of minutes declared in `retention_time`.
@@ -504,12 +621,21 @@ def enrich_backend(url, clean, backend_name, backend_params, cfg_section_name,
                    unaffiliated_group=None, pair_programming=False,
                    node_regex=False, studies_args=None, es_enrich_aliases=None,
                    last_enrich_date=None, projects_json_repo=None, repo_labels=None,
-                   repo_spaces=None):
-    """ Enrich Ocean index """
+                   repo_spaces=None, bulk_load=False):
+    """ Enrich Ocean index
+
+    When `bulk_load` is set and the enrichment is not incremental, the
+    refresh and the replicas of the enriched index are disabled while
+    the items are enriched.
+    """
 
     backend = None
     enrich_index = None
 
+    # The identities are refreshed because they were modified in SortingHat
+    if do_refresh_identities:
+        invalidate_identities_caches()
+
     if ocean_index or ocean_index_enrich:
         clean = False  # don't remove index, it could be shared
 
@@ -552,6 +678,17 @@ def enrich_backend(url, clean, backend_name, backend_params, cfg_section_name,
         # store the cfg section name in the enrich backend to recover the corresponding project name in projects.json
         enrich_backend.set_cfg_section_name(cfg_section_name)
         enrich_backend.set_from_date(last_enrich_date)
+
+        checkpoint = None
+        enriching = not (only_studies or only_identities or do_refresh_projects or do_refresh_identities)
+        if enriching and enrich_backend.checkpoint_bulks > 0:
+            origin = backend.origin if backend else projects_json_repo
+            checkpoint = init_checkpoints(enrich_backend, url_enrich or url, backend_name, origin,
+                                          filter_raw, enrich_index)
+            if checkpoint and clean:
+                logger.info("Enrichment of {} not finished, it is resumed instead of starting over".format(
+                            enrich_index))
+                clean = False
         if url_enrich:
             elastic_enrich = get_elastic(url_enrich, enrich_index, clean, enrich_backend, es_enrich_aliases)
         else:
@@ -576,6 +713,8 @@ def enrich_backend(url, clean, backend_name, backend_params, cfg_section_name,
         enrich_backend.set_repo_spaces(repo_spaces)
 
         ocean_backend = get_ocean_backend(backend_cmd, enrich_backend, no_incremental, filter_raw, repo_spaces)
+        if checkpoint:
+            resume_enrichment(ocean_backend, checkpoint)
 
         if only_studies:
             logger.info("Running only studies (no SH and no enrichment)")
@@ -623,14 +762,14 @@ def enrich_backend(url, clean, backend_name, backend_params, cfg_section_name,
 
             else:
                 # Enrichment for the new items once SH update is finished
-                if not events_enrich:
-                    enrich_count = enrich_items(ocean_backend, enrich_backend)
-                    if enrich_count is not None:
-                        logger.debug("Total items enriched {} ".format(enrich_count))
+                if no_incremental and bulk_load:
+                    with enrich_backend.elastic.bulk_load():
+                        enrich_count = enrich_items(ocean_backend, enrich_backend, events=events_enrich)
                 else:
-                    enrich_count = enrich_items(ocean_backend, enrich_backend, events=True)
-                    if enrich_count is not None:
-                        logger.debug("Total events enriched {} ".format(enrich_count))
+                    enrich_count = enrich_items(ocean_backend, enrich_backend, events=events_enrich)
+                if enrich_count is not None:
+                    logger.debug("Total {} enriched {} ".format("events" if events_enrich else "items",
+                                                                enrich_count))
                 if studies:
                     do_studies(ocean_backend, enrich_backend, studies_args)
 
@@ -652,6 +791,9 @@ def enrich_backend(url, clean, backend_name, backend_params, cfg_section_name,
         msg = "[{}] Done enrichment for {}".format(backend_name, anonymize_url(projects_json_repo))
 
     logger.info(msg)
+    log_compression_stats()
+    log_pool_stats()
+    log_caches_stats()
 
 
 def delete_orphan_unique_identities(es, sortinghat_db, current_data_source, active_data_sources):
@@ -854,8 +996,7 @@ def retain_identities(retention_time, es_enrichment_url, sortinghat_db, data_sou
     before_date = get_diff_current_date(minutes=retention_time)
     before_date_str = before_date.isoformat()
 
-    es = OpenSearch([es_enrichment_url], timeout=120, max_retries=20, retry_on_timeout=True,
-                    connection_class=RequestsHttpConnection, verify_certs=False, ssl_show_warn=False)
+    es = get_es_client(es_enrichment_url, insecure=True, timeout=120, max_retries=20, retry_on_timeout=True)
 
     # delete the unique identities which have not been seen after `before_date`
     delete_inactive_unique_identities(es, sortinghat_db, before_date_str)
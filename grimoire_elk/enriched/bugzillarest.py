@@ -20,7 +20,6 @@
 #   Quan Zhou <quan@bitergia.com>
 #
 
-import json
 import logging
 
 from ..elastic_mapping import Mapping as BaseMapping
@@ -287,45 +286,26 @@ class BugzillaRESTEnrich(Enrich):
     def enrich_items(self, ocean_backend):
         """Enrich Bugzilla items (bugs and comments)."""
 
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        bulk_json = ""
-        total = 0
-
         url = self.elastic.get_bulk_url()
 
-        logger.debug("[bugzillarest] Adding items to {} (in {} packs)".format(anonymize_url(url), max_items))
+        logger.debug("[bugzillarest] Adding items to {} (in {} packs)".format(anonymize_url(url), self.elastic.max_items_bulk))
 
         items = ocean_backend.fetch()
 
-        for item in items:
-            if current >= max_items:
-                total += self.elastic.safe_put_bulk(url, bulk_json)
-                bulk_json = ""
-                current = 0
-
-            rich_item = self.get_rich_item(item)
-            data_json = json.dumps(rich_item)
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                (rich_item[self.get_field_unique_id()])
-            bulk_json += data_json + "\n"  # Bulk document
-            current += 1
-
-            # Enrich comments
-            if "comments" not in item["data"]:
-                continue
+        with self.elastic.get_bulk_writer(url) as writer:
+            for item in items:
+                rich_item = self.get_rich_item(item)
+                writer.add(rich_item[self.get_field_unique_id()], rich_item)
 
-            for comment in item['data']['comments'][1:]:
-                rich_comment = self.get_rich_item(comment, kind="comment", ebug=rich_item)
+                # Enrich comments
+                if "comments" not in item["data"]:
+                    continue
 
-                data_json = json.dumps(rich_comment)
-                bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                    (rich_comment[self.get_field_unique_id()])
-                bulk_json += data_json + "\n"  # Bulk document
-                current += 1
+                for comment in item['data']['comments'][1:]:
+                    rich_comment = self.get_rich_item(comment, kind="comment", ebug=rich_item)
+                    writer.add(rich_comment[self.get_field_unique_id()], rich_comment)
 
-        if current > 0:
-            total += self.elastic.safe_put_bulk(url, bulk_json)
+        total = writer.total
 
         return total
 
@@ -25,6 +25,8 @@ from grimoirelab_toolkit import datetime
 
 from opensearchpy import helpers, Search, NotFoundError, JSONSerializer
 
+from ..elastic_bulk import BulkWriter
+
 MAX_CHUNK_BYTES = 50 * 1024 * 1024  # 50 MB, ES max bulk size is 100MB
 MAX_CHUNK_SIZE = 100
 
@@ -229,30 +231,14 @@ class ESConnector(Connector):
     def bulk_write(self, docs):
         """Upload items to ElasticSearch using bulk API."""
 
-        current = 0
-        total = 0
-        bulk_json = ""
-        bulk_json_size = 0
         json_serializer = JSONSerializer()
 
+        writer = BulkWriter(self._bulk, max_items=MAX_CHUNK_SIZE, max_bytes=MAX_CHUNK_BYTES,
+                            description=self.__log_prefix.strip())
         for doc in docs:
-            new_data = '{{"index" : {{"_id" : "{}" }} }}\n'.format(doc["_id"])
-            new_data += json_serializer.dumps(doc["_source"]) + "\n"
-            doc_size = len(new_data.encode("utf-8", 'replace'))
-
-            # If adding this document exceeds limits, flush current bulk
-            if (bulk_json_size + doc_size) >= MAX_CHUNK_BYTES or current >= MAX_CHUNK_SIZE:
-                total += self._bulk(body=bulk_json)
-                bulk_json = new_data
-                current = 1
-            else:
-                bulk_json += new_data
-                current += 1
-
-        if current > 0:
-            total += self._bulk(body=bulk_json)
+            writer.add_json(doc["_id"], json_serializer.dumps(doc["_source"]))
 
-        return total
+        return writer.close()
 
     def _bulk(self, body):
         """Perform bulk operation in ElasticSearch.
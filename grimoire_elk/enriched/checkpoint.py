@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Checkpoints of the enrichment stored in a state index"""
+
+import hashlib
+import json
+import logging
+
+from grimoirelab_toolkit.datetime import datetime_utcnow
+
+from ..elastic_items import HEADER_JSON
+from .utils import anonymize_url, get_session
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS_INDEX = "grimoirelab_enrich_checkpoints"
+CHECKPOINT_RUNNING = 'running'
+CHECKPOINT_DONE = 'done'
+
+
+class CheckpointStore:
+    """Store of the checkpoints of the enrichment.
+
+    A checkpoint keeps the position of the last raw item enriched
+    and uploaded for a connector, origin and filter raw. It is used to
+    resume an enrichment which didn't finish (i.e. its status is
+    `running`) from that position instead of starting over.
+
+    :param url: ES/OpenSearch url
+    :param index: name of the index where the checkpoints are stored
+    :param insecure: support https with invalid certificates
+    """
+    def __init__(self, url, index=CHECKPOINTS_INDEX, insecure=True):
+        self.url = url
+        self.index = index
+        self.index_url = url + "/" + index
+        self.requests = get_session(url, insecure)
+
+    @staticmethod
+    def get_checkpoint_id(connector, origin, filter_raw=None, enrich_index=None):
+        """Get the id of the checkpoint of an enrichment.
+
+        :param connector: name of the connector
+        :param origin: origin of the raw items
+        :param filter_raw: filter raw of the items
+        :param enrich_index: name of the enriched index
+
+        :returns: the id of the checkpoint
+        """
+        key = json.dumps([connector, origin, filter_raw, enrich_index])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, checkpoint_id):
+        """Get a checkpoint.
+
+        :param checkpoint_id: id of the checkpoint
+
+        :returns: the checkpoint or None if it doesn't exist
+        """
+        url = self.index_url + "/_doc/" + checkpoint_id
+
+        res = self.requests.get(url)
+        if res.status_code == 404:
+            return None
+        res.raise_for_status()
+
+        return res.json().get('_source')
+
+    def save(self, checkpoint_id, checkpoint, status=CHECKPOINT_RUNNING):
+        """Store a checkpoint.
+
+        :param checkpoint_id: id of the checkpoint
+        :param checkpoint: dict with the position of the enrichment
+        :param status: `running` while the enrichment is not finished, `done` otherwise
+        """
+        url = self.index_url + "/_doc/" + checkpoint_id
+
+        checkpoint = dict(checkpoint)
+        checkpoint['status'] = status
+        checkpoint['updated_on'] = datetime_utcnow().isoformat()
+
+        res = self.requests.put(url, data=json.dumps(checkpoint), headers=HEADER_JSON)
+        res.raise_for_status()
+
+        logger.debug("Checkpoint {} saved in {}: {}".format(checkpoint_id, anonymize_url(self.index_url),
+                                                            checkpoint))
+
+    def index_exists(self, index):
+        """Check whether an index exists in the ES instance of the store.
+
+        :param index: name of the index
+        """
+        res = self.requests.head(self.url + "/" + index)
+        return res.status_code == 200
@@ -26,14 +26,13 @@ import hashlib
 
 from dateutil.relativedelta import relativedelta
 
-from opensearchpy import OpenSearch as ES, RequestsHttpConnection
 
 from .enrich import (Enrich,
                      metadata)
 from .graal_study_evolution import (get_to_date,
                                     get_unique_repository,
                                     get_files_at_time)
-from .utils import fix_field_date, anonymize_url
+from .utils import fix_field_date, anonymize_url, get_es_client
 from ..elastic_mapping import Mapping as BaseMapping
 
 from grimoirelab_toolkit.datetime import datetime_utcnow
@@ -299,9 +298,8 @@ class CocomEnrich(Enrich):
 
         logger.info("[cocom] study enrich-cocom-analysis start")
 
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
         interval_months = list(map(int, interval_months))
 
@@ -22,12 +22,11 @@
 import logging
 from dateutil.relativedelta import relativedelta
 
-from opensearchpy import OpenSearch as ES, RequestsHttpConnection
 from .enrich import (Enrich,
                      metadata)
 from .graal_study_evolution import (get_to_date,
                                     get_unique_repository)
-from .utils import fix_field_date, anonymize_url
+from .utils import fix_field_date, anonymize_url, get_es_client
 from ..elastic_mapping import Mapping as BaseMapping
 
 from grimoirelab_toolkit.datetime import datetime_utcnow
@@ -371,9 +370,8 @@ class ColicEnrich(Enrich):
 
         logger.info("[colic] study enrich-colic-analysis start")
 
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
         interval_months = list(map(int, interval_months))
 
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Parsing of the dates of the items with a memo of the dates parsed"""
+
+import collections
+import datetime
+import functools
+import re
+
+import dateutil.tz
+from grimoirelab_toolkit.datetime import datetime_to_utc, str_to_datetime
+
+DATES_CACHE_SIZE = 4096
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+WEEKDAYS = r"(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)"
+MONTHS_REGEX = r"(?P<month>" + "|".join(MONTHS) + ")"
+TIME_REGEX = r"(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})"
+
+# 2023-01-31T10:20:30.123456+01:00, 2023-01-31 10:20:30Z, 2023-01-31
+ISO_8601_REGEX = re.compile(r"^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})"
+                            r"(?:[T ]" + TIME_REGEX + r"(?:\.(?P<fraction>\d{1,6}))?)?"
+                            r"(?P<tz>Z|[+-]\d{2}:?\d{2})?$")
+# Tue, 31 Jan 2023 10:20:30 +0100
+RFC_2822_REGEX = re.compile(r"^(?:" + WEEKDAYS + r",\s+)?(?P<day>\d{1,2})\s+" + MONTHS_REGEX
+                            + r"\s+(?P<year>\d{4})\s+" + TIME_REGEX + r"\s+(?P<tz>[+-]\d{4})$")
+# Tue Jan 31 10:20:30 2023 +0100 (git)
+GIT_REGEX = re.compile(r"^" + WEEKDAYS + r"\s+" + MONTHS_REGEX + r"\s+(?P<day>\d{1,2})\s+" + TIME_REGEX
+                       + r"\s+(?P<year>\d{4})\s+(?P<tz>[+-]\d{4})$")
+DATE_REGEXES = [ISO_8601_REGEX, RFC_2822_REGEX, GIT_REGEX]
+
+MAX_OFFSET = datetime.timedelta(hours=24)
+TZ_UTC = dateutil.tz.tzutc()
+
+DateParts = collections.namedtuple('DateParts', ['isoformat', 'weekday', 'hour',
+                                                 'utc_isoformat', 'utc_weekday', 'utc_hour'])
+
+
+def _get_tzinfo(tz):
+    if not tz or tz == 'Z':
+        return TZ_UTC
+
+    tz = tz.replace(':', '')
+    sign = -1 if tz[0] == '-' else 1
+    offset = sign * datetime.timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5]))
+
+    if offset == datetime.timedelta(0):
+        return TZ_UTC
+    elif abs(offset) >= MAX_OFFSET:
+        return None
+    return dateutil.tz.tzoffset(None, int(offset.total_seconds()))
+
+
+def _parse_fast(ts):
+    for regex in DATE_REGEXES:
+        m = regex.match(ts)
+        if m:
+            break
+    else:
+        return None
+
+    fields = m.groupdict()
+    tzinfo = _get_tzinfo(fields['tz'])
+    if not tzinfo:
+        return None
+
+    month = fields['month']
+    month = MONTHS[month] if month in MONTHS else int(month)
+    fraction = fields.get('fraction') or '0'
+
+    try:
+        return datetime.datetime(int(fields['year']), month, int(fields['day']),
+                                 int(fields['hour'] or 0), int(fields['minute'] or 0), int(fields['second'] or 0),
+                                 int(fraction.ljust(6, '0')), tzinfo=tzinfo)
+    except ValueError:
+        return None
+
+
+@functools.lru_cache(maxsize=DATES_CACHE_SIZE)
+def parse_date(ts):
+    """Convert a string to a datetime object.
+
+    The ISO 8601, RFC 2822 and git formats are parsed directly, and
+    the rest of formats with `str_to_datetime`, which also raises the
+    errors. As with `str_to_datetime`, UTC is set when the string
+    doesn't include a timezone. The dates parsed are memoized, as the
+    same dates are parsed several times for each item.
+
+    :param ts: string to convert
+
+    :returns: a datetime object
+
+    :raises InvalidDateError: when the string is not a valid date
+    """
+    if isinstance(ts, str):
+        dt = _parse_fast(ts)
+        if dt:
+            return dt
+
+    return str_to_datetime(ts)
+
+
+@functools.lru_cache(maxsize=DATES_CACHE_SIZE)
+def _get_date_parts(date, offset):
+    local = date.replace(tzinfo=None)
+    utc = datetime_to_utc(date).replace(tzinfo=None)
+
+    return DateParts(isoformat=local.isoformat(), weekday=local.isoweekday(), hour=local.hour,
+                     utc_isoformat=utc.isoformat(), utc_weekday=utc.isoweekday(), utc_hour=utc.hour)
+
+
+def get_date_parts(date):
+    """Get the fields of the enriched items derived from a date.
+
+    :param date: datetime object
+
+    :returns: a `DateParts` tuple with the date without timezone in ISO
+        format, its weekday and hour, and the same fields of the date in UTC
+    """
+    # Dates with different offsets are equal when they are the same instant
+    return _get_date_parts(date, date.utcoffset())
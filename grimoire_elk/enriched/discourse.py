@@ -165,17 +165,18 @@ class DiscourseEnrich(Enrich):
 
     def __collect_categories(self, origin, headers):
         categories = {}
-        con = grimoire_con()
-
-        raw_site = con.get(origin + "/site.json", headers=headers)
+        # The Discourse site is not an ElasticSearch host, so its session
+        # is not shared with the pooled ones
+        with grimoire_con() as con:
+            raw_site = con.get(origin + "/site.json", headers=headers)
         for cat in raw_site.json()['categories']:
             categories[cat['id']] = cat['name']
         return categories
 
     def __collect_categories_tree(self, origin, headers):
         tree = {}
-        con = grimoire_con()
-        raw = con.get(origin + "/categories.json", headers=headers)
+        with grimoire_con() as con:
+            raw = con.get(origin + "/categories.json", headers=headers)
         raw_json = raw.json()
         if "category_list" in raw_json and 'categories' in raw_json["category_list"]:
             categories = raw_json["category_list"]['categories']
@@ -20,37 +20,47 @@
 #   Quan Zhou <quan@bitergia.com>
 #   Miguel Ángel Fernández <mafesan@bitergia.com>
 #
+import bisect
+import collections
+import contextlib
 import datetime
+import itertools
 import json
 import functools
 import logging
+import multiprocessing
 import requests
-import sys
 import time
 
 from datetime import timedelta
 from dateutil.relativedelta import relativedelta
 
 from importlib.resources import files
-from functools import lru_cache
 
-from opensearchpy import OpenSearch as ES, RequestsHttpConnection
 from geopy.geocoders import Nominatim
 
 from perceval.backend import find_signature_parameters
 from grimoirelab_toolkit.datetime import datetime_utcnow, str_to_datetime
 
+from ..cache import CACHE_SETTINGS, Cache, cached, get_cache, invalidate_caches
+from ..codec import dumps
 from ..elastic import ElasticSearch
 from ..elastic_analyzer import Analyzer
 from ..elastic_items import (ElasticItems,
                              HEADER_JSON)
+from ..pipeline import StageStats, prefetch
+from .checkpoint import CHECKPOINT_DONE, CHECKPOINT_RUNNING
+from .dates import parse_date
 from .study_ceres_onion import ESOnionConnector, onion_study
-from .sortinghat_gelk import MULTI_ORG_NAMES
+from .identity_cache import IdentityCache
+from .projects_index import ProjectsIndex
+from .sortinghat_gelk import ENTITIES_BATCH_SIZE, MULTI_ORG_NAMES
 from .graal_study_evolution import (get_to_date,
                                     get_unique_repository)
 from statsmodels.duration.survfunc import SurvfuncRight
 
-from .utils import grimoire_con, METADATA_FILTER_RAW, REPO_LABELS, anonymize_url
+from .utils import (get_es_client, get_session, grimoire_con, reset_sessions,
+                    METADATA_FILTER_RAW, REPO_LABELS, anonymize_url)
 from .. import __version__
 
 logger = logging.getLogger(__name__)
@@ -72,8 +82,79 @@ DEFAULT_PROJECT = 'Main'
 DEFAULT_DB_USER = 'root'
 CUSTOM_META_PREFIX = 'cm'
 EXTRA_PREFIX = 'extra'
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
 SH_UNKNOWN_VALUE = 'Unknown'
 
+# Phases reading the raw items, used to declare the raw fields each one needs
+PHASE_IDENTITIES = 'identities'
+PHASE_ENRICHMENT = 'enrichment'
+PHASE_UPDATE_ITEMS = 'update_items'
+
+# Shared caches with the individuals and enrollments of SortingHat
+IDENTITIES_CACHES = ['sh_items_by_id', 'sh_items_by_identity', 'sh_entities', 'sh_bots',
+                     'sh_enrollments', 'sh_enrollments_periods', 'sh_unique_identities', 'sh_uuids',
+                     'sh_identities_added']
+
+# Enricher used by the processes of the enrichment pool
+ENRICH_WORKER = None
+
+
+def invalidate_identities_caches():
+    """Remove the SortingHat data from the shared caches of the process.
+
+    It must be called when the individuals of SortingHat are modified,
+    so the enrichers of the process don't use the outdated ones.
+    """
+    invalidate_caches(IDENTITIES_CACHES)
+
+
+def init_enrich_worker(enricher):
+    """Initialize a process of the enrichment pool.
+
+    The processes are forked, so they get a copy of the enricher with
+    its projects map and caches. The connections of the parent can't
+    be shared, so new ones are opened to ElasticSearch and SortingHat.
+
+    :param enricher: enricher object of the parent process
+    """
+    global ENRICH_WORKER
+
+    reset_sessions()
+    if enricher.elastic:
+        enricher.requests = get_session(enricher.elastic.url, enricher.insecure)
+        enricher.elastic.requests = get_session(enricher.elastic.url, enricher.insecure)
+    if Enrich.sh_db:
+        Enrich.sh_db.connect()
+
+    ENRICH_WORKER = enricher
+
+
+def enrich_chunk(items, events=False):
+    """Enrich a chunk of raw items in a process of the enrichment pool.
+
+    :param items: list of raw items
+    :param events: generate rich events instead of rich items
+
+    :returns: list of tuples with the id and the JSON document of the
+        rich items or events, and the counters updated while enriching them
+    """
+    ENRICH_WORKER.enrich_counters = collections.Counter()
+    ENRICH_WORKER.prefetch_sh_entities(items)
+
+    rich_items = []
+    for item in items:
+        for _id, rich_item in ENRICH_WORKER.enrich_item(item, events=events):
+            rich_items.append((_id, dumps(rich_item)))
+
+    return rich_items, ENRICH_WORKER.enrich_counters
+
+
+def to_microseconds(date):
+    """Convert an offset-naive datetime to microseconds since the epoch"""
+
+    return (date - EPOCH) // ONE_MICROSECOND
+
 
 def metadata(func):
     """Add metadata to an item.
@@ -100,11 +181,20 @@ def metadata(func):
 class Enrich(ElasticItems):
     analyzer = Analyzer
     sh_db = None
+    identities_cache_dir = None  # directory of the persistent cache of individuals (None = no cache)
+    identities_cache = None
     kibiter_version = None
     roles = []
     RAW_FIELDS_COPY = ["metadata__updated_on", "metadata__timestamp",
                        "offset", "origin", "tag", "uuid"]
     KEYWORD_MAX_LENGTH = 1000  # this control allows to avoid max_bytes_length_exceeded_exception
+    # Source filtering of the raw items read in each phase (PHASE_*). The phases
+    # not declared read the whole raw items
+    raw_fields = {}
+    enrich_workers = 1  # processes enriching the raw items (1 = enrich them in the main process)
+    enrich_chunk_size = 100  # raw items sent at once to each process
+    prefetch_size = 2  # pages of raw items read while enriching the current one (0 = no prefetch)
+    checkpoint_bulks = 0  # bulks uploaded between checkpoints of the enrichment (0 = no checkpoints)
 
     ONION_INTERVAL = seconds = 3600 * 24 * 7
 
@@ -133,7 +223,21 @@ class Enrich(ElasticItems):
 
             self.sortinghat = True
 
+            if Enrich.identities_cache_dir:
+                self.sync_identities_cache()
+
         self.prjs_map = None  # mapping beetween repositories and projects
+        self._projects_index_map = None  # projects map of the indexes of `get_projects_index`
+        self._projects_index_json = None
+        self._projects_index = {}
+        self._projects_memo = None
+        self._projects_fields_memo = {}
+        self.enrich_counters = collections.Counter()  # stats of the enrichment
+        self.enrich_stats = StageStats()  # time spent by each stage of the enrichment
+        self.last_enriched = None  # last raw item whose rich items were sent to the writer
+        self.checkpoint_store = None
+        self.checkpoint_id = None
+        self.sh_entities = {}  # individuals prefetched for the page of raw items being enriched
         self.json_projects = None
 
         if json_projects_map:
@@ -164,12 +268,42 @@ class Enrich(ElasticItems):
         # Label used during enrichment for identities with no gender info
         self.unknown_gender = 'Unknown'
 
+    @staticmethod
+    def sync_identities_cache():
+        """Synchronize the persistent cache of individuals with SortingHat.
+
+        The cache is opened the first time and then updated incrementally
+        each time an enricher is created, so the individuals modified in
+        SortingHat by other processes are not used outdated. When some of
+        them were modified, the SortingHat caches of the process are
+        invalidated too.
+
+        If the cache can't be synchronized, it is not used, so the
+        enrichment doesn't use individuals which might be outdated.
+        """
+        def search_modified(after):
+            return SortingHat.search_last_modified_identities(Enrich.sh_db, after, raise_errors=True)
+
+        path = Enrich.identities_cache_dir
+        try:
+            cache = Enrich.identities_cache or IdentityCache(path)
+            updated = cache.sync(search_modified)
+        except Exception as ex:
+            logger.warning("[sortinghat] Identities cache {} not used, it can't be synchronized: {}".format(path, ex))
+            Enrich.identities_cache = None
+            return
+
+        Enrich.identities_cache = cache
+        if updated:
+            invalidate_identities_caches()
+
     def set_elastic_url(self, url):
         """ Elastic URL """
         self.elastic_url = url
 
     def set_elastic(self, elastic):
         self.elastic = elastic
+        self.requests = get_session(elastic.url, self.insecure)
 
     def set_params(self, params):
         from ..utils import get_connector_from_name
@@ -305,6 +439,16 @@ class Enrich(ElasticItems):
         """ Field in the rich event with the unique id """
         raise NotImplementedError
 
+    def get_raw_source(self, phase):
+        """Get the source filtering of the raw items read in a phase.
+
+        :param phase: phase reading the raw items (identities, enrichment or update_items)
+
+        :returns: the fields to include, a dict with the fields to include and
+            exclude, or None to read the whole raw items
+        """
+        return self.raw_fields.get(phase)
+
     @metadata
     def get_rich_item(self, item):
         """ Create a rich item from the raw item """
@@ -328,56 +472,232 @@ class Enrich(ElasticItems):
         :return: total number of enriched items/events uploaded to Elasticsearch
         """
 
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        total = 0
-        bulk_json = ""
-
-        items = ocean_backend.fetch()
+        items = ocean_backend.fetch(_source=self.get_raw_source(PHASE_ENRICHMENT))
 
         url = self.elastic.get_bulk_url()
 
-        logger.debug("Adding items to {} (in {} packs)".format(anonymize_url(url), max_items))
+        logger.debug("Adding items to {} (in {} packs)".format(anonymize_url(url), self.elastic.max_items_bulk))
 
         if events:
             logger.debug("Adding events items")
 
-        for item in items:
-            if current >= max_items:
-                try:
-                    total += self.elastic.safe_put_bulk(url, bulk_json)
-                    json_size = sys.getsizeof(bulk_json) / (1024 * 1024)
-                    logger.debug("Added {} items to {} ({:.2f} MB)".format(total, anonymize_url(url), json_size))
-                except UnicodeEncodeError:
-                    # Why is requests encoding the POST data as ascii?
-                    logger.error("Unicode error in enriched items")
-                    logger.debug(bulk_json)
-                    safe_json = str(bulk_json.encode('ascii', 'ignore'), 'ascii')
-                    total += self.elastic.safe_put_bulk(url, safe_json)
-                bulk_json = ""
-                current = 0
-
-            if not events:
-                rich_item = self.get_rich_item(item)
-                data_json = json.dumps(rich_item)
-                bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                             (item[self.get_field_unique_id()])
-                bulk_json += data_json + "\n"  # Bulk document
-                current += 1
+        return self.upload_rich_items(items, events=events)
+
+    def upload_rich_items(self, items, events=False):
+        """Enrich the raw items and upload them to the enriched index.
+
+        The work is done in stages connected by bounded queues: the next
+        pages of raw items are fetched by a background thread while the
+        current ones are enriched and serialized, in this thread or in the
+        pool of processes, and the bulks are uploaded by the bulk writer
+        in background. The time spent by each stage is logged at the end,
+        where the time waiting for the raw items (fetch wait) or for the
+        uploads (upload wait) shows which stage is the bottleneck.
+
+        :param items: raw items to enrich
+        :param events: generate rich events instead of rich items
+
+        :returns: number of rich items or events uploaded
+        """
+        url = self.elastic.get_bulk_url()
+        self.enrich_stats = StageStats()
+        self.last_enriched = None
+
+        on_sent = None
+        if self.checkpoint_store and self.checkpoint_bulks > 0:
+            on_sent = self.__get_checkpoint_saver()
+
+        items = prefetch(items, queue_size=self.prefetch_size, chunk_size=self.scroll_size,
+                         stats=self.enrich_stats)
+
+        with self.enrich_pool() as pool, self.elastic.get_bulk_writer(url, on_sent=on_sent) as writer:
+            for _id, data_json in self.enrich_raw_items(items, pool=pool, events=events):
+                writer.mark(self.last_enriched)
+                writer.add_json(_id, data_json)
+
+        if self.checkpoint_store:
+            self.save_checkpoint(self.last_enriched, status=CHECKPOINT_DONE)
+
+        self.enrich_stats.add('upload', writer.send_time, writer.total)
+        self.enrich_stats.add('upload wait', writer.wait_time)
+        logger.info("Enrichment stages of {}: {}".format(anonymize_url(url), self.enrich_stats.summary()))
+
+        return writer.total
+
+    def enrich_item(self, item, events=False):
+        """Enrich a raw item.
+
+        :param item: raw item
+        :param events: generate rich events instead of a rich item
+
+        :returns: list of tuples with the id and the rich items or events
+        """
+        if not events:
+            rich_item = self.get_rich_item(item)
+            return [(item[self.get_field_unique_id()], rich_item)]
+
+        rich_events = []
+        for rich_event in self.get_rich_events(item):
+            _id = "%s_%s" % (item[self.get_field_unique_id()],
+                             rich_event[self.get_field_event_unique_id()])
+            rich_events.append((_id, rich_event))
+
+        return rich_events
+
+    @contextlib.contextmanager
+    def enrich_pool(self):
+        """Pool of processes used to enrich the raw items when
+        `enrich_workers` is greater than 1, otherwise None.
+
+        The pool must be created before opening the bulk writer, so
+        its background thread is not running when the processes are forked.
+        """
+        if self.enrich_workers <= 1:
+            yield None
+            return
+
+        logger.debug("Enriching items with {} processes".format(self.enrich_workers))
+
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(self.enrich_workers, initializer=init_enrich_worker, initargs=(self,))
+        try:
+            yield pool
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+
+    def enrich_raw_items(self, items, pool=None, events=False):
+        """Generator of the enriched raw items serialized as JSON.
+
+        The raw items are enriched in chunks of `enrich_chunk_size`
+        items, and the SortingHat individuals of each chunk are retrieved
+        at once before enriching it. When a pool is given, the chunks are
+        sent to its processes. The rich items are
+        returned in the same order of the raw items, and the number of
+        chunks pending is bounded, so the raw items are read as fast as
+        they are enriched.
+
+        :param items: raw items to enrich
+        :param pool: pool of processes created by `enrich_pool`
+        :param events: generate rich events instead of rich items
+
+        :returns: tuples with the id and the JSON document of the rich items or events
+        """
+        stats = self.enrich_stats
+
+        if not pool:
+            items = iter(items)
+            while True:
+                chunk = list(itertools.islice(items, self.enrich_chunk_size))
+                if not chunk:
+                    break
+                self.prefetch_sh_entities(chunk)
+                for item in chunk:
+                    start = time.perf_counter()
+                    rich_items = self.enrich_item(item, events=events)
+                    serialize = time.perf_counter()
+                    rich_items = [(_id, dumps(rich_item)) for _id, rich_item in rich_items]
+                    end = time.perf_counter()
+                    stats.add('enrich', serialize - start, 1)
+                    stats.add('serialize', end - serialize, len(rich_items))
+                    yield from rich_items
+                    self.last_enriched = item
+            return
+
+        def results(pending):
+            # The processes enrich and serialize the items
+            task, last_item = pending.popleft()
+            with stats.timer('enrich wait'):
+                rich_items, counters = task.get()
+            self.enrich_counters.update(counters)
+            yield from rich_items
+            self.last_enriched = last_item
+
+        items = iter(items)
+        pending = collections.deque()
+        while True:
+            chunk = list(itertools.islice(items, self.enrich_chunk_size))
+            if not chunk:
+                break
+            pending.append((pool.apply_async(enrich_chunk, (chunk, events)), chunk[-1]))
+            if len(pending) >= 2 * self.enrich_workers:
+                yield from results(pending)
+
+        while pending:
+            yield from results(pending)
+
+    def set_checkpoint_store(self, store, checkpoint_id):
+        """Set the store where the checkpoints of the enrichment are saved.
+
+        :param store: `CheckpointStore` object
+        :param checkpoint_id: id of the checkpoint of this enrichment
+        """
+        self.checkpoint_store = store
+        self.checkpoint_id = checkpoint_id
+
+    def get_resume_checkpoint(self):
+        """Get the checkpoint of a previous enrichment which didn't finish.
+
+        :returns: the checkpoint or None if there is nothing to resume
+        """
+        if not self.checkpoint_store:
+            return None
+
+        checkpoint = self.checkpoint_store.get(self.checkpoint_id)
+        if not checkpoint or checkpoint.get('status') != CHECKPOINT_RUNNING:
+            return None
+
+        return checkpoint
+
+    def get_checkpoint_position(self, item):
+        """Get the position of a raw item used to resume the enrichment.
+
+        The raw items are read sorted by their incremental date, so it is
+        the only position which ensures the items before it were enriched.
+
+        :param item: raw item
+
+        :returns: dict with the incremental date of the item
+        """
+        return {
+            "timestamp": item.get(self.get_incremental_date())
+        }
+
+    def save_checkpoint(self, item, status=CHECKPOINT_RUNNING):
+        """Save the checkpoint of the enrichment after a raw item. Errors
+        saving the checkpoint are logged but they don't stop the enrichment.
+
+        :param item: last raw item whose rich items were uploaded;
+            if None, the position of the current checkpoint is kept
+        :param status: status of the enrichment
+        """
+        try:
+            if item is not None:
+                checkpoint = self.get_checkpoint_position(item)
             else:
-                rich_events = self.get_rich_events(item)
-                for rich_event in rich_events:
-                    data_json = json.dumps(rich_event)
-                    bulk_json += '{"index" : {"_id" : "%s_%s" } }\n' % \
-                                 (item[self.get_field_unique_id()],
-                                  rich_event[self.get_field_event_unique_id()])
-                    bulk_json += data_json + "\n"  # Bulk document
-                    current += 1
+                checkpoint = self.checkpoint_store.get(self.checkpoint_id) or {}
+            self.checkpoint_store.save(self.checkpoint_id, checkpoint, status=status)
+        except Exception as e:
+            logger.warning("Checkpoint of the enrichment not saved: {}".format(e))
+
+    def __get_checkpoint_saver(self):
+        """Function called when a bulk is sent which saves a checkpoint
+        every `checkpoint_bulks` bulks"""
 
-        if current > 0:
-            total += self.elastic.safe_put_bulk(url, bulk_json)
+        bulks = 0
 
-        return total
+        def on_sent(item):
+            nonlocal bulks
+
+            bulks += 1
+            if item is not None and bulks % self.checkpoint_bulks == 0:
+                self.save_checkpoint(item)
+
+        return on_sent
 
     def add_repository_labels(self, eitem):
         """Add labels to the enriched item"""
@@ -472,7 +792,7 @@ class Enrich(ElasticItems):
             grimoire_date = creation_date.isoformat()
         else:
             try:
-                grimoire_date = str_to_datetime(creation_date).isoformat()
+                grimoire_date = parse_date(creation_date).isoformat()
             except Exception as ex:
                 pass
 
@@ -509,6 +829,30 @@ class Enrich(ElasticItems):
 
         return eitem_project_levels
 
+    def get_projects_index(self, ds_name):
+        """Get the index of the repositories of a data source in the projects map.
+
+        The indexes are built the first time they are used, and again
+        when the projects map is replaced.
+
+        :param ds_name: name of the data source in the projects map
+        :return: a `ProjectsIndex` or None if the data source is not in the map
+        """
+        if self.prjs_map is not self._projects_index_map or self.json_projects is not self._projects_index_json:
+            self._projects_index_map = self.prjs_map
+            self._projects_index_json = self.json_projects
+            self._projects_index = {}
+            self._projects_memo = Cache('projects', **CACHE_SETTINGS)
+            self._projects_fields_memo = {}
+
+        if not self.prjs_map or ds_name not in self.prjs_map:
+            return None
+
+        if ds_name not in self._projects_index:
+            self._projects_index[ds_name] = ProjectsIndex(self.prjs_map[ds_name])
+
+        return self._projects_index[ds_name]
+
     def find_item_project(self, eitem):
         """
         Find the project for a enriched item
@@ -518,59 +862,61 @@ class Enrich(ElasticItems):
         # get the data source name relying on the cfg section name, if null use the connector name
         ds_name = self.cfg_section_name if self.cfg_section_name else self.get_connector_name()
 
-        try:
-            # retrieve the project which includes the repo url in the projects.json,
-            # the variable `projects_json_repo` is passed from mordred to ELK when
-            # iterating over the repos in the projects.json, (see: param
-            # `projects_json_repo` in the functions elk.feed_backend and
-            # elk.enrich_backend)
+        index = self.get_projects_index(ds_name)
+        if not index:
+            return None
+
+        # retrieve the project which includes the repo url in the projects.json,
+        # the variable `projects_json_repo` is passed from mordred to ELK when
+        # iterating over the repos in the projects.json, (see: param
+        # `projects_json_repo` in the functions elk.feed_backend and
+        # elk.enrich_backend). If it is not set (e.g., AOC study), use the
+        # method `get_project_repository` (defined in each enricher)
+        if self.projects_json_repo:
+            repository = self.projects_json_repo
+        else:
+            repository = self.get_project_repository(eitem)
+
+        if repository in index:
+            project = index.get(repository)
+        else:
+            # With the introduction of `projects_json_repo` the fallback
+            # should be unreachable. Its result only depends on the repository
+            # and the origin of the item, so it is memoized
             if self.projects_json_repo:
-                project = self.prjs_map[ds_name][self.projects_json_repo]
-            # if `projects_json_repo` (e.g., AOC study), use the
-            # method `get_project_repository` (defined in each enricher)
-            else:
                 repository = self.get_project_repository(eitem)
-                project = self.prjs_map[ds_name][repository]
-        # With the introduction of `projects_json_repo` the code in the
-        # except should be unreachable, and could be removed
-        except KeyError:
-            # logger.warning("Project not found for repository %s (data source: %s)", repository, ds_name)
+            key = (ds_name, self.filter_raw, repository, eitem.get('origin'))
+            project = self._projects_memo.get_or_call(
+                key, lambda: self.__find_project_fallback(index, eitem, repository))
+
+        if project == UNKNOWN_PROJECT:
             project = None
 
-            if self.filter_raw:
-                fltr = eitem['origin'] + ' --filter-raw=' + self.filter_raw
-                if ds_name in self.prjs_map and fltr in self.prjs_map[ds_name]:
-                    project = self.prjs_map[ds_name][fltr]
-            elif ds_name in self.prjs_map:
-                # this code is executed to retrieve the project of private repositories (in particular Git ones)
-                # the URLs in the prjs_map are retrieved, anonymized and compared with the value
-                # returned by `get_project_repository`
-                repository = self.get_project_repository(eitem)
-                for r in self.prjs_map[ds_name]:
-                    anonymized_repo = anonymize_url(r)
-                    if repository == anonymized_repo:
-                        project = self.prjs_map[ds_name][r]
-                        break
-
-            if project == UNKNOWN_PROJECT:
-                return None
-            if project:
-                return project
-
-            # Try to use always the origin in any case
-            if 'origin' in eitem:
-                if ds_name in self.prjs_map and eitem['origin'] in self.prjs_map[ds_name]:
-                    project = self.prjs_map[ds_name][eitem['origin']]
-                elif ds_name in self.prjs_map:
-                    # Try to find origin as part of the keys
-                    for ds_repo in self.prjs_map[ds_name]:
-                        ds_repo = str(ds_repo)  # discourse has category_id ints
-                        if eitem['origin'] in ds_repo:
-                            project = self.prjs_map[ds_name][ds_repo]
-                            break
+        return project
+
+    def __find_project_fallback(self, index, eitem, repository):
+        project = None
+
+        if self.filter_raw:
+            project = index.get(eitem['origin'] + ' --filter-raw=' + self.filter_raw)
+        else:
+            # this code is executed to retrieve the project of private repositories (in particular Git ones)
+            # the anonymized URLs in the prjs_map are compared with the value
+            # returned by `get_project_repository`
+            project = index.get_anonymized(repository)
 
         if project == UNKNOWN_PROJECT:
-            project = None
+            return None
+        if project:
+            return project
+
+        # Try to use always the origin in any case
+        if 'origin' in eitem:
+            if eitem['origin'] in index:
+                project = index.get(eitem['origin'])
+            else:
+                # Try to find origin as part of the keys
+                project = index.find_substring(eitem['origin'])
 
         return project
 
@@ -580,20 +926,20 @@ class Enrich(ElasticItems):
         :param eitem: enriched item for which to find the project
         :return: a dictionary with the project data
         """
-        eitem_project = {}
-        project = self.find_item_project(eitem)
-
-        if project is None:
-            project = DEFAULT_PROJECT
+        found = self.find_item_project(eitem)
 
-        eitem_project = {"project": project}
-        # Time to add the project levels: eclipse.platform.releng.aggregator
-        eitem_project.update(self.add_project_levels(project))
+        # The project fields only depend on the project found
+        if found not in self._projects_fields_memo:
+            project = DEFAULT_PROJECT if found is None else found
 
-        # And now time to add the metadata
-        eitem_project.update(self.get_item_metadata(eitem))
+            eitem_project = {"project": project}
+            # Time to add the project levels: eclipse.platform.releng.aggregator
+            eitem_project.update(self.add_project_levels(project))
+            # And now time to add the metadata
+            eitem_project.update(self.__get_project_metadata(found))
+            self._projects_fields_memo[found] = eitem_project
 
-        return eitem_project
+        return dict(self._projects_fields_memo[found])
 
     def get_item_metadata(self, eitem):
         """
@@ -607,12 +953,14 @@ class Enrich(ElasticItems):
         :param eitem: enriched item to search metadata for
         :return: a dictionary with the metadata fields
         """
-
-        eitem_metadata = {}
-
         # Get the project entry for the item, which includes the metadata
         project = self.find_item_project(eitem)
 
+        return self.__get_project_metadata(project)
+
+    def __get_project_metadata(self, project):
+        eitem_metadata = {}
+
         if project and 'meta' in self.json_projects[project]:
             meta_fields = self.json_projects[project]['meta']
             if isinstance(meta_fields, dict):
@@ -778,7 +1126,7 @@ class Enrich(ElasticItems):
 
         return eitem_sh
 
-    @lru_cache(4096)
+    @cached('sh_items_by_id')
     def get_sh_item_from_id(self, sh_id):
         """Get all the identity information from SortingHat using the individual id"""
 
@@ -809,7 +1157,7 @@ class Enrich(ElasticItems):
         sh_item = self.get_sh_item_from_identity_cache(identity_tuple, backend_name)
         return sh_item
 
-    @lru_cache(4096)
+    @cached('sh_items_by_identity')
     def get_sh_item_from_identity_cache(self, identity_tuple, backend_name):
         """Get a SortingHat item with all the information related with an identity"""
         sh_item = {}
@@ -875,41 +1223,76 @@ class Enrich(ElasticItems):
     def get_sh_item_multi_enrollments(self, enrollments, item_date_str):
         """ Get the enrollments for the uuid when the item was done """
 
-        enrolls = []
         enrollments = enrollments if enrollments else []
+        names, starts, periods = self.get_enrollments_periods(enrollments)
 
-        if enrollments:
-            if item_date_str:
-                item_date = str_to_datetime(item_date_str)
-            else:
-                item_date = None
-
+        item_date = None
+        if enrollments and item_date_str:
+            item_date = parse_date(item_date_str)
             # item_date must be offset-naive (utc)
-            if item_date and item_date.tzinfo:
+            if item_date.tzinfo:
                 item_date = (item_date - item_date.utcoffset()).replace(tzinfo=None)
 
-        for enrollment in enrollments:
-            group = enrollment['group']
-            if not item_date:
-                if group['type'] == 'team' and group['parentOrg']:
-                    name = "{}::{}".format(group['parentOrg']['name'], group['name'])
-                else:
-                    name = group['name']
-                enrolls.append(name)
-            elif str_to_datetime(enrollment['start']).isoformat() <= item_date.isoformat() \
-                    <= str_to_datetime(enrollment['end']).isoformat():
-                if group['type'] == 'team' and group['parentOrg']:
-                    name = "{}::{}".format(group['parentOrg']['name'], group['name'])
-                else:
-                    name = group['name']
-                enrolls.append(name)
+        if not item_date:
+            enrolls = list(names)
+        else:
+            # The enrollments which start before the item are the first ones
+            timestamp = to_microseconds(item_date)
+            found = bisect.bisect_left(starts, timestamp)
+            positions = sorted(pos for _, end, pos in periods[:found] if timestamp <= end)
+            enrolls = [names[pos] for pos in positions]
+
         if not enrolls:
             enrolls.append(self.unaffiliated_group)
 
         return enrolls
 
+    @staticmethod
+    def get_enrollments_periods(enrollments):
+        """Get the names and periods of a list of enrollments.
+
+        The enrollments of a team are named `parentOrg::team`. The periods
+        are sorted by their start, and their dates are microseconds since
+        the epoch of the dates of the enrollments ignoring their offset,
+        as the dates of the items are compared with the ISO dates of the
+        enrollments. An item is in an enrollment when its date is after
+        the start and not after the end. The periods are cached with the
+        list of enrollments of the individual.
+
+        :param enrollments: list of enrollments of an individual
+        :returns: tuple with the names of the enrollments, the starts of
+            the periods and the periods (start, end, position of the
+            enrollment in the list)
+        """
+        cache = get_cache('sh_enrollments_periods')
+        entry = cache.get(id(enrollments))
+        if entry and entry[0] is enrollments:
+            return entry[1]
+
+        names = []
+        periods = []
+        for pos, enrollment in enumerate(enrollments):
+            group = enrollment['group']
+            if group['type'] == 'team' and group['parentOrg']:
+                name = "{}::{}".format(group['parentOrg']['name'], group['name'])
+            else:
+                name = group['name']
+            names.append(name)
+
+            start = to_microseconds(str_to_datetime(enrollment['start']).replace(tzinfo=None))
+            end = to_microseconds(str_to_datetime(enrollment['end']).replace(tzinfo=None))
+            periods.append((start, end, pos))
+
+        periods.sort()
+        result = (names, [period[0] for period in periods], periods)
+
+        # The enrollments are kept in the entry, so their id is not reused
+        cache.set(id(enrollments), (enrollments, result))
+        return result
+
     def get_item_sh_from_id(self, eitem, roles=None, individuals=None):
-        # Get the SH fields from the data in the enriched item
+        # Get the SH fields from the data in the enriched item.
+        # `individuals` can be a list or an index built with `index_individuals`
 
         eitem_sh = {}  # Item enriched
 
@@ -957,7 +1340,10 @@ class Enrich(ElasticItems):
         return eitem_sh
 
     def get_item_sh_meta_fields(self, eitem, roles=None, suffixes=None, non_authored_prefix=None, individuals=None):
-        """Get the SH meta fields from the data in the enriched item."""
+        """Get the SH meta fields from the data in the enriched item.
+
+        `individuals` can be a list or an index built with `index_individuals`.
+        """
 
         eitem_meta_sh = {}  # Item enriched
 
@@ -982,10 +1368,31 @@ class Enrich(ElasticItems):
 
         return eitem_meta_sh
 
+    @staticmethod
+    def index_individuals(individuals):
+        """Index a list of individuals by their mk and the uuids of their identities.
+
+        When an id belongs to several individuals, the first one is indexed.
+
+        :param individuals: list of SortingHat individuals
+
+        :returns: dict with the individual of each mk and identity uuid
+        """
+        index = {}
+        for indiv in individuals or []:
+            index.setdefault(indiv['mk'], indiv)
+            for identity in indiv['identities']:
+                index.setdefault(identity['uuid'], indiv)
+        return index
+
     @staticmethod
     def find_individual(individuals, sh_id):
+        """Find the individual of an id in a list or an index of individuals"""
+
         if not individuals:
             return None
+        if isinstance(individuals, dict):
+            return individuals.get(sh_id)
         for indiv in individuals:
             if sh_id == indiv['mk']:
                 return indiv
@@ -1106,23 +1513,97 @@ class Enrich(ElasticItems):
         args_without_empty = {k: v for k, v in args.items() if v}
         return generate_uuid(**args_without_empty)
 
-    @lru_cache(4096)
+    @cached('sh_entities')
     def get_entity(self, id):
-        return SortingHat.get_entity(self.sh_db, id)
+        if id in self.sh_entities:
+            return self.sh_entities[id]
+
+        if self.identities_cache:
+            entity = self.identities_cache.get(id)
+            if entity:
+                return entity
+
+        fetched_at = datetime_utcnow()
+        entity = SortingHat.get_entity(self.sh_db, id)
+        if entity and self.identities_cache:
+            self.identities_cache.add([entity], fetched_at=fetched_at)
+        return entity
+
+    def prefetch_sh_entities(self, items):
+        """Retrieve the SortingHat individuals of the identities of a page of raw items.
+
+        The uuids of the identities found in the items which are not in
+        the shared `sh_entities` cache are read from the persistent cache
+        of individuals, when it is enabled, and the rest are resolved with
+        batched queries of `ENTITIES_BATCH_SIZE` identities. The individuals
+        found are stored in the shared cache too, so `get_entity` returns
+        them without querying SortingHat again, in this page or the next ones.
+        The individuals prefetched for the previous page are discarded.
+
+        :param items: list of raw items
+        """
+        self.sh_entities = {}
+
+        if not self.sortinghat or not self.sh_db:
+            return
+
+        with self.enrich_stats.timer('identities', len(items)):
+            self.__prefetch_sh_entities(items)
+
+    def __prefetch_sh_entities(self, items):
+        backend_name = self.get_sh_backend_name()
+        uuids = set()
+        try:
+            for item in items:
+                for identity in self.get_identities(item):
+                    if not identity:
+                        continue
+                    email, name, username = identity.get('email'), identity.get('name'), identity.get('username')
+                    if not email and not name and not username:
+                        continue
+                    uuids.add(self.generate_uuid(backend_name, email=email, name=name, username=username))
+        except NotImplementedError:
+            return
+
+        # The individuals already resolved by `get_entity` are not requested
+        cache = get_cache('sh_entities')
+        uuids = {uuid for uuid in uuids if (uuid,) not in cache}
+
+        if self.identities_cache:
+            entities = self.identities_cache.get_many(uuids)
+            self.sh_entities.update(entities)
+            for uuid, entity in entities.items():
+                cache.set((uuid,), entity)
+            uuids -= entities.keys()
+
+        uuids = sorted(uuids)
+        for i in range(0, len(uuids), ENTITIES_BATCH_SIZE):
+            try:
+                fetched_at = datetime_utcnow()
+                entities = SortingHat.get_entities(self.sh_db, uuids[i:i + ENTITIES_BATCH_SIZE])
+                self.sh_entities.update(entities)
+                for uuid, entity in entities.items():
+                    cache.set((uuid,), entity)
+                if self.identities_cache:
+                    self.identities_cache.add(entities.values(), fetched_at=fetched_at)
+            except Exception as ex:
+                logger.warning("[sortinghat] Error prefetching {} individuals, they will be retrieved "
+                               "one by one: {}".format(len(uuids), ex))
+                break
 
-    @lru_cache(4096)
+    @cached('sh_bots')
     def is_bot(self, uuid):
         return SortingHat.is_bot(self.sh_db, uuid)
 
-    @lru_cache(4096)
+    @cached('sh_enrollments')
     def get_enrollments(self, uuid):
         return SortingHat.get_enrollments(self.sh_db, uuid)
 
-    @lru_cache(4096)
+    @cached('sh_unique_identities')
     def get_unique_identity(self, uuid):
         return SortingHat.get_unique_identity(self.sh_db, uuid)
 
-    @lru_cache(4096)
+    @cached('sh_uuids')
     def get_uuid_from_id(self, sh_id):
         """ Get the SH identity uuid from the id """
         return SortingHat.get_uuid_from_id(self.sh_db, sh_id)
@@ -1131,7 +1612,7 @@ class Enrich(ElasticItems):
         SortingHat.add_identities(self.sh_db, identities,
                                   self.get_sh_backend_name())
 
-    @lru_cache(4096)
+    @cached('sh_identities_added', key=lambda self: self.get_sh_backend_name())
     def add_sh_identity_cache(self, identity_tuple):
         """Cache add_sh_identity calls. Identity must be in tuple format"""
 
@@ -1164,9 +1645,8 @@ class Enrich(ElasticItems):
         logger.info("{}  starting study - Input: {} Output: {}".format(log_prefix, in_index, new_index))
 
         # Creating connections
-        es = ES([enrich_backend.elastic.url], retry_on_timeout=True, timeout=100,
-                verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                ssl_show_warn=self.elastic.requests.verify)
+        es = get_es_client(enrich_backend.elastic.url, insecure=not self.elastic.requests.verify,
+                           retry_on_timeout=True, timeout=100)
 
         in_conn = ESOnionConnector(es_conn=es, es_index=in_index,
                                    contribs_field=contribs_field,
@@ -1519,9 +1999,8 @@ class Enrich(ElasticItems):
         log_prefix = "[{}] Geolocation".format(data_source)
         logger.info("{} starting study {}".format(log_prefix, anonymize_url(self.elastic.index_url)))
 
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
 
         query_locations_no_geo_points = """
@@ -1624,9 +2103,8 @@ class Enrich(ElasticItems):
         """
         logger.info("[enrich-forecast-activity] Start study")
 
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
 
         unique_repos = es_in.search(
@@ -2240,9 +2718,8 @@ class Enrich(ElasticItems):
         logger.info("[enrich-feelings] Start study on {} with data from {}".format(
             anonymize_url(self.elastic.index_url), nlp_rest_url))
 
-        es = ES([self.elastic_url], timeout=3600, max_retries=50, retry_on_timeout=True,
-                verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                ssl_show_warn=self.elastic.requests.verify)
+        es = get_es_client(self.elastic_url, insecure=not self.elastic.requests.verify,
+                           timeout=3600, max_retries=50, retry_on_timeout=True)
         search_fields = [attr for attr in attributes]
         search_fields.extend([uuid_field])
         page = es.search(index=enrich_backend.elastic.index,
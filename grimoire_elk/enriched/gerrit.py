@@ -23,12 +23,12 @@
 
 import logging
 
+from .dates import parse_date
 from .enrich import Enrich, metadata
 from .utils import get_time_diff_days
 from ..elastic_mapping import Mapping as BaseMapping
 
-from grimoirelab_toolkit.datetime import (str_to_datetime,
-                                          datetime_utcnow,
+from grimoirelab_toolkit.datetime import (datetime_utcnow,
                                           unixtime_to_datetime)
 
 
@@ -247,14 +247,14 @@ class GerritEnrich(Enrich):
         eitem['changeset_status_value_verified'] = status_value_verified
         eitem['changeset_status'] = eitem['status']
 
-        created_on_date = str_to_datetime(created_on)
+        created_on_date = parse_date(created_on)
         eitem["created_on"] = created_on
 
         time_first_review = self.get_time_first_review(review)
         eitem['time_to_first_review'] = get_time_diff_days(created_on, time_first_review)
 
         eitem["last_updated"] = review['lastUpdated']
-        last_updated_date = str_to_datetime(review['lastUpdated'])
+        last_updated_date = parse_date(review['lastUpdated'])
 
         seconds_day = float(60 * 60 * 24)
         if eitem['status'] in ['MERGED', 'ABANDONED']:
@@ -315,7 +315,7 @@ class GerritEnrich(Enrich):
                         ecomment["reviewer_domain"] = comment['reviewer']['email'].split("@")[1]
 
             # Add comment-specific data
-            created = str_to_datetime(comment['timestamp'])
+            created = parse_date(comment['timestamp'])
             ecomment['comment_created_on'] = created.isoformat()
             ecomment['comment_message'] = comment['message'][:self.KEYWORD_MAX_LENGTH]
             ecomment['comment_message_analyzed'] = comment['message']
@@ -399,7 +399,7 @@ class GerritEnrich(Enrich):
                         epatchset["patchset_uploader_domain"] = patchset['uploader']['email'].split("@")[1]
 
             # Add patchset-specific data
-            created = str_to_datetime(patchset['createdOn'])
+            created = parse_date(patchset['createdOn'])
             epatchset['patchset_created_on'] = created.isoformat()
             epatchset['patchset_number'] = patchset['number']
             epatchset['patchset_isDraft'] = patchset.get('isDraft', None)
@@ -479,7 +479,7 @@ class GerritEnrich(Enrich):
                         eapproval["approval_author_domain"] = approval['by']['email'].split("@")[1]
 
             # Add approval-specific data
-            created = str_to_datetime(approval['grantedOn'])
+            created = parse_date(approval['grantedOn'])
             eapproval['approval_granted_on'] = created.isoformat()
             eapproval['approval_value'] = approval.get('value', None)
             eapproval['approval_type'] = approval.get('type', None)
@@ -552,7 +552,7 @@ class GerritEnrich(Enrich):
         patchset_author = patchset.get('author', None)
         patchset_author_username = patchset_author.get('username', None) if patchset_author else None
         patchset_author_email = patchset_author.get('email', None) if patchset_author else None
-        patchset_created_on = str_to_datetime(patchset['createdOn']).isoformat()
+        patchset_created_on = parse_date(patchset['createdOn']).isoformat()
 
         first_review = None
 
@@ -562,7 +562,7 @@ class GerritEnrich(Enrich):
             if approval['type'] != CODE_REVIEW_TYPE:
                 continue
 
-            approval_granted_on = str_to_datetime(approval['grantedOn']).isoformat()
+            approval_granted_on = parse_date(approval['grantedOn']).isoformat()
             if approval_granted_on < patchset_created_on:
                 continue
 
@@ -590,7 +590,7 @@ class GerritEnrich(Enrich):
         changeset_owner = review.get('owner', None)
         changeset_owner_username = changeset_owner.get('username', None) if changeset_owner else None
         changeset_owner_email = changeset_owner.get('email', None) if changeset_owner else None
-        changeset_created_on = str_to_datetime(review['createdOn']).isoformat()
+        changeset_created_on = parse_date(review['createdOn']).isoformat()
 
         first_review = None
 
@@ -603,7 +603,7 @@ class GerritEnrich(Enrich):
                 if approval['type'] != CODE_REVIEW_TYPE:
                     continue
 
-                approval_granted_on = str_to_datetime(approval['grantedOn']).isoformat()
+                approval_granted_on = parse_date(approval['grantedOn']).isoformat()
                 if approval_granted_on < changeset_created_on:
                     continue
 
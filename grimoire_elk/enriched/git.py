@@ -21,28 +21,27 @@
 #   Quan`Zhou <quan@bitergia.com>
 #
 
+import collections
 import json
 import logging
 import re
-import sys
 
 from importlib.resources import files
 
 import requests
-from opensearchpy import OpenSearch, RequestsHttpConnection
 
 from grimoirelab_toolkit.datetime import (datetime_to_utc,
-                                          str_to_datetime,
                                           datetime_utcnow)
 from perceval.backends.core.git import (GitCommand,
                                         GitRepository,
                                         EmptyRepositoryError,
                                         RepositoryError)
-from .enrich import Enrich, metadata
+from .dates import get_date_parts, parse_date
+from .enrich import Enrich, metadata, PHASE_IDENTITIES, PHASE_ENRICHMENT, PHASE_UPDATE_ITEMS
 from .study_ceres_aoc import areas_of_code, ESPandasConnector
 from ..elastic_mapping import Mapping as BaseMapping
 from ..elastic_items import HEADER_JSON, MAX_BULK_UPDATE_SIZE
-from .utils import anonymize_url
+from .utils import anonymize_url, get_es_client
 
 GITHUB = 'https://github.com/'
 DEMOGRAPHY_COMMIT_MIN_DATE = '1980-01-01'
@@ -76,6 +75,13 @@ class GitEnrich(Enrich):
 
     mapping = Mapping
 
+    # The identities are in the Author, Commit and Signed-off-by fields, and
+    # the commits removed are found using only their hashes
+    raw_fields = {
+        PHASE_IDENTITIES: ["data.Author", "data.Commit", "data.Signed-off-by"],
+        PHASE_UPDATE_ITEMS: ["data.commit"]
+    }
+
     # REGEX to extract authors from a multi author commit: several authors present
     # in the Author field in the commit. Used if self.pair_programming is True
     AUTHOR_P2P_REGEX = re.compile(r'(?P<first_authors>.* .*) ([aA][nN][dD]|&|\+) (?P<last_author>.* .*) (?P<email>.*)')
@@ -239,26 +245,26 @@ class GitEnrich(Enrich):
         author_date = self.__cast_str_to_datetime(commit, 'AuthorDate')
         commit_date = self.__cast_str_to_datetime(commit, 'CommitDate')
 
-        eitem["author_date"] = author_date.replace(tzinfo=None).isoformat()
-        eitem["commit_date"] = commit_date.replace(tzinfo=None).isoformat()
+        author_parts = get_date_parts(author_date)
+        commit_parts = get_date_parts(commit_date)
 
-        eitem["author_date_weekday"] = author_date.replace(tzinfo=None).isoweekday()
-        eitem["author_date_hour"] = author_date.replace(tzinfo=None).hour
+        eitem["author_date"] = author_parts.isoformat
+        eitem["commit_date"] = commit_parts.isoformat
 
-        eitem["commit_date_weekday"] = commit_date.replace(tzinfo=None).isoweekday()
-        eitem["commit_date_hour"] = commit_date.replace(tzinfo=None).hour
+        eitem["author_date_weekday"] = author_parts.weekday
+        eitem["author_date_hour"] = author_parts.hour
 
-        utc_author_date = datetime_to_utc(author_date)
-        utc_commit_date = datetime_to_utc(commit_date)
+        eitem["commit_date_weekday"] = commit_parts.weekday
+        eitem["commit_date_hour"] = commit_parts.hour
 
-        eitem["utc_author"] = utc_author_date.replace(tzinfo=None).isoformat()
-        eitem["utc_commit"] = utc_commit_date.replace(tzinfo=None).isoformat()
+        eitem["utc_author"] = author_parts.utc_isoformat
+        eitem["utc_commit"] = commit_parts.utc_isoformat
 
-        eitem["utc_author_date_weekday"] = utc_author_date.replace(tzinfo=None).isoweekday()
-        eitem["utc_author_date_hour"] = utc_author_date.replace(tzinfo=None).hour
+        eitem["utc_author_date_weekday"] = author_parts.utc_weekday
+        eitem["utc_author_date_hour"] = author_parts.utc_hour
 
-        eitem["utc_commit_date_weekday"] = utc_commit_date.replace(tzinfo=None).isoweekday()
-        eitem["utc_commit_date_hour"] = utc_commit_date.replace(tzinfo=None).hour
+        eitem["utc_commit_date_weekday"] = commit_parts.utc_weekday
+        eitem["utc_commit_date_hour"] = commit_parts.utc_hour
 
         eitem["tz"] = int(author_date.strftime("%z")[0:3])
         eitem["branches"] = []
@@ -344,7 +350,7 @@ class GitEnrich(Enrich):
     def __cast_str_to_datetime(self, item, attribute):
         """Convert str to datetime fixing possible errors"""
 
-        field_date = str_to_datetime(item[attribute])
+        field_date = parse_date(item[attribute])
 
         try:
             _ = int(field_date.strftime("%z")[0:3])
@@ -476,118 +482,96 @@ class GitEnrich(Enrich):
             "message": "Enable users to pass flags\n\nCo-authored-by: mariiapunda <mariiapunda@users.noreply.github.com>",
         Co-authored commits like these are not considered as multiauthored commits in ELK.
         """
-        headers = {"Content-Type": "application/json"}
-
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        total = 0
-        bulk_json = ""
-
-        total_signed_off = 0
-        total_multi_author = 0
+        self.enrich_counters = collections.Counter()
 
         url = self.elastic.get_bulk_url()
 
-        logger.debug("[git] Adding items to {} (in {} packs)".format(anonymize_url(url), max_items))
-        items = ocean_backend.fetch()
-
-        for item in items:
-            if self.pair_programming:
-                # First we need to add the authors field to all commits
-                # Check multi author
-                m = self.AUTHOR_P2P_REGEX.match(item['data']['Author'])
-                n = self.AUTHOR_P2P_NEW_REGEX.match(item['data']['Author'])
-                if m or n:
-                    logger.debug("[git] Multiauthor detected. Creating one commit "
-                                 "per author: {}".format(item['data']['Author']))
-                    item['data']['authors'] = self.__get_authors(item['data']['Author'])
-                    item['data']['Author'] = item['data']['authors'][0]
-                    item['data']['is_git_commit_multi_author'] = 1
-                m = self.AUTHOR_P2P_REGEX.match(item['data']['Commit'])
-                n = self.AUTHOR_P2P_NEW_REGEX.match(item['data']['Author'])
-                if m or n:
-                    logger.debug("[git] Multicommitter detected: using just the first committer")
-                    item['data']['committers'] = self.__get_authors(item['data']['Commit'])
-                    item['data']['Commit'] = item['data']['committers'][0]
-                # Add the authors list using the original Author and the Signed-off list
-                if 'Signed-off-by' in item['data']:
-                    authors_all = item['data']['Signed-off-by'] + [item['data']['Author']]
-                    item['data']['authors_signed_off'] = list(set(authors_all))
-
-            if current >= max_items:
-                try:
-                    total += self.elastic.safe_put_bulk(url, bulk_json)
-                    json_size = sys.getsizeof(bulk_json) / (1024 * 1024)
-                    logger.debug("[git] Added {} items to {} ({:.2f} MB)".format(
-                                 total, anonymize_url(url), json_size))
-                except UnicodeEncodeError:
-                    # Why is requests encoding the POST data as ascii?
-                    logger.warning("[git] Unicode error in enriched items, converting to ascii")
-                    safe_json = str(bulk_json.encode('ascii', 'ignore'), 'ascii')
-                    total += self.elastic.safe_put_bulk(url, safe_json)
-                bulk_json = ""
-                current = 0
-
-            rich_item = self.get_rich_item(item)
-            data_json = json.dumps(rich_item)
-            unique_field = self.get_field_unique_id()
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % (rich_item[unique_field])
-            bulk_json += data_json + "\n"  # Bulk document
-            current += 1
-
-            if self.pair_programming:
-                # Multi author support
-                if 'authors' in item['data']:
-                    # First author already added in the above commit
-                    authors = item['data']['authors']
-                    for i in range(1, len(authors)):
-                        # logger.debug('Adding a new commit for %s', authors[i])
-                        item['data']['Author'] = authors[i]
-                        item['data']['is_git_commit_multi_author'] = 1
-                        rich_item = self.get_rich_item(item)
-                        commit_id = item["uuid"] + "_" + str(i - 1)
-                        rich_item['git_uuid'] = commit_id
-                        data_json = json.dumps(rich_item)
-                        bulk_json += '{"index" : {"_id" : "%s" } }\n' % rich_item['git_uuid']
-                        bulk_json += data_json + "\n"  # Bulk document
-                        current += 1
-                        total_multi_author += 1
-
-                if rich_item['Signed-off-by_number'] > 0:
-                    nsg = 0
-                    # Remove duplicates and the already added Author if exists
-                    authors = list(set(item['data']['Signed-off-by']))
-                    if item['data']['Author'] in authors:
-                        authors.remove(item['data']['Author'])
-                    for author in authors:
-                        # logger.debug('Adding a new commit for %s', author)
-                        # Change the Author in the original commit and generate
-                        # a new enriched item with it
-                        item['data']['Author'] = author
-                        item['data']['is_git_commit_signed_off'] = 1
-                        rich_item = self.get_rich_item(item)
-                        commit_id = item["uuid"] + "_" + str(nsg)
-                        rich_item['git_uuid'] = commit_id
-                        data_json = json.dumps(rich_item)
-                        bulk_json += '{"index" : {"_id" : "%s" } }\n' % rich_item['git_uuid']
-                        bulk_json += data_json + "\n"  # Bulk document
-                        current += 1
-                        total_signed_off += 1
-                        nsg += 1
-
-        if current > 0:
-            total += self.elastic.safe_put_bulk(url, bulk_json)
+        logger.debug("[git] Adding items to {} (in {} packs)".format(anonymize_url(url), self.elastic.max_items_bulk))
+        items = ocean_backend.fetch(_source=self.get_raw_source(PHASE_ENRICHMENT))
+
+        total = self.upload_rich_items(items)
 
         if total == 0:
             # No items enriched, nothing to upload to ES
             return total
 
         if self.pair_programming:
-            logger.info("[git] Signed-off commits generated: {}".format(total_signed_off))
-            logger.info("[git] Multi author commits generated: {}".format(total_multi_author))
+            logger.info("[git] Signed-off commits generated: {}".format(self.enrich_counters['signed_off']))
+            logger.info("[git] Multi author commits generated: {}".format(self.enrich_counters['multi_author']))
 
         return total
 
+    def enrich_item(self, item, events=False):
+        """Enrich a commit, generating a rich item for every author and
+        signer of the commit when pair programming is enabled.
+
+        :param item: raw item of the commit
+        :param events: not used, git has no events
+
+        :returns: list of tuples with the id and the rich items
+        """
+        if self.pair_programming:
+            # First we need to add the authors field to all commits
+            # Check multi author
+            m = self.AUTHOR_P2P_REGEX.match(item['data']['Author'])
+            n = self.AUTHOR_P2P_NEW_REGEX.match(item['data']['Author'])
+            if m or n:
+                logger.debug("[git] Multiauthor detected. Creating one commit "
+                             "per author: {}".format(item['data']['Author']))
+                item['data']['authors'] = self.__get_authors(item['data']['Author'])
+                item['data']['Author'] = item['data']['authors'][0]
+                item['data']['is_git_commit_multi_author'] = 1
+            m = self.AUTHOR_P2P_REGEX.match(item['data']['Commit'])
+            n = self.AUTHOR_P2P_NEW_REGEX.match(item['data']['Author'])
+            if m or n:
+                logger.debug("[git] Multicommitter detected: using just the first committer")
+                item['data']['committers'] = self.__get_authors(item['data']['Commit'])
+                item['data']['Commit'] = item['data']['committers'][0]
+            # Add the authors list using the original Author and the Signed-off list
+            if 'Signed-off-by' in item['data']:
+                authors_all = item['data']['Signed-off-by'] + [item['data']['Author']]
+                item['data']['authors_signed_off'] = list(set(authors_all))
+
+        rich_item = self.get_rich_item(item)
+        unique_field = self.get_field_unique_id()
+        rich_items = [(rich_item[unique_field], rich_item)]
+
+        if self.pair_programming:
+            # Multi author support
+            if 'authors' in item['data']:
+                # First author already added in the above commit
+                authors = item['data']['authors']
+                for i in range(1, len(authors)):
+                    # logger.debug('Adding a new commit for %s', authors[i])
+                    item['data']['Author'] = authors[i]
+                    item['data']['is_git_commit_multi_author'] = 1
+                    rich_item = self.get_rich_item(item)
+                    commit_id = item["uuid"] + "_" + str(i - 1)
+                    rich_item['git_uuid'] = commit_id
+                    rich_items.append((rich_item['git_uuid'], rich_item))
+                    self.enrich_counters['multi_author'] += 1
+
+            if rich_item['Signed-off-by_number'] > 0:
+                nsg = 0
+                # Remove duplicates and the already added Author if exists
+                authors = list(set(item['data']['Signed-off-by']))
+                if item['data']['Author'] in authors:
+                    authors.remove(item['data']['Author'])
+                for author in authors:
+                    # logger.debug('Adding a new commit for %s', author)
+                    # Change the Author in the original commit and generate
+                    # a new enriched item with it
+                    item['data']['Author'] = author
+                    item['data']['is_git_commit_signed_off'] = 1
+                    rich_item = self.get_rich_item(item)
+                    commit_id = item["uuid"] + "_" + str(nsg)
+                    rich_item['git_uuid'] = commit_id
+                    rich_items.append((rich_item['git_uuid'], rich_item))
+                    self.enrich_counters['signed_off'] += 1
+                    nsg += 1
+
+        return rich_items
+
     def enrich_demography(self, ocean_backend, enrich_backend, alias, date_field="grimoire_creation_date",
                           author_field="author_uuid"):
 
@@ -604,14 +588,10 @@ class GitEnrich(Enrich):
         logger.info("{} Starting study - Input: {} Output: {}".format(log_prefix, in_index, out_index))
 
         # Creating connections
-        es_in = OpenSearch([ocean_backend.elastic.url], retry_on_timeout=True, timeout=100,
-                           verify_certs=self.elastic.requests.verify,
-                           ssl_show_warn=self.elastic.requests.verify,
-                           connection_class=RequestsHttpConnection)
-        es_out = OpenSearch([enrich_backend.elastic.url], retry_on_timeout=True,
-                            timeout=100, verify_certs=self.elastic.requests.verify,
-                            ssl_show_warn=self.elastic.requests.verify,
-                            connection_class=RequestsHttpConnection)
+        es_in = get_es_client(ocean_backend.elastic.url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
+        es_out = get_es_client(enrich_backend.elastic.url, insecure=not self.elastic.requests.verify,
+                               retry_on_timeout=True, timeout=100)
         in_conn = ESPandasConnector(es_conn=es_in, es_index=in_index, sort_on_field=sort_on_field)
         out_conn = ESPandasConnector(es_conn=es_out, es_index=out_index, sort_on_field=sort_on_field, read_only=False)
 
@@ -751,7 +731,8 @@ class GitEnrich(Enrich):
         }
 
         raw_hashes = set([item['data']['commit']
-                          for item in ocean_backend.fetch(ignore_incremental=True, _filter=fltr)])
+                          for item in ocean_backend.fetch(ignore_incremental=True, _filter=fltr, ordered=False,
+                                                          _source=self.get_raw_source(PHASE_UPDATE_ITEMS))])
         aoc_hashes = set(self.get_unique_hashes_aoc(es_aoc, index_aoc, repository))
 
         hashes_to_delete = list(aoc_hashes.difference(raw_hashes))
@@ -835,13 +816,44 @@ class GitEnrich(Enrich):
             return current_hashes
 
         current_hashes = set(current_hashes)
-        raw_hashes = set([item['data']['commit']
-                          for item in ocean_backend.fetch(ignore_incremental=True, _filter=fltr)])
+        raw_hashes = self.get_commits_origin_raw(ocean_backend, fltr)
 
-        hashes_to_delete = list(raw_hashes.difference(current_hashes))
+        hashes_to_delete = [_hash for _hash in raw_hashes if _hash not in current_hashes]
 
         return hashes_to_delete
 
+    def get_commits_origin_raw(self, ocean_backend, fltr):
+        """Return the commit hashes of an origin stored in the raw index.
+
+        When the raw backend keeps a store of the commits fed, the hashes
+        are read from it if it has as many commits as documents has the
+        origin in the raw index. Otherwise, the documents of the origin
+        are scanned and the store is replaced with their hashes.
+
+        :param ocean_backend: Ocean backend
+        :param fltr: filter of the documents of the origin
+        """
+        store = ocean_backend.get_commits_store()
+        if store:
+            stored = store.load()
+            if stored is not None:
+                count = ocean_backend.elastic.count_documents([{'name': fltr['name'], 'value': fltr['value'][0]}])
+                if count == len(stored):
+                    logger.debug("[git] update-items {} commits read from the commits store for {}".format(
+                                 count, fltr['value'][0]))
+                    return stored
+                logger.debug("[git] update-items commits store outdated for {}: {} commits, {} raw items".format(
+                             fltr['value'][0], len(stored), count))
+
+        raw_hashes = set([item['data']['commit']
+                          for item in ocean_backend.fetch(ignore_incremental=True, _filter=fltr, ordered=False,
+                                                          _source=self.get_raw_source(PHASE_UPDATE_ITEMS))])
+
+        if store:
+            store.save(raw_hashes)
+
+        return raw_hashes
+
     def update_items(self, ocean_backend, enrich_backend):
         """Retrieve the commits not present in the original repository and delete
         the corresponding documents from the raw and enriched indexes"""
@@ -850,6 +862,10 @@ class GitEnrich(Enrich):
         logger.debug("[git] update-items Checking commits for {}.".format(repo_origin))
         hashes_to_delete = self.get_diff_commits_origin_raw(ocean_backend)
 
+        # The raw store of the origin would still have the deleted commits
+        if hashes_to_delete:
+            ocean_backend.invalidate_raw_store()
+
         to_process = []
         for _hash in hashes_to_delete:
             to_process.append(_hash)
@@ -870,6 +886,10 @@ class GitEnrich(Enrich):
             # delete documents from the enriched index
             self.remove_commits(to_process, enrich_backend.elastic.index_url, 'hash', repo_origin)
 
+        store = ocean_backend.get_commits_store()
+        if store and hashes_to_delete:
+            store.remove(hashes_to_delete)
+
         logger.debug("[git] update-items {} commits deleted from {} with origin {}.".format(
                      len(hashes_to_delete), anonymize_url(ocean_backend.elastic.index_url),
                      repo_origin))
@@ -31,12 +31,11 @@ from dateutil.relativedelta import relativedelta
 from datetime import datetime
 
 from grimoire_elk.elastic import ElasticSearch
-from grimoirelab_toolkit.datetime import (datetime_utcnow,
-                                          str_to_datetime)
+from grimoirelab_toolkit.datetime import datetime_utcnow
 
-from opensearchpy import OpenSearch as ES, RequestsHttpConnection
 
-from .utils import get_time_diff_days
+from .dates import parse_date
+from .utils import get_es_client, get_time_diff_days
 
 from .enrich import Enrich, metadata, anonymize_url
 from ..elastic_mapping import Mapping as BaseMapping
@@ -176,9 +175,9 @@ class GitHubEnrich(Enrich):
         """Get the first date at which a comment or reaction was made to the issue by someone
         other than the user who created the issue
         """
-        comment_dates = [str_to_datetime(comment['created_at']) for comment in item['comments_data']
+        comment_dates = [parse_date(comment['created_at']) for comment in item['comments_data']
                          if item['user']['login'] != comment['user']['login']]
-        reaction_dates = [str_to_datetime(reaction['created_at']) for reaction in item['reactions_data']
+        reaction_dates = [parse_date(reaction['created_at']) for reaction in item['reactions_data']
                           if item['user']['login'] != reaction['user']['login']]
         reaction_dates.extend(comment_dates)
         if reaction_dates:
@@ -199,7 +198,7 @@ class GitHubEnrich(Enrich):
             if item['user']['login'] == comment['user']['login']:
                 continue
 
-            review_dates.append(str_to_datetime(comment['created_at']))
+            review_dates.append(parse_date(comment['created_at']))
 
         if review_dates:
             return min(review_dates)
@@ -209,7 +208,7 @@ class GitHubEnrich(Enrich):
     def get_latest_comment_date(self, item):
         """Get the date of the latest comment on the issue/pr"""
 
-        comment_dates = [str_to_datetime(comment['created_at']) for comment in item['comments_data']]
+        comment_dates = [parse_date(comment['created_at']) for comment in item['comments_data']]
         if comment_dates:
             return max(comment_dates)
         return None
@@ -413,7 +412,7 @@ class GitHubEnrich(Enrich):
             pull_request["_item_id"] = pull_request_data['_id']
 
             # Add the necessary fields
-            reaction_time = get_time_diff_days(str_to_datetime(issue['created_at']),
+            reaction_time = get_time_diff_days(parse_date(issue['created_at']),
                                                self.get_time_to_first_attention(issue))
             if not reaction_time:
                 reaction_time = 0
@@ -424,7 +423,7 @@ class GitHubEnrich(Enrich):
             pull_request['num_comments'] = issue['comments']
 
             # should latest reviews be considered as well?
-            pull_request['pr_comment_duration'] = get_time_diff_days(str_to_datetime(issue['created_at']),
+            pull_request['pr_comment_duration'] = get_time_diff_days(parse_date(issue['created_at']),
                                                                      self.get_latest_comment_date(issue))
             pull_request['pr_comment_diversity'] = self.get_num_commenters(issue)
 
@@ -527,7 +526,7 @@ class GitHubEnrich(Enrich):
         if pull_request['review_comments'] != 0:
             min_review_date = self.get_time_to_merge_request_response(pull_request)
             rich_pr['time_to_merge_request_response'] = \
-                get_time_diff_days(str_to_datetime(pull_request['created_at']), min_review_date)
+                get_time_diff_days(parse_date(pull_request['created_at']), min_review_date)
 
         if self.prjs_map:
             rich_pr.update(self.get_item_project(rich_pr))
@@ -628,7 +627,7 @@ class GitHubEnrich(Enrich):
         rich_issue['time_to_first_attention'] = None
         if issue['comments'] + issue['reactions']['total_count'] != 0:
             rich_issue['time_to_first_attention'] = \
-                get_time_diff_days(str_to_datetime(issue['created_at']),
+                get_time_diff_days(parse_date(issue['created_at']),
                                    self.get_time_to_first_attention(issue))
 
         rich_issue.update(self.get_grimoire_fields(issue['created_at'], "issue"))
@@ -682,7 +681,7 @@ class GitHubEnrich(Enrich):
         return evolution_item
 
     def __get_opened_issues(self, es_in, in_index, repository_url, date, interval, other, label, reduced_labels):
-        next_date = (str_to_datetime(date).replace(tzinfo=None)
+        next_date = (parse_date(date).replace(tzinfo=None)
                      + relativedelta(days=interval)
                      ).strftime('%Y-%m-%dT%H:%M:%S.000Z')
         if other:
@@ -707,8 +706,8 @@ class GitHubEnrich(Enrich):
             )['hits']['hits']
 
         return list(map(lambda i: get_time_diff_days(
-                        str_to_datetime(i['_source']['created_at']),
-                        str_to_datetime(next_date)
+                        parse_date(i['_source']['created_at']),
+                        parse_date(next_date)
                         ), issues)
                     )
 
@@ -762,9 +761,8 @@ class GitHubEnrich(Enrich):
         map_label = dict(zip([""] + reduced_labels, map_label))
 
         # connect to ES
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
 
         # get all repositories
@@ -811,7 +809,7 @@ class GitHubEnrich(Enrich):
                 # complete until today (no ES request needed, just extrapol)
                 today = datetime.now().replace(hour=0, minute=0, second=0, tzinfo=None)
                 last_item = evolution_item
-                last_date = str_to_datetime(
+                last_date = parse_date(
                     evolution_item['study_creation_date']).replace(tzinfo=None) \
                     + relativedelta(days=interval_days)
                 average_opened_time = evolution_item['average_opened_time'] \
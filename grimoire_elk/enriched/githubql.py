@@ -24,10 +24,9 @@
 import logging
 import re
 
-from opensearchpy import OpenSearch as ES, RequestsHttpConnection
 
 from .enrich import Enrich, metadata
-from .utils import anonymize_url, get_time_diff_days
+from .utils import anonymize_url, get_es_client, get_time_diff_days
 from ..elastic_mapping import Mapping as BaseMapping
 
 GITHUB = 'https://github.com/'
@@ -352,9 +351,8 @@ class GitHubQLEnrich(Enrich):
         log_prefix = "[{}] Duration analysis".format(data_source)
         logger.info("{} starting study {}".format(log_prefix, anonymize_url(self.elastic.index_url)))
 
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
 
         # get all start events that don't have the attribute `duration_from_previous_event`
@@ -676,9 +674,8 @@ class GitHubQLEnrich(Enrich):
         log_prefix = "[{}] Cross reference analysis".format(data_source)
         logger.info("{} starting study {}".format(log_prefix, anonymize_url(self.elastic.index_url)))
 
-        es_in = ES([enrich_backend.elastic_url], retry_on_timeout=True, timeout=100,
-                   verify_certs=self.elastic.requests.verify, connection_class=RequestsHttpConnection,
-                   ssl_show_warn=self.elastic.requests.verify)
+        es_in = get_es_client(enrich_backend.elastic_url, insecure=not self.elastic.requests.verify,
+                              retry_on_timeout=True, timeout=100)
         in_index = enrich_backend.elastic.index
 
         # Get all the merged pull requests from MergedEvents
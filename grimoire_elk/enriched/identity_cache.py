@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Persistent cache of the SortingHat individuals shared by the enrichers of a host"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from grimoirelab_toolkit.datetime import datetime_utcnow, str_to_datetime
+
+logger = logging.getLogger(__name__)
+
+IDENTITIES_CACHE_FILE = "identities.db"
+SQLITE_TIMEOUT = 60  # seconds waiting for the lock of the database written by other processes
+SYNC_DONE_ID = 0
+SYNC_STARTED_ID = 1
+
+
+class IdentityCache:
+    """Cache of SortingHat individuals stored in a SQLite database.
+
+    The individuals are stored by the uuid of each of their identities
+    and by their main key (mk), so they can be found with any of them.
+    The database can be shared by several processes of the same host.
+
+    The cache is kept up to date with `sync`, which replaces the
+    individuals modified in SortingHat since the last time it was
+    synchronized. The individuals retrieved from SortingHat before
+    the last synchronization started are not added, because they
+    might be older than the ones it stored.
+
+    :param path: directory where the database is stored
+    """
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.db_path = os.path.join(path, IDENTITIES_CACHE_FILE)
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        with self._lock:
+            conn = self.__connect()
+            conn.execute("CREATE TABLE IF NOT EXISTS individuals "
+                         "(uuid TEXT PRIMARY KEY, mk TEXT NOT NULL, entity TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS individuals_mk ON individuals (mk)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sync (id INTEGER PRIMARY KEY, last_sync TEXT)")
+            conn.commit()
+
+    def __connect(self):
+        # SQLite connections can't be used after forking a process, so
+        # each process opens its own connection
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, uuid):
+        """Get the individual of an identity.
+
+        :param uuid: uuid of the identity or main key of the individual
+
+        :returns: the individual or None if it is not in the cache
+        """
+        with self._lock:
+            row = self.__connect().execute("SELECT entity FROM individuals WHERE uuid = ?", (uuid,)).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, uuids):
+        """Get the individuals of several identities.
+
+        :param uuids: list of uuids of identities
+
+        :returns: dict with the individuals found by uuid
+        """
+        uuids = list(uuids)
+        entities = {}
+
+        with self._lock:
+            conn = self.__connect()
+            for i in range(0, len(uuids), 500):
+                chunk = uuids[i:i + 500]
+                query = "SELECT uuid, entity FROM individuals WHERE uuid IN ({})".format(",".join("?" * len(chunk)))
+                for uuid, entity in conn.execute(query, chunk):
+                    entities[uuid] = json.loads(entity)
+
+        return entities
+
+    def add(self, entities, fetched_at=None):
+        """Add or replace individuals in the cache.
+
+        The rows of the individuals which had any of the identities of
+        each individual are removed, so the identities moved or merged
+        into other individuals don't return their old individuals. The
+        individuals retrieved before the start of the last synchronization
+        are not added.
+
+        :param entities: list of individuals as returned by SortingHat
+        :param fetched_at: date when the individuals were retrieved from
+            SortingHat; None for the ones found by `sync`
+        """
+        with self._lock:
+            conn = self.__connect()
+            with conn:
+                # The date of the last synchronization is checked in the same write
+                # transaction, so a synchronization can't start before the individuals are added
+                conn.execute("BEGIN IMMEDIATE")
+                if fetched_at and self.__is_outdated(conn, fetched_at):
+                    logger.debug("[sortinghat] Individuals retrieved before the last synchronization not cached")
+                    return
+
+                for entity in entities:
+                    if not entity:
+                        continue
+                    mk = entity['mk']
+                    data = json.dumps(entity)
+                    uuids = {identity['uuid'] for identity in entity.get('identities') or []}
+                    uuids.add(mk)
+                    params = list(uuids)
+                    query = ("DELETE FROM individuals WHERE mk = ? OR mk IN "
+                             "(SELECT mk FROM individuals WHERE uuid IN ({}))").format(",".join("?" * len(params)))
+                    conn.execute(query, [mk] + params)
+                    conn.executemany("INSERT OR REPLACE INTO individuals (uuid, mk, entity) VALUES (?, ?, ?)",
+                                     [(uuid, mk, data) for uuid in uuids])
+
+    @staticmethod
+    def __is_outdated(conn, fetched_at):
+        dates = [str_to_datetime(row[0]) for row in conn.execute("SELECT last_sync FROM sync") if row[0]]
+        return bool(dates) and max(dates) > fetched_at
+
+    def get_last_sync(self):
+        """Get the date when the cache was synchronized for the last time"""
+
+        with self._lock:
+            row = self.__connect().execute("SELECT last_sync FROM sync WHERE id = ?", (SYNC_DONE_ID,)).fetchone()
+
+        return str_to_datetime(row[0]) if row else None
+
+    def set_last_sync(self, date, started=False):
+        """Store the date of the last synchronization, or the one when
+        a synchronization started when `started` is set"""
+
+        with self._lock:
+            conn = self.__connect()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO sync (id, last_sync) VALUES (?, ?)",
+                             (SYNC_STARTED_ID if started else SYNC_DONE_ID, date.isoformat()))
+
+    def sync(self, search_modified):
+        """Replace the individuals modified since the last synchronization.
+
+        When the cache was never synchronized, it is considered up to
+        date. The modifications done while synchronizing are found by
+        the next synchronization, because the date stored is the one
+        before searching them. That date is also stored when the
+        synchronization starts, so the individuals retrieved before it
+        by other enrichers are not added meanwhile.
+
+        :param search_modified: function which returns the pages of
+            individuals modified after a given date, like
+            `SortingHat.search_last_modified_identities`
+
+        :returns: number of individuals updated
+        """
+        now = datetime_utcnow()
+        last_sync = self.get_last_sync()
+        self.set_last_sync(now, started=True)
+
+        updated = 0
+        if last_sync:
+            for entities in search_modified(last_sync):
+                self.add(entities)
+                updated += len(entities)
+
+        self.set_last_sync(now)
+
+        logger.info("[sortinghat] Identities cache {} synchronized: {} individuals updated".format(
+                    self.db_path, updated))
+        return updated
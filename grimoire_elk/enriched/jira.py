@@ -21,9 +21,9 @@
 
 import logging
 
-from grimoirelab_toolkit.datetime import (datetime_utcnow,
-                                          str_to_datetime)
+from grimoirelab_toolkit.datetime import datetime_utcnow
 
+from .dates import parse_date
 from .enrich import Enrich, metadata, SH_UNKNOWN_VALUE
 from ..elastic_mapping import Mapping as BaseMapping
 
@@ -395,8 +395,8 @@ class JiraEnrich(Enrich):
                     eitem['updateAuthor_tz'] = comment["updateAuthor"]["timeZone"]
 
             # Add comment-specific data
-            ecomment['created'] = str_to_datetime(comment['created']).isoformat()
-            ecomment['updated'] = str_to_datetime(comment['updated']).isoformat()
+            ecomment['created'] = parse_date(comment['created']).isoformat()
+            ecomment['updated'] = parse_date(comment['updated']).isoformat()
             ecomment['body'] = comment['body']
             ecomment['comment_id'] = comment['id']
 
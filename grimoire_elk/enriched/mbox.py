@@ -19,13 +19,12 @@
 #   Alvaro del Castillo San Felix <acs@bitergia.com>
 #
 
-import json
 import logging
 
 from requests.structures import CaseInsensitiveDict
 import email.utils
 
-from .enrich import Enrich, metadata, anonymize_url
+from .enrich import Enrich, metadata, anonymize_url, PHASE_IDENTITIES, PHASE_ENRICHMENT
 from ..elastic_mapping import Mapping as BaseMapping
 from .mbox_study_kip import kafka_kip, MAX_LINES_FOR_VOTE
 from grimoirelab_toolkit.datetime import str_to_datetime
@@ -65,6 +64,12 @@ class MBoxEnrich(Enrich):
 
     mapping = Mapping
 
+    # The HTML version of the bodies is not used
+    raw_fields = {
+        PHASE_IDENTITIES: ["data.From"],
+        PHASE_ENRICHMENT: {"excludes": ["data.body.html"]}
+    }
+
     def __init__(self, db_sortinghat=None, json_projects_map=None,
                  db_user='', db_password='', db_host='', db_path=None,
                  db_port=None, db_ssl=False, db_verify_ssl=True, db_tenant=None):
@@ -201,46 +206,21 @@ class MBoxEnrich(Enrich):
         try:
             total = super(MBoxEnrich, self).enrich_items(ocean_backend)
         except UnicodeEncodeError:
-            total = self.enrich_items_old(ocean_backend.fetch())
+            total = self.enrich_items_old(ocean_backend.fetch(_source=self.get_raw_source(PHASE_ENRICHMENT)))
 
         return total
 
     def enrich_items_old(self, items):
-        max_items = self.elastic.max_items_bulk
-        current = 0
-        total = 0
-        bulk_json = ""
-
         url = self.elastic.get_bulk_url()
 
-        logger.debug("[mbox] Adding items to {} (in {} packs)".format(anonymize_url(url), max_items))
-
-        for item in items:
-            if current >= max_items:
-                total += self.elastic.safe_put_bulk(url, bulk_json)
-                bulk_json = ""
-                current = 0
-
-            rich_item = self.get_rich_item(item)
-            data_json = json.dumps(rich_item)
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
-                (rich_item[self.get_field_unique_id()])
-            bulk_json += data_json + "\n"  # Bulk document
-            current += 1
+        logger.debug("[mbox] Adding items to {} (in {} packs)".format(anonymize_url(url), self.elastic.max_items_bulk))
 
-        if current == 0:
-            return total
+        with self.elastic.get_bulk_writer(url) as writer:
+            for item in items:
+                rich_item = self.get_rich_item(item)
+                writer.add(rich_item[self.get_field_unique_id()], rich_item)
 
-        try:
-            total += self.elastic.safe_put_bulk(url, bulk_json)
-        except UnicodeEncodeError:
-            # Related to body.encode('iso-8859-1'). mbox data
-            logger.error("[mbox] Encoding error ... converting bulk to iso-8859-1")
-            bulk_json = bulk_json.encode('iso-8859-1', 'ignore')
-
-            total += self.elastic.safe_put_bulk(url, bulk_json)
-
-        return total
+        return writer.total
 
     def kafka_kip(self, ocean_backend, enrich_backend, no_incremental=False):
         # KIP study is not incremental
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Lookups of the projects of the repositories of a projects map"""
+
+import bisect
+
+from .utils import anonymize_url
+
+# Separator of the repositories joined to search substrings on them;
+# it can't be part of a repository of projects.json
+REPOS_SEPARATOR = "\n"
+
+
+class ProjectsIndex:
+    """Index of the projects of the repositories of a data source.
+
+    The repositories of the data source in the projects map are indexed
+    by their value, their anonymized URL, and joined in a single text
+    where the repositories which contain a given text are searched. When
+    several repositories match, the first one in the projects map is
+    used, as when the map is iterated.
+
+    :param repos: dict with the project of each repository of a data source
+    """
+    def __init__(self, repos):
+        self.repos = repos
+        self.anonymized = {}
+        for repo, project in repos.items():
+            self.anonymized.setdefault(anonymize_url(str(repo)), project)
+
+        names = [str(repo) for repo in repos]  # discourse has category_id ints
+        self.projects = list(repos.values())
+        self.starts = []
+        start = 0
+        for name in names:
+            self.starts.append(start)
+            start += len(name) + len(REPOS_SEPARATOR)
+        self.text = REPOS_SEPARATOR.join(names)
+
+    def __contains__(self, repo):
+        return repo in self.repos
+
+    def get(self, repo):
+        """Get the project of a repository"""
+
+        return self.repos.get(repo)
+
+    def get_anonymized(self, repo):
+        """Get the project of the repository whose anonymized URL is `repo`"""
+
+        return self.anonymized.get(repo)
+
+    def find_substring(self, text):
+        """Get the project of the first repository which contains `text`"""
+
+        if not self.projects or REPOS_SEPARATOR in text:
+            return None
+
+        pos = self.text.find(text)
+        if pos < 0:
+            return None
+        return self.projects[bisect.bisect_right(self.starts, pos) - 1]
@@ -40,6 +40,7 @@ MULTI_ORG_NAMES = '_multi_org_names'
 
 PAGE = 1
 PAGE_SIZE = 100
+ENTITIES_BATCH_SIZE = 100
 
 
 class SortingHat(object):
@@ -340,25 +341,7 @@ class SortingHat(object):
         try:
             op = Operation(SortingHatSchema.Query)
             op.individuals(**args)
-            individual = op.individuals().entities()
-            individual.mk()
-            identities = individual.identities()
-            identities.uuid()
-            identities.name()
-            identities.email()
-            identities.username()
-            profile = individual.profile()
-            profile.name()
-            profile.email()
-            profile.gender()
-            profile.gender_acc()
-            profile.is_bot()
-            enrollments = individual.enrollments()
-            enrollments.group().parent_org().name()
-            enrollments.group().name()
-            enrollments.group().type()
-            enrollments.start()
-            enrollments.end()
+            cls.select_entity_fields(op.individuals().entities())
             result = db.execute(op)
             if result['data']['individuals']['entities']:
                 entity = result['data']['individuals']['entities'][0]
@@ -367,6 +350,63 @@ class SortingHat(object):
             raise SortingHatClientError(e)
         return entity
 
+    @classmethod
+    def get_entities(cls, db, ids):
+        """Get the individuals of several identities with a single query.
+
+        The `individuals` query is requested once per identity using
+        aliases, so all the individuals are retrieved in one round-trip.
+
+        :param db: SortingHat client
+        :param ids: list of identity uuids
+
+        :returns: dict with the individual of each uuid, or None when
+            it is not found
+        """
+        entities = {}
+        if not ids:
+            return entities
+
+        aliases = {}
+        try:
+            op = Operation(SortingHatSchema.Query)
+            for i, id in enumerate(ids):
+                alias = 'e{}'.format(i)
+                aliases[alias] = id
+                individuals = op.individuals(__alias__=alias, filters={'uuid': id})
+                cls.select_entity_fields(individuals.entities())
+            result = db.execute(op)
+            for alias, id in aliases.items():
+                found = result['data'][alias]['entities']
+                entities[id] = found[0] if found else None
+        except SortingHatClientError as e:
+            logger.error("[sortinghat] Error get entities {}: {}".format(len(ids), e.errors[0]['message']))
+            raise SortingHatClientError(e)
+        return entities
+
+    @staticmethod
+    def select_entity_fields(individual):
+        """Select the fields of an individual used by the enrichment"""
+
+        individual.mk()
+        identities = individual.identities()
+        identities.uuid()
+        identities.name()
+        identities.email()
+        identities.username()
+        profile = individual.profile()
+        profile.name()
+        profile.email()
+        profile.gender()
+        profile.gender_acc()
+        profile.is_bot()
+        enrollments = individual.enrollments()
+        enrollments.group().parent_org().name()
+        enrollments.group().name()
+        enrollments.group().type()
+        enrollments.start()
+        enrollments.end()
+
     @classmethod
     def get_unique_identity(cls, db, uuid):
         args = {
@@ -508,7 +548,7 @@ class SortingHat(object):
             logger.debug("[sortinghat] Error list unique identities: {}".format(e))
 
     @classmethod
-    def search_last_modified_identities(cls, db, after):
+    def search_last_modified_identities(cls, db, after, raise_errors=False):
         args = {
             'page': PAGE,
             'page_size': PAGE_SIZE,
@@ -550,3 +590,5 @@ class SortingHat(object):
         except SortingHatClientError as e:
             logger.error("[sortinghat] Error searching identities after {}"
                          ": {}".format(after, e.errors[0]['message']))
+            if raise_errors:
+                raise SortingHatClientError(e)
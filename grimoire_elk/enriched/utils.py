@@ -20,16 +20,22 @@
 #
 
 import datetime
+import gzip
 import inspect
 import json
 import logging
 import re
+import threading
+import urllib.parse
 
 import requests
 import urllib3
 
-from grimoirelab_toolkit.datetime import (datetime_utcnow,
-                                          str_to_datetime)
+from opensearchpy import OpenSearch, RequestsHttpConnection
+
+from grimoirelab_toolkit.datetime import datetime_utcnow
+
+from .dates import parse_date
 
 
 BACKOFF_FACTOR = 0.2
@@ -41,6 +47,11 @@ STATUS_FORCE_LIST = [408, 409, 429, 502, 503, 504]
 METADATA_FILTER_RAW = 'metadata__filter_raw'
 REPO_LABELS = 'repository_labels'
 
+GZIP_ENDPOINTS = ['_bulk', '_search', '_update_by_query']
+GZIP_MIN_SIZE = 1024  # smaller bodies are not compressed
+GZIP_COMPRESS_LEVEL = 1  # JSON compresses well even with the fastest level
+POOL_MAXSIZE = 10  # max connections kept alive per host in the shared sessions and clients
+
 logger = logging.getLogger(__name__)
 
 
@@ -129,9 +140,9 @@ def get_time_diff_days(start, end):
         return None
 
     if type(start) is not datetime.datetime:
-        start = str_to_datetime(start).replace(tzinfo=None)
+        start = parse_date(start).replace(tzinfo=None)
     if type(end) is not datetime.datetime:
-        end = str_to_datetime(end).replace(tzinfo=None)
+        end = parse_date(end).replace(tzinfo=None)
 
     seconds_day = float(60 * 60 * 24)
     diff_days = (end - start).total_seconds() / seconds_day
@@ -140,7 +151,102 @@ def get_time_diff_days(start, end):
     return diff_days
 
 
-def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_RETRIES):
+class GzipAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter which compresses the body of the requests.
+
+    Only the bodies sent to the endpoints in `GZIP_ENDPOINTS` and bigger
+    than `GZIP_MIN_SIZE` bytes are compressed. The responses are also
+    requested compressed; they are decompressed transparently by requests.
+    """
+    lock = threading.Lock()
+    stats = {
+        "requests": 0,
+        "raw_bytes": 0,
+        "wire_bytes": 0
+    }
+
+    def send(self, request, **kwargs):
+        request.headers['Accept-Encoding'] = 'gzip'
+
+        if self.__compressible(request):
+            body = request.body
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            compressed = gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+
+            request.body = compressed
+            request.headers['Content-Encoding'] = 'gzip'
+            request.headers['Content-Length'] = str(len(compressed))
+
+            with self.lock:
+                self.stats['requests'] += 1
+                self.stats['raw_bytes'] += len(body)
+                self.stats['wire_bytes'] += len(compressed)
+
+            logger.debug("Request body to {} compressed: {} -> {} bytes".format(
+                         anonymize_url(request.url), len(body), len(compressed)))
+
+        return super().send(request, **kwargs)
+
+    @staticmethod
+    def __compressible(request):
+        body = request.body
+
+        if not isinstance(body, (str, bytes)) or len(body) < GZIP_MIN_SIZE:
+            return False
+        if 'Content-Encoding' in request.headers:
+            return False
+
+        path = urllib.parse.urlparse(request.url).path
+        return any(segment in GZIP_ENDPOINTS for segment in path.split('/'))
+
+
+# URLs of the ES/OpenSearch instances which receive compressed requests
+GZIP_URLS = set()
+
+
+def enable_compression(url):
+    """Compress the requests sent to the ES/OpenSearch instance in `url`.
+
+    Only the sessions created by `grimoire_con` after enabling it
+    compress the requests.
+
+    :param url: ES/OpenSearch url
+    """
+    GZIP_URLS.add(url.rstrip('/') + '/')
+
+
+def disable_compression(url):
+    """Stop compressing the requests sent to `url`
+
+    :param url: ES/OpenSearch url
+    """
+    GZIP_URLS.discard(url.rstrip('/') + '/')
+
+
+def get_compression_stats():
+    """Get the number of requests compressed and their size
+    before (raw) and after (wire) compressing them"""
+
+    with GzipAdapter.lock:
+        return dict(GzipAdapter.stats)
+
+
+def log_compression_stats():
+    """Log the bytes saved compressing the requests"""
+
+    stats = get_compression_stats()
+    if not stats['requests']:
+        return
+
+    ratio = stats['raw_bytes'] / stats['wire_bytes'] if stats['wire_bytes'] else 0
+    logger.info("Compressed requests: {}, raw {:.2f} MB, wire {:.2f} MB (ratio {:.1f}x)".format(
+                stats['requests'], stats['raw_bytes'] / (1024 * 1024),
+                stats['wire_bytes'] / (1024 * 1024), ratio))
+
+
+def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_RETRIES,
+                 pool_maxsize=requests.adapters.DEFAULT_POOLSIZE):
     conn = requests.Session()
     # {backoff factor} * (2 ^ ({number of total retries} - 1))
     # conn_retries = 21  # 209715.2 = 2.4d
@@ -149,10 +255,15 @@ def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_R
     retries = urllib3.util.Retry(total=total, connect=conn_retries, read=MAX_RETRIES_ON_READ,
                                  redirect=MAX_RETRIES_ON_REDIRECT, backoff_factor=BACKOFF_FACTOR,
                                  allowed_methods=False, status_forcelist=STATUS_FORCE_LIST)
-    adapter = requests.adapters.HTTPAdapter(max_retries=retries)
+    adapter = requests.adapters.HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize)
     conn.mount('http://', adapter)
     conn.mount('https://', adapter)
 
+    if GZIP_URLS:
+        gzip_adapter = GzipAdapter(max_retries=retries, pool_maxsize=pool_maxsize)
+        for url in GZIP_URLS:
+            conn.mount(url, gzip_adapter)
+
     if insecure:
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         conn.verify = False
@@ -160,6 +271,123 @@ def grimoire_con(insecure=True, conn_retries=MAX_RETRIES_ON_CONNECT, total=MAX_R
     return conn
 
 
+# Sessions and clients shared by all the objects of the process,
+# by URL and TLS settings, to reuse their connections
+SESSIONS = {}
+ES_CLIENTS = {}
+REGISTRY_LOCK = threading.Lock()
+
+
+def set_pool_size(pool_maxsize):
+    """Set the max number of connections per host kept alive by
+    the shared sessions and clients created from now on.
+
+    :param pool_maxsize: max number of connections per host
+    """
+    global POOL_MAXSIZE
+
+    POOL_MAXSIZE = pool_maxsize
+
+
+def get_session(url, insecure=True):
+    """Get the session shared by the process to send requests to `url`.
+
+    The sessions are created with `grimoire_con` the first time they
+    are requested for the URL and TLS settings.
+
+    :param url: url of the service (i.e. ES instance)
+    :param insecure: support https with invalid certificates
+
+    :returns: a requests session
+    """
+    key = (url.rstrip('/'), insecure)
+
+    with REGISTRY_LOCK:
+        session = SESSIONS.get(key)
+        if not session:
+            session = grimoire_con(insecure, pool_maxsize=POOL_MAXSIZE)
+            SESSIONS[key] = session
+
+    return session
+
+
+def reset_sessions():
+    """Forget the shared sessions and clients without closing them.
+
+    A forked process can't use the connections opened by its parent,
+    so it must call this function before sending any request.
+    """
+    global REGISTRY_LOCK
+
+    REGISTRY_LOCK = threading.Lock()
+    SESSIONS.clear()
+    ES_CLIENTS.clear()
+
+
+def get_es_client(url, insecure=True, **kwargs):
+    """Get the OpenSearch client shared by the process for `url`.
+
+    The clients use `RequestsHttpConnection` and they are created the
+    first time they are requested for the URL, TLS settings and options.
+    The requests are compressed when the compression is enabled for
+    the URL.
+
+    :param url: ES/OpenSearch url
+    :param insecure: support https with invalid certificates
+    :param kwargs: options of the client (i.e. timeout)
+
+    :returns: an OpenSearch client
+    """
+    key = (url.rstrip('/'), insecure, tuple(sorted(kwargs.items())))
+
+    with REGISTRY_LOCK:
+        client = ES_CLIENTS.get(key)
+        if not client:
+            client = OpenSearch([url], verify_certs=not insecure, ssl_show_warn=not insecure,
+                                connection_class=RequestsHttpConnection, pool_maxsize=POOL_MAXSIZE,
+                                http_compress=url.rstrip('/') + '/' in GZIP_URLS, **kwargs)
+            ES_CLIENTS[key] = client
+
+    return client
+
+
+def get_pool_stats():
+    """Get the number of connections opened and requests sent by the
+    shared sessions and clients, by host.
+
+    :returns: dict with the number of connections and requests by host
+    """
+    sessions = []
+    with REGISTRY_LOCK:
+        sessions.extend(SESSIONS.values())
+        for client in ES_CLIENTS.values():
+            sessions.extend(conn.session for conn in client.transport.connection_pool.connections)
+
+    stats = {}
+    for session in sessions:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                host = "{}://{}:{}".format(pool.scheme, pool.host, pool.port)
+                host_stats = stats.setdefault(host, {"connections": 0, "requests": 0})
+                host_stats['connections'] += pool.num_connections
+                host_stats['requests'] += pool.num_requests
+
+    return stats
+
+
+def log_pool_stats():
+    """Log the reuse of the connections of the shared sessions and clients"""
+
+    for host, stats in get_pool_stats().items():
+        if not stats['requests']:
+            continue
+        logger.debug("Connections to {}: {} opened, {} requests ({:.1f} requests per connection)".format(
+                     host, stats['connections'], stats['requests'],
+                     stats['requests'] / max(stats['connections'], 1)))
+
+
 def get_last_enrich(backend_cmd, enrich_backend, filter_raw=None):
     last_enrich = None
 
@@ -237,7 +465,7 @@ def get_diff_current_date(days=0, hours=0, minutes=0):
 def fix_field_date(date_value):
     """Fix possible errors in the field date"""
 
-    field_date = str_to_datetime(date_value)
+    field_date = parse_date(date_value)
 
     try:
         _ = int(field_date.strftime("%z")[0:3])
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Stages of the enrichment connected by bounded queues"""
+
+import contextlib
+import itertools
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_CHUNK_SIZE = 100  # items read at once by the prefetch thread
+PREFETCH_END = object()
+CONSUME_END = object()
+
+
+class StageStats:
+    """Time spent and items processed by each stage of a pipeline.
+
+    The stats can be updated from several threads.
+    """
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, items=0):
+        """Add the time spent and the items processed by a stage.
+
+        :param stage: name of the stage
+        :param seconds: time spent by the stage
+        :param items: number of items processed
+        """
+        with self._lock:
+            current = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (current[0] + seconds, current[1] + items)
+
+    @contextlib.contextmanager
+    def timer(self, stage, items=0):
+        """Context manager which adds the time spent in its block to a stage.
+
+        :param stage: name of the stage
+        :param items: number of items processed in the block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def seconds(self, stage):
+        return self.stages.get(stage, (0.0, 0))[0]
+
+    def items(self, stage):
+        return self.stages.get(stage, (0.0, 0))[1]
+
+    def summary(self):
+        """Text with the time spent and items processed by each stage"""
+
+        return ", ".join("{} {:.2f}s ({} items)".format(stage, seconds, items)
+                         for stage, (seconds, items) in self.stages.items())
+
+
+def prefetch(items, queue_size=2, chunk_size=PREFETCH_CHUNK_SIZE, stats=None, stage='fetch'):
+    """Read the items from an iterable in a background thread.
+
+    The items are read in chunks of `chunk_size` items, and up to
+    `queue_size` chunks are kept in a bounded queue, so the next items
+    are retrieved while the current ones are processed. Errors raised
+    reading the items are raised again by the generator. When the
+    generator is closed, the thread stops and closes the iterable.
+
+    :param items: iterable of items
+    :param queue_size: max number of chunks read in advance;
+        0 reads the items in the calling thread
+    :param chunk_size: number of items of each chunk
+    :param stats: `StageStats` where the time spent reading the items is
+        added to `stage`, and the time waiting for them to `stage` + " wait"
+    :param stage: name of the stage in the stats
+    """
+    if queue_size <= 0:
+        yield from items
+        return
+
+    chunks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                chunks.put(value, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        iterator = iter(items)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if stats:
+                    stats.add(stage, time.perf_counter() - start, len(chunk))
+                if not chunk or not put(chunk):
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            put(PREFETCH_END)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            start = time.perf_counter()
+            chunk = chunks.get()
+            if stats:
+                stats.add(stage + " wait", time.perf_counter() - start)
+            if chunk is PREFETCH_END:
+                break
+            elif isinstance(chunk, Exception):
+                raise chunk
+            yield from chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+@contextlib.contextmanager
+def consume(func, queue_size=2, stats=None, stage='consume'):
+    """Call a function in a background thread with the values put in a bounded queue.
+
+    The context manager yields a function to put the values. Up to
+    `queue_size` values can be pending to be consumed; once the queue
+    is full, putting a new one blocks until a value is consumed. On exit,
+    it waits until all the values are consumed. Once `func` raises an
+    error, the pending values are discarded and the error is raised
+    again when putting the next value or on exit.
+
+    :param func: function called with each value
+    :param queue_size: max number of values pending to be consumed;
+        0 calls `func` in the calling thread
+    :param stats: `StageStats` where the time spent by `func` is added
+        to `stage`, and the time waiting to put the values to `stage` + " wait"
+    :param stage: name of the stage in the stats
+    """
+    if queue_size <= 0:
+        yield func
+        return
+
+    values = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def consumer():
+        while True:
+            value = values.get()
+            if value is CONSUME_END:
+                break
+            elif errors:
+                continue
+            start = time.perf_counter()
+            try:
+                func(value)
+            except Exception as e:
+                errors.append(e)
+            if stats:
+                stats.add(stage, time.perf_counter() - start, 1)
+
+    def put(value):
+        if errors:
+            raise errors[0]
+        start = time.perf_counter()
+        values.put(value)
+        if stats:
+            stats.add(stage + " wait", time.perf_counter() - start)
+
+    thread = threading.Thread(target=consumer, daemon=True)
+    thread.start()
+
+    try:
+        yield put
+    finally:
+        values.put(CONSUME_END)
+        thread.join()
+
+    if errors:
+        raise errors[0]
@@ -23,17 +23,24 @@
 """Ocean feeder for Elastic from  Perseval data"""
 
 
+import hashlib
 import inspect
+import json
 import logging
 
+import requests
+
 from grimoirelab_toolkit.datetime import unixtime_to_datetime
 
 from datetime import datetime
-from ..enriched.utils import get_repository_filter, anonymize_url
+from ..enriched.utils import get_repository_filter, get_session, anonymize_url
+from ..elastic_bulk import BulkResult
 from ..elastic_items import ElasticItems
 from ..elastic_mapping import Mapping
 from ..errors import ELKError
 from ..identities.identities import Identities
+from ..pipeline import StageStats, consume
+from ..raw_store import RawStore
 
 logger = logging.getLogger(__name__)
 
@@ -41,11 +48,18 @@ logger = logging.getLogger(__name__)
 PRJ_JSON_FILTER_SEPARATOR = "--filter-"
 PRJ_JSON_FILTER_OP_ASSIGNMENT = "="
 
+CONTENT_HASH_FIELD = "metadata__content_hash"
+# Fields which change every time an item is fetched, excluded from its content hash
+CONTENT_HASH_EXCLUDED_FIELDS = ["timestamp", "metadata__timestamp", CONTENT_HASH_FIELD]
+
 
 class ElasticOcean(ElasticItems):
 
     mapping = Mapping
     identities = Identities
+    feed_queue_size = 2  # packs uploaded in background while the next ones are fetched (0 = in sequence)
+    skip_unchanged = False  # don't upload the items already stored in the index without changes
+    raw_store_dir = None  # directory where the raw items are also stored by origin, and read when complete
 
     @classmethod
     def add_params(cls, cmdline_parser):
@@ -67,6 +81,10 @@ class ElasticOcean(ElasticItems):
         self.fetch_archive = fetch_archive  # fetch from archive
         self.project = project  # project to be used for this data source
         self.anonymize = anonymize
+        self.feed_result = BulkResult()  # items uploaded and lost by the last feed
+        self.feed_unchanged = 0  # items not uploaded by the last feed because they were already stored
+        self.feed_from_scratch = False  # the next feed retrieves all the items of the origin
+        self.raw_store = None
 
     def set_elastic_url(self, url):
         """ Elastic URL """
@@ -75,6 +93,7 @@ class ElasticOcean(ElasticItems):
     def set_elastic(self, elastic):
         """ Elastic used to store last data source state """
         self.elastic = elastic
+        self.requests = get_session(elastic.url, self.insecure)
 
     def get_field_date(self):
         """ Field with the update in the JSON items. Now the same in all. """
@@ -200,6 +219,8 @@ class ElasticOcean(ElasticItems):
                 logger.info("[{}] Not incremental".format(
                             self.perceval_backend.__class__.__name__.lower()))
 
+        self.feed_from_scratch = not last_update and offset is None and not latest_items
+
         params = {}
         # category, filter_classified, and to_date params are shared
         # by all Perceval backends
@@ -231,7 +252,10 @@ class ElasticOcean(ElasticItems):
         else:
             items = self.perceval_backend.fetch(**params)
 
-        self.feed_items(items)
+        try:
+            self.feed_items(items)
+        finally:
+            self.feed_from_scratch = False
         self.update_items()
 
     def update_items(self):
@@ -241,30 +265,44 @@ class ElasticOcean(ElasticItems):
         return
 
     def feed_items(self, items):
+        """Upload the items to the raw index in packs.
+
+        While a pack is uploaded by a background thread, the items of the
+        next packs are fetched; up to `feed_queue_size` packs can be waiting
+        to be uploaded.
+        """
         task_init = datetime.now()
 
         items_pack = []  # to feed item in packs
         drop = 0
         added = 0
-
-        for item in items:
-            # print("%s %s" % (item['url'], item['lastUpdated_date']))
-            # Add date field for incremental analysis if needed
-            self.add_update_date(item)
-            self._fix_item(item)
-            if self.project:
-                item['project'] = self.project
-            if self.anonymize:
-                self.identities.anonymize_item(item)
-            if len(items_pack) >= self.elastic.max_items_bulk:
-                self._items_to_es(items_pack)
-                items_pack = []
-            if not self.drop_item(item):
-                items_pack.append(item)
-                added += 1
-            else:
-                drop += 1
-        self._items_to_es(items_pack)
+        self.feed_result = BulkResult()
+        self.feed_unchanged = 0
+        stats = StageStats()
+        self.raw_store = self.get_raw_store()
+        if self.raw_store and (self.feed_from_scratch or not self.raw_store.exists()):
+            self.raw_store.create(complete=self.feed_from_scratch)
+
+        with consume(self._upload_items, queue_size=self.feed_queue_size, stats=stats, stage='upload') as upload:
+            for item in items:
+                # print("%s %s" % (item['url'], item['lastUpdated_date']))
+                # Add date field for incremental analysis if needed
+                self.add_update_date(item)
+                self._fix_item(item)
+                if self.project:
+                    item['project'] = self.project
+                if self.anonymize:
+                    self.identities.anonymize_item(item)
+                if len(items_pack) >= self.elastic.max_items_bulk:
+                    upload(items_pack)
+                    items_pack = []
+                if not self.drop_item(item):
+                    items_pack.append(item)
+                    added += 1
+                else:
+                    drop += 1
+            upload(items_pack)
+        self.elastic.refresh_pending()
 
         total_time_min = (datetime.now() - task_init).total_seconds() / 60
 
@@ -273,11 +311,129 @@ class ElasticOcean(ElasticItems):
                      added, self.elastic.index))
         logger.debug("[{}] Dropped {} items using drop_item filter".format(
                      self.perceval_backend.__class__.__name__.lower(), drop))
-        logger.debug("[{}] Finished in {:.2f} min".format(
+        if self.skip_unchanged:
+            logger.debug("[{}] Skipped {} items already stored without changes".format(
+                         self.perceval_backend.__class__.__name__.lower(), self.feed_unchanged))
+        if self.feed_result.failed:
+            logger.warning("[{}] Lost {} items in index {}: {} transient and {} permanent errors".format(
+                           self.perceval_backend.__class__.__name__.lower(), self.feed_result.failed,
+                           self.elastic.index, self.feed_result.transient, self.feed_result.permanent))
+        logger.debug("[{}] Finished in {:.2f} min{}".format(
                      self.perceval_backend.__class__.__name__.lower(),
-                     total_time_min))
+                     total_time_min, " ({})".format(stats.summary()) if stats.stages else ""))
         return self
 
+    @staticmethod
+    def get_content_hash(item):
+        """Get the hash of the content of a raw item, without the fields
+        which change every time it is fetched"""
+
+        content = {k: v for k, v in item.items() if k not in CONTENT_HASH_EXCLUDED_FIELDS}
+        data = json.dumps(content, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def _drop_unchanged(self, json_items):
+        """Remove the items already stored in the index without changes.
+
+        The hash of the content of the items is added to them, and the
+        items are compared with the ones stored in the index with the
+        same id, using their update date and content hash. When the
+        stored items can't be retrieved, all the items are kept.
+
+        :param json_items: list of items to upload
+
+        :returns: list of the items which are new or changed
+        """
+        field_id = self.get_field_unique_id()
+        for item in json_items:
+            item[CONTENT_HASH_FIELD] = self.get_content_hash(item)
+
+        try:
+            stored = self.elastic.get_documents([item[field_id] for item in json_items],
+                                                fields=[self.get_field_date(), CONTENT_HASH_FIELD])
+        except requests.exceptions.RequestException as ex:
+            logger.warning("[{}] Can't find the items already stored in {}, uploading all of them: {}".format(
+                           self.perceval_backend.__class__.__name__.lower(), self.elastic.index, ex))
+            return json_items
+
+        changed = []
+        for item in json_items:
+            doc = stored.get(item[field_id])
+            if (doc and doc.get(CONTENT_HASH_FIELD) == item[CONTENT_HASH_FIELD]
+                    and doc.get(self.get_field_date()) == item[self.get_field_date()]):
+                continue
+            changed.append(item)
+
+        return changed
+
+    def _upload_items(self, json_items):
+        """Upload a pack of items, skipping the unchanged ones when
+        `skip_unchanged` is set.
+
+        When the origin is fed from scratch, the raw store gets all the
+        items of the pack, so it is complete even if the unchanged ones
+        are not uploaded; otherwise, it already has the unchanged ones.
+        The raw store is invalidated when some items of the pack can't
+        be uploaded, because it can't know which ones are missing in the
+        raw index.
+        """
+        stored_items = json_items
+        if self.skip_unchanged and json_items:
+            changed = self._drop_unchanged(json_items)
+            self.feed_unchanged += len(json_items) - len(changed)
+            json_items = changed
+            if not self.feed_from_scratch:
+                stored_items = changed
+
+        failed = self.feed_result.failed
+        inserted = self._items_to_es(json_items)
+        if self.raw_store:
+            if self.feed_result.failed != failed:
+                self.raw_store.invalidate()
+            self.raw_store.append(stored_items)
+
+        return inserted
+
+    def get_raw_store(self):
+        """Get the local store of the raw items of the origin, or None
+        when `raw_store_dir` is not set or there is no origin"""
+
+        if not self.raw_store_dir or not self.elastic or not self.perceval_backend:
+            return None
+
+        return RawStore(self.raw_store_dir, self.elastic.index, self.perceval_backend.origin)
+
+    def invalidate_raw_store(self):
+        """Stop reading the raw store of the origin after deleting
+        items of the origin from the raw index"""
+
+        store = self.get_raw_store()
+        if store and store.exists():
+            store.invalidate()
+
+    def fetch(self, _filter=None, ignore_incremental=False, ordered=True, _source=None):
+        """Fetch the raw items from the local raw store of the origin,
+        when it is complete, or from the raw index.
+
+        The raw store is not used when the items are filtered by other
+        fields than their date, when they are fetched by offset, after a
+        given cursor or until a given date. The items read from the store
+        are in the order they were fed, and the `_source` filtering is ignored.
+        """
+        store = self.get_raw_store()
+        incremental_offset = self.offset and not ignore_incremental
+
+        if (store and store.readable() and not _filter and not self.filter_raw and not self.repo_spaces
+                and not incremental_offset and not self.search_after and not self.to_date):
+            logger.debug("[{}] Reading raw items from the raw store {}".format(
+                         self.perceval_backend.__class__.__name__.lower(), store.path))
+            self.cursor = None
+            yield from store.read(from_date=None if ignore_incremental else self.from_date)
+            return
+
+        yield from super().fetch(_filter=_filter, ignore_incremental=ignore_incremental,
+                                 ordered=ordered, _source=_source)
+
     def _items_to_es(self, json_items):
         """ Append items JSON to ES (data source state) """
 
@@ -290,18 +446,21 @@ class ElasticOcean(ElasticItems):
 
         field_id = self.get_field_unique_id()
 
-        inserted = self.elastic.bulk_upload(json_items, field_id)
+        result = self.elastic.bulk_upload_result(json_items, field_id)
+        self.feed_result.update(result)
 
-        if len(json_items) != inserted:
-            missing = len(json_items) - inserted
+        if len(json_items) != result.inserted:
+            missing = len(json_items) - result.inserted
             info = json_items[0]
 
             name = info['backend_name']
             version = info['backend_version']
             origin = info['origin']
 
-            logger.warning("[{}] {}/{} missing JSON items for backend {} [ver. {}], origin {}".format(
-                           self.perceval_backend.__class__.__name__.lower(),
-                           missing, len(json_items), name, version, origin))
+            logger.warning("[{}] {}/{} missing JSON items for backend {} [ver. {}], origin {} "
+                           "({} transient, {} permanent errors)".format(
+                               self.perceval_backend.__class__.__name__.lower(),
+                               missing, len(json_items), name, version, origin,
+                               result.transient, result.permanent))
 
-        return inserted
+        return result.inserted
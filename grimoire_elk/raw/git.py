@@ -20,6 +20,7 @@
 #
 
 from .elastic import ElasticOcean
+from ..commits_store import CommitsStore
 from ..elastic_mapping import Mapping as BaseMapping
 from ..identities.git import GitIdentities
 from ..enriched.utils import anonymize_url
@@ -71,6 +72,40 @@ class GitOcean(ElasticOcean):
 
     mapping = Mapping
     identities = GitIdentities
+    commits_store_dir = None  # directory where the hashes of the commits fed are stored by origin
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fed_commits = []  # hashes of the commits uploaded by the last feed
+
+    def get_commits_store(self):
+        """Get the local store of the hashes of the commits of the origin,
+        or None when `commits_store_dir` is not set"""
+
+        if not self.commits_store_dir or not self.elastic:
+            return None
+
+        return CommitsStore(self.commits_store_dir, self.elastic.index, self.perceval_backend.origin)
+
+    def feed_items(self, items):
+        self.fed_commits = []
+        super().feed_items(items)
+
+        store = self.get_commits_store()
+        if store and self.fed_commits:
+            store.add(self.fed_commits)
+
+        return self
+
+    def _upload_items(self, json_items):
+        # The commits of the packs with failed items are not stored, so the
+        # store doesn't have the commits of all the items of the raw index
+        # and it is rebuilt from the raw index when it is read
+        failed = self.feed_result.failed
+        inserted = super()._upload_items(json_items)
+        if self.feed_result.failed == failed:
+            self.fed_commits.extend(item['data']['commit'] for item in json_items)
+        return inserted
 
     def _fix_item(self, item):
         item['origin'] = anonymize_url(item['origin'])
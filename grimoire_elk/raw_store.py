@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Local store of the raw items of an origin in compressed JSON lines segments.
+
+When zstandard is installed the items are compressed with zstd, otherwise
+with gzip. The stores written with zstd can't be read without zstandard.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+
+from grimoirelab_toolkit.datetime import datetime_to_utc
+
+from .codec import dumps, loads
+from .enriched.dates import parse_date
+from .enriched.utils import anonymize_url
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+
+    ZSTD_LIB = True
+except ImportError:
+    zstandard = None
+    ZSTD_LIB = False
+
+CODEC_ZSTD = 'zstd'
+CODEC_GZIP = 'gzip'
+SEGMENT_EXTENSIONS = {
+    CODEC_ZSTD: '.jsonl.zst',
+    CODEC_GZIP: '.jsonl.gz'
+}
+SEGMENT_SIZE = 64 * 1024 * 1024  # max bytes of a segment before starting a new one
+
+STORE_FILE = "store.json"
+INDEX_FILE = "index.jsonl"
+TIMESTAMP_FIELD = "metadata__timestamp"
+UNIQUE_ID_FIELD = "uuid"
+
+
+def compress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def decompress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class RawStore:
+    """Store of the raw items of an origin of a raw index.
+
+    Each pack of items appended is compressed as a frame at the end
+    of the current segment file. The offset index (`index.jsonl`) has
+    a line per frame with its segment, offset, length, number of items
+    and the first and last `metadata__timestamp` of its items, so the
+    frames with items older than a given date are skipped when reading.
+    The frames are written before their lines of the index, so a frame
+    interrupted while it was written is never read.
+
+    The items updated several times are stored once per update, as they
+    are appended; only their last version is read.
+
+    The store is complete when it was created with all the items of the
+    origin, i.e. when the origin was fed from scratch; only the complete
+    stores can be read instead of the raw index. Once items of the origin
+    are deleted from the raw index, the store must be invalidated, so it
+    is not read until the origin is fed from scratch again.
+
+    :param path: root directory of the stores
+    :param index: name of the raw index
+    :param origin: origin of the items
+    """
+    def __init__(self, path, index, origin):
+        self.origin = origin
+        digest = hashlib.sha1(str(origin).encode('utf-8')).hexdigest()
+        self.path = os.path.join(path, index, digest)
+        self.meta = self.__read_meta()
+
+    def __read_meta(self):
+        try:
+            with open(os.path.join(self.path, STORE_FILE)) as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+    def exists(self):
+        return self.meta is not None
+
+    @property
+    def complete(self):
+        return bool(self.meta and self.meta.get('complete'))
+
+    @property
+    def codec(self):
+        return self.meta['codec'] if self.meta else None
+
+    def readable(self):
+        """Whether the store can be read instead of the raw index"""
+
+        return self.complete and (self.codec != CODEC_ZSTD or ZSTD_LIB)
+
+    def create(self, complete=False):
+        """Create the store, removing the items stored before.
+
+        :param complete: whether all the items of the origin will be stored
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+
+        self.meta = {
+            'origin': anonymize_url(str(self.origin)),
+            'codec': CODEC_ZSTD if ZSTD_LIB else CODEC_GZIP,
+            'complete': complete
+        }
+        with open(os.path.join(self.path, STORE_FILE), 'w') as fd:
+            json.dump(self.meta, fd)
+
+        logger.debug("Raw store created in {} for {}".format(self.path, self.meta['origin']))
+
+    def invalidate(self):
+        """Mark the store as incomplete, so it is not read anymore"""
+
+        if not self.complete:
+            return
+
+        self.meta['complete'] = False
+        with open(os.path.join(self.path, STORE_FILE), 'w') as fd:
+            json.dump(self.meta, fd)
+
+        logger.debug("Raw store {} invalidated for {}".format(self.path, self.meta['origin']))
+
+    def __read_index(self):
+        try:
+            with open(os.path.join(self.path, INDEX_FILE)) as fd:
+                return [json.loads(line) for line in fd if line.endswith('\n')]
+        except OSError:
+            return []
+
+    def append(self, items):
+        """Append a pack of items to the store.
+
+        :param items: list of raw items
+        """
+        if not items:
+            return
+
+        if not self.exists():
+            self.create()
+
+        frames = self.__read_index()
+        number = frames[-1]['segment'] if frames else 1
+        segment = self.__segment_path(number)
+        if os.path.exists(segment) and os.path.getsize(segment) >= SEGMENT_SIZE:
+            number += 1
+            segment = self.__segment_path(number)
+
+        data = '\n'.join(dumps(item) for item in items) + '\n'
+        data = compress(data.encode('utf-8', 'surrogatepass'), self.codec)
+        timestamps = [item[TIMESTAMP_FIELD] for item in items if item.get(TIMESTAMP_FIELD)]
+
+        with open(segment, 'ab') as fd:
+            offset = fd.seek(0, os.SEEK_END)
+            fd.write(data)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        self.__truncate_index()
+        frame = {
+            'segment': number,
+            'offset': offset,
+            'length': len(data),
+            'items': len(items),
+            'first': min(timestamps, key=parse_date) if timestamps else None,
+            'last': max(timestamps, key=parse_date) if timestamps else None
+        }
+        with open(os.path.join(self.path, INDEX_FILE), 'a') as fd:
+            fd.write(json.dumps(frame) + '\n')
+
+    def __truncate_index(self):
+        # Remove the line of the index interrupted while it was written
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+
+        with open(index_path, 'r+b') as fd:
+            data = fd.read()
+            if data and not data.endswith(b'\n'):
+                fd.truncate(data.rfind(b'\n') + 1)
+
+    def __segment_path(self, number):
+        return os.path.join(self.path, "{:06d}{}".format(number, SEGMENT_EXTENSIONS[self.codec]))
+
+    def read(self, from_date=None):
+        """Read the last version of the items of the store, in the order
+        they were appended.
+
+        The frames are read twice: first to find the last version of each
+        item, by its `uuid`, and then to return only those versions.
+
+        :param from_date: only the items with `metadata__timestamp`
+            equal or after this date are returned
+
+        :returns: a generator of raw items
+        """
+        from_date = datetime_to_utc(from_date) if from_date else None
+
+        last_versions = {}
+        for position, item in self.__read_frames(from_date):
+            last_versions[item.get(UNIQUE_ID_FIELD)] = position
+
+        for position, item in self.__read_frames(from_date):
+            if last_versions[item.get(UNIQUE_ID_FIELD)] == position:
+                yield item
+
+    def __read_frames(self, from_date):
+        frames = self.__read_index()
+        for number in sorted({frame['segment'] for frame in frames}):
+            segment_frames = [(i, frame) for i, frame in enumerate(frames) if frame['segment'] == number]
+            if from_date:
+                segment_frames = [(i, frame) for i, frame in segment_frames
+                                  if not frame['last'] or parse_date(frame['last']) >= from_date]
+            if not segment_frames:
+                continue
+
+            with open(self.__segment_path(number), 'rb') as fd:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        data.madvise(mmap.MADV_SEQUENTIAL)
+                    for i, frame in segment_frames:
+                        for j, item in self.__read_frame(data, frame, from_date):
+                            yield (i, j), item
+
+    def __read_frame(self, data, frame, from_date):
+        chunk = decompress(data[frame['offset']:frame['offset'] + frame['length']], self.codec)
+        check_date = from_date and (not frame['first'] or parse_date(frame['first']) < from_date)
+
+        for j, line in enumerate(chunk.splitlines()):
+            item = loads(line)
+            if check_date and (not item.get(TIMESTAMP_FIELD) or parse_date(item[TIMESTAMP_FIELD]) < from_date):
+                continue
+            yield j, item
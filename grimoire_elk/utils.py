@@ -28,6 +28,7 @@ import requests
 
 from importlib.metadata import entry_points
 
+from grimoire_elk.cache import CACHE_POLICIES
 from grimoire_elk.errors import ElasticError
 from grimoire_elk.elastic import ElasticSearch
 # Connectors for Graal
@@ -403,9 +404,47 @@ def get_params_parser():
     parser.add_argument('--only-studies', action='store_true', help="Execute only studies.")
     parser.add_argument('--bulk-size', default=1000, type=int,
                         help="Number of items per bulk request to Elasticsearch.")
+    parser.add_argument('--bulk-bytes', default=10 * 1024 * 1024, type=int,
+                        help="Max size in bytes of the bulk requests to Elasticsearch.")
+    parser.add_argument('--bulk-queue-size', default=2, type=int,
+                        help="Number of bulk requests sent in background (0 to send them in sequence).")
+    parser.add_argument('--feed-queue-size', type=int,
+                        help="Number of packs of raw items uploaded in background while fetching (0 to upload them in sequence).")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="Don't upload the raw items already stored in the raw index without changes.")
+    parser.add_argument('--raw-store-dir',
+                        help="Directory where the raw items are also stored compressed, to enrich them from it.")
+    parser.add_argument('--commits-store-dir',
+                        help="Directory where the hashes of the git commits fed are stored, to find the deleted ones.")
+    parser.add_argument('--es-pool-size', type=int,
+                        help="Max connections per host kept alive by the shared Elasticsearch sessions.")
+    parser.add_argument('--es-gzip', action='store_true',
+                        help="Compress the bulk and search requests sent to Elasticsearch.")
+    parser.add_argument('--refresh-policy', default='true', choices=['true', 'wait_for', 'none'],
+                        help="Refresh done after each bulk request; 'none' refreshes the index once at the end.")
+    parser.add_argument('--bulk-load', action='store_true',
+                        help="Disable refresh and replicas of the indexes while they are rebuilt (--no_incremental).")
+    parser.add_argument('--checkpoint-bulks', type=int,
+                        help="Save a checkpoint to resume the enrichment every N bulks uploaded (default disabled).")
+    parser.add_argument('--enrich-workers', type=int,
+                        help="Number of processes enriching the raw items (default 1).")
+    parser.add_argument('--cache-size', type=int,
+                        help="Max number of entries of each in-memory cache of the enrichment (default 4096).")
+    parser.add_argument('--cache-ttl', type=int,
+                        help="Seconds the entries of the in-memory caches are valid (default no expiration).")
+    parser.add_argument('--cache-policy', choices=CACHE_POLICIES,
+                        help="Eviction policy of the in-memory caches (default lru).")
+    parser.add_argument('--identities-cache-dir',
+                        help="Directory of the cache of SortingHat individuals shared by the enrichments of the host.")
+    parser.add_argument('--skip-index-setup', action='store_true',
+                        help="Don't update the settings, mappings and aliases of the indexes that already exist.")
     parser.add_argument('--scroll-wait', default=900, type=int, help="Wait for available scroll (default 900s)")
     parser.add_argument('--scroll-size', default=100, type=int,
                         help="Number of items to get from Elasticsearch when scrolling.")
+    parser.add_argument('--scroll-slices', default=1, type=int,
+                        help="Number of slices used to read the indexes in parallel (default 1, no slicing).")
+    parser.add_argument('--pagination', default='scroll', choices=['scroll', 'pit'],
+                        help="Read the indexes using scroll or point in time with search_after (default scroll).")
     parser.add_argument('--pair-programming', action='store_true', help="Do pair programming in git enrich")
     parser.add_argument('--studies-list', nargs='*', help="List of studies to be executed")
     parser.add_argument('backend', help=argparse.SUPPRESS)
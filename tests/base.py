@@ -29,6 +29,7 @@ from datetime import datetime
 
 from opensearchpy import OpenSearch
 
+from grimoire_elk.enriched.enrich import invalidate_identities_caches
 from grimoire_elk.enriched.sortinghat_gelk import SortingHat
 
 if '..' not in sys.path:
@@ -151,6 +152,9 @@ class TestBaseBackend(unittest.TestCase):
         self.ocean_aliases = []
         self.enrich_aliases = []
 
+        # The identities are removed from SortingHat between tests
+        invalidate_identities_caches()
+
     def tearDown(self):
         delete_test_idx = self.es_con + "/" + 'test*'
         requests.delete(delete_test_idx, verify=False)
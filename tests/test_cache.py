@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import gc
+import unittest
+import unittest.mock
+import weakref
+
+from grimoire_elk.cache import (CACHE_SETTINGS,
+                                CACHE_SIZE,
+                                Cache,
+                                cached,
+                                clear_caches,
+                                configure_caches,
+                                get_cache,
+                                invalidate_caches,
+                                log_caches_stats)
+
+
+class CachedObject:
+
+    def __init__(self, name='obj'):
+        self.name = name
+        self.calls = []
+
+    @cached('test_square')
+    def square(self, value):
+        self.calls.append(value)
+        return value * value
+
+    @cached('test_greet', key=lambda self: self.name)
+    def greet(self, value):
+        self.calls.append(value)
+        return "{} {}".format(self.name, value)
+
+    @cached('test_error')
+    def error(self, value):
+        self.calls.append(value)
+        raise ValueError("error {}".format(value))
+
+
+class TestCache(unittest.TestCase):
+    """Unit tests for Cache class"""
+
+    def test_get_set(self):
+        """Test whether the values are stored and the stats updated"""
+
+        cache = Cache('test')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 0), 0)
+
+        cache.set('a', 1)
+        cache.set('b', None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIn('b', cache)
+        self.assertEqual(len(cache), 2)
+
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 2)
+        self.assertEqual(cache.summary(),
+                         "test: 2 entries, 1 hits, 2 misses (33.3% hit rate), 0 evictions, 0 expirations")
+
+    def test_lru(self):
+        """Test whether the least recently used entries are evicted"""
+
+        cache = Cache('test', size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertListEqual(list(cache.entries.keys()), ['a', 'c'])
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_fifo(self):
+        """Test whether the oldest entries are evicted"""
+
+        cache = Cache('test', size=2, policy='fifo')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertListEqual(list(cache.entries.keys()), ['b', 'c'])
+
+        with self.assertRaisesRegex(ValueError, "Unknown cache policy"):
+            cache.configure(policy='lfu')
+
+    def test_ttl(self):
+        """Test whether the expired entries are not returned"""
+
+        cache = Cache('test', ttl=10)
+
+        with unittest.mock.patch('grimoire_elk.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with unittest.mock.patch('grimoire_elk.cache.time.monotonic', return_value=105):
+            self.assertEqual(cache.get('a'), 1)
+        with unittest.mock.patch('grimoire_elk.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+        self.assertEqual(cache.stats['expirations'], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_get_or_call(self):
+        """Test whether the function is called only when the key is not cached"""
+
+        cache = Cache('test')
+        func = unittest.mock.Mock(return_value=None)
+
+        self.assertIsNone(cache.get_or_call('a', func))
+        self.assertIsNone(cache.get_or_call('a', func))
+        self.assertEqual(func.call_count, 1)
+
+
+class TestSharedCaches(unittest.TestCase):
+    """Unit tests for the shared caches"""
+
+    def setUp(self):
+        clear_caches()
+        self.addCleanup(configure_caches, size=CACHE_SIZE, ttl=0, policy='lru')
+
+    def test_cached(self):
+        """Test whether the results of the methods are shared by the objects"""
+
+        obj1 = CachedObject()
+        obj2 = CachedObject()
+
+        self.assertEqual(obj1.square(3), 9)
+        self.assertEqual(obj2.square(3), 9)
+        self.assertEqual(obj2.square(4), 16)
+        self.assertListEqual(obj1.calls, [3])
+        self.assertListEqual(obj2.calls, [4])
+
+        cache = get_cache('test_square')
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 2)
+
+    def test_cached_key(self):
+        """Test whether the results depending on the object are not shared by other objects"""
+
+        obj1 = CachedObject('obj1')
+        obj2 = CachedObject('obj2')
+
+        self.assertEqual(obj1.greet(1), "obj1 1")
+        self.assertEqual(obj2.greet(1), "obj2 1")
+        self.assertEqual(CachedObject('obj1').greet(1), "obj1 1")
+        self.assertListEqual(obj1.calls, [1])
+        self.assertListEqual(obj2.calls, [1])
+
+    def test_invalidate_caches(self):
+        """Test whether only the entries of the given caches are removed"""
+
+        obj = CachedObject()
+        obj.square(2)
+        obj.greet(2)
+        obj.square(2)
+
+        invalidate_caches(['test_square', 'test_unknown'])
+
+        self.assertEqual(len(get_cache('test_square')), 0)
+        self.assertEqual(get_cache('test_square').stats['hits'], 1)
+        self.assertEqual(len(get_cache('test_greet')), 1)
+
+        obj.square(2)
+        self.assertListEqual(obj.calls, [2, 2, 2])
+
+    def test_cached_error(self):
+        """Test whether the errors are not cached"""
+
+        obj = CachedObject()
+        for _ in range(2):
+            with self.assertRaisesRegex(ValueError, "error 1"):
+                obj.error(1)
+        self.assertListEqual(obj.calls, [1, 1])
+
+    def test_objects_not_kept(self):
+        """Test whether the cache doesn't keep the objects alive"""
+
+        obj = CachedObject()
+        obj.square(5)
+        ref = weakref.ref(obj)
+
+        del obj
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_configure(self):
+        """Test whether the settings are applied to the existing and new caches"""
+
+        cache = get_cache('test_square')
+        for i in range(10):
+            cache.set(i, i)
+
+        configure_caches(size=5, ttl=60, policy='fifo')
+
+        self.assertEqual(len(cache), 5)
+        self.assertEqual(cache.ttl, 60)
+        self.assertEqual(get_cache('test_new').policy, 'fifo')
+        self.assertEqual(CACHE_SETTINGS['size'], 5)
+
+    def test_log_stats(self):
+        """Test whether the stats of the caches used are logged"""
+
+        CachedObject().square(2)
+
+        with self.assertLogs('grimoire_elk.cache', level='INFO') as cm:
+            log_caches_stats()
+
+        self.assertEqual(len(cm.output), 1)
+        self.assertIn("test_square: 1 entries, 0 hits, 1 misses", cm.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime
+import json
+import unittest
+import unittest.mock
+
+import httpretty
+
+from grimoire_elk.elastic_bulk import BulkWriter
+from grimoire_elk.elastic_items import ElasticItems
+from grimoire_elk.elk import resume_enrichment
+from grimoire_elk.enriched.checkpoint import (CHECKPOINT_DONE,
+                                              CHECKPOINT_RUNNING,
+                                              CHECKPOINTS_INDEX,
+                                              CheckpointStore)
+from grimoire_elk.enriched.enrich import Enrich
+
+
+class MockStore:
+    """Store the checkpoints in memory"""
+
+    def __init__(self, checkpoints=None):
+        self.checkpoints = checkpoints or {}
+        self.saved = []
+
+    def get(self, checkpoint_id):
+        return self.checkpoints.get(checkpoint_id)
+
+    def save(self, checkpoint_id, checkpoint, status=CHECKPOINT_RUNNING):
+        checkpoint = dict(checkpoint, status=status)
+        self.checkpoints[checkpoint_id] = checkpoint
+        self.saved.append(checkpoint)
+
+
+class CheckpointEnrich(Enrich):
+
+    def get_rich_item(self, item):
+        return {"uuid": item['uuid']}
+
+
+class TestCheckpointStore(unittest.TestCase):
+    """Unit tests for CheckpointStore class"""
+
+    url = "http://es-checkpoints.test:9200"
+
+    def test_get_checkpoint_id(self):
+        """Test whether the id depends on the connector, origin, filter raw and index"""
+
+        checkpoint_id = CheckpointStore.get_checkpoint_id("git", "https://example.com/repo", None, "git_enriched")
+        self.assertEqual(checkpoint_id,
+                         CheckpointStore.get_checkpoint_id("git", "https://example.com/repo", None, "git_enriched"))
+        self.assertNotEqual(checkpoint_id,
+                            CheckpointStore.get_checkpoint_id("git", "https://example.com/repo", "data.a:1",
+                                                              "git_enriched"))
+        self.assertNotEqual(checkpoint_id,
+                            CheckpointStore.get_checkpoint_id("git", "https://example.com/other", None,
+                                                              "git_enriched"))
+
+    @httpretty.activate
+    def test_get_not_found(self):
+        """Test whether None is returned when there is no checkpoint"""
+
+        store = CheckpointStore(self.url)
+        httpretty.register_uri(httpretty.GET, store.index_url + "/_doc/abc", body='{"found": false}', status=404)
+
+        self.assertEqual(store.index_url, self.url + "/" + CHECKPOINTS_INDEX)
+        self.assertIsNone(store.get("abc"))
+
+    @httpretty.activate
+    def test_save(self):
+        """Test whether the checkpoints are stored with their status"""
+
+        store = CheckpointStore(self.url)
+        httpretty.register_uri(httpretty.PUT, store.index_url + "/_doc/abc", body='{"result": "created"}', status=201)
+        httpretty.register_uri(httpretty.GET, store.index_url + "/_doc/abc",
+                               body=json.dumps({"found": True, "_source": {"offset": 10, "status": "done"}}),
+                               status=200)
+
+        store.save("abc", {"offset": 10, "timestamp": None, "uuid": "1"}, status=CHECKPOINT_DONE)
+
+        checkpoint = json.loads(httpretty.last_request().body)
+        self.assertEqual(checkpoint['offset'], 10)
+        self.assertEqual(checkpoint['status'], CHECKPOINT_DONE)
+        self.assertIn('updated_on', checkpoint)
+
+        self.assertDictEqual(store.get("abc"), {"offset": 10, "status": "done"})
+
+
+class TestEnrichCheckpoints(unittest.TestCase):
+    """Unit tests of the checkpoints saved by the enrichment"""
+
+    def setUp(self):
+        self.items = [
+            {
+                "uuid": str(i),
+                "offset": None,
+                "metadata__timestamp": "2023-01-{:02d}T00:00:00+00:00".format(i + 1)
+            }
+            for i in range(10)
+        ]
+
+    def _get_enricher(self, store):
+        def send(body):
+            return len(body.splitlines()) // 2
+
+        def get_bulk_writer(url, on_sent=None):
+            return BulkWriter(send, max_items=2, on_sent=on_sent)
+
+        enricher = CheckpointEnrich()
+        enricher.prefetch_size = 0
+        enricher.checkpoint_bulks = 2
+        enricher.elastic = unittest.mock.Mock(get_bulk_url=lambda: "http://es.test/enriched/_bulk",
+                                              get_bulk_writer=get_bulk_writer)
+        enricher.set_checkpoint_store(store, "abc")
+        return enricher
+
+    def test_save_checkpoints(self):
+        """Test whether a checkpoint is saved every N bulks sent"""
+
+        store = MockStore()
+        enricher = self._get_enricher(store)
+        enricher.upload_rich_items(self.items)
+
+        # 5 bulks of 2 items; the checkpoints are saved after bulks 2 and 4
+        self.assertEqual(len(store.saved), 3)
+        self.assertDictEqual(store.saved[0], {"timestamp": self.items[3]['metadata__timestamp'],
+                                              "status": CHECKPOINT_RUNNING})
+        self.assertEqual(store.saved[1]['timestamp'], self.items[7]['metadata__timestamp'])
+        self.assertDictEqual(store.saved[2], {"timestamp": self.items[9]['metadata__timestamp'],
+                                              "status": CHECKPOINT_DONE})
+
+        # The enrichment finished, so there is nothing to resume
+        self.assertIsNone(enricher.get_resume_checkpoint())
+
+    def test_resume_checkpoint(self):
+        """Test whether the checkpoints of enrichments not finished are returned"""
+
+        checkpoint = {"timestamp": "2023-01-04T00:00:00+00:00", "status": CHECKPOINT_RUNNING}
+        store = MockStore({"abc": checkpoint})
+        enricher = self._get_enricher(store)
+
+        self.assertDictEqual(enricher.get_resume_checkpoint(), checkpoint)
+
+    def test_save_error(self):
+        """Test whether the errors saving the checkpoints don't stop the enrichment"""
+
+        store = MockStore()
+        store.save = unittest.mock.Mock(side_effect=ValueError("store not available"))
+        enricher = self._get_enricher(store)
+
+        with self.assertLogs('grimoire_elk.enriched.enrich', level='WARNING'):
+            enricher.upload_rich_items(self.items)
+
+        self.assertEqual(store.save.call_count, 3)
+
+
+class TestResumeEnrichment(unittest.TestCase):
+    """Unit tests for resume_enrichment"""
+
+    def test_resume_from_date(self):
+        """Test whether the raw items are read from the date of the checkpoint"""
+
+        ocean_backend = ElasticItems(None)
+        resume_enrichment(ocean_backend, {"timestamp": "2023-01-04T00:00:00+00:00"})
+        self.assertEqual(ocean_backend.from_date,
+                         datetime.datetime(2023, 1, 4, tzinfo=datetime.timezone.utc))
+
+        # The checkpoint is not used when it is before the date of the backend
+        ocean_backend = ElasticItems(None, from_date=datetime.datetime(2023, 2, 1))
+        resume_enrichment(ocean_backend, {"timestamp": "2023-01-04T00:00:00+00:00"})
+        self.assertEqual(ocean_backend.from_date, datetime.datetime(2023, 2, 1))
+
+    def test_resume_offset_backend(self):
+        """Test whether the backends with offset are resumed from the date of the checkpoint"""
+
+        ocean_backend = ElasticItems(None, offset=30)
+        resume_enrichment(ocean_backend, {"timestamp": "2023-01-04T00:00:00+00:00"})
+        self.assertEqual(ocean_backend.from_date,
+                         datetime.datetime(2023, 1, 4, tzinfo=datetime.timezone.utc))
+
+        # The date has priority over the offset when the raw items are read
+        query = ocean_backend.get_elastic_query()
+        self.assertDictEqual(query['query']['bool']['filter'][-1],
+                             {"range": {"metadata__timestamp": {"gte": "2023-01-04T00:00:00+00:00"}}})
+
+        # The checkpoints saved before keep being used
+        ocean_backend = ElasticItems(None, offset=30)
+        resume_enrichment(ocean_backend, {"timestamp": "2023-01-04T00:00:00+00:00", "offset": 25, "uuid": "3"})
+        self.assertEqual(ocean_backend.from_date,
+                         datetime.datetime(2023, 1, 4, tzinfo=datetime.timezone.utc))
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import os
+import unittest
+
+from grimoire_elk import codec
+from grimoire_elk.codec import dumps, loads, remove_surrogates, use_orjson
+
+
+def read_file(filename, mode='r'):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), filename), mode) as f:
+        content = f.read()
+    return content
+
+
+def legacy_loads(data):
+    """Decoding done before the codec module, used as reference"""
+
+    obj = json.loads(data.decode('utf-8', errors='replace'))
+    return json.loads(json.dumps(obj, ensure_ascii=False).encode('utf-8', errors='ignore').decode('utf-8'))
+
+
+class TestCodec(unittest.TestCase):
+    """Unit tests for the JSON codec"""
+
+    DOCUMENTS = [
+        rb'{"a": "lone high \ud800 surrogate"}',
+        rb'{"a": "lone low \udfff surrogate", "\udc00key": 1}',
+        rb'{"a": "escaped backslash \\ud800", "b": "\\\ud800"}',
+        r'{"a": "pair 😀 and lone \ud800😀\udc00"}'.encode('utf-8'),
+        b'{"a": "invalid utf-8 \xff\xfe", "b": "\xed\xa0\x80"}',
+        b'{"a": 12345678901234567890123, "b": -9223372036854775809, "c": 0.1}',
+        '{"a": "ñ 😀 \\u00f1"}'.encode('utf-8'),
+    ]
+
+    def tearDown(self):
+        use_orjson(True)
+
+    def test_loads(self):
+        """Test whether the documents are decoded like the legacy cleanup"""
+
+        for enabled in [True, False]:
+            use_orjson(enabled)
+            for document in self.DOCUMENTS:
+                self.assertEqual(loads(document), legacy_loads(document))
+
+    def test_loads_fixtures(self):
+        """Test whether the fixtures are decoded like the legacy cleanup"""
+
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        for filename in sorted(os.listdir(data_dir)):
+            if not filename.endswith('.json'):
+                continue
+            document = read_file(os.path.join('data', filename), mode='rb')
+            try:
+                expected = legacy_loads(document)
+            except ValueError:
+                # Some fixtures contain several JSON documents
+                continue
+            for enabled in [True, False]:
+                use_orjson(enabled)
+                self.assertEqual(loads(document), expected, filename)
+
+    def test_loads_str(self):
+        """Test whether str documents are decoded"""
+
+        self.assertDictEqual(loads('{"a": "ñ\\ud800"}'), {"a": "ñ"})
+
+    def test_remove_surrogates(self):
+        """Test whether only the lone surrogates are removed"""
+
+        self.assertEqual(remove_surrogates(r'"\ud800a\\ud800\\\udc00"'), r'"a\\ud800\\"')
+        self.assertEqual(remove_surrogates(r'"😀A"'), r'"😀A"')
+        self.assertEqual(remove_surrogates('"no escapes"'), '"no escapes"')
+
+    def test_dumps(self):
+        """Test whether the objects are encoded"""
+
+        obj = {"a": "ñ", "b": [1, 2.5, None, True], 1: "int key", "c": 12345678901234567890123}
+
+        for enabled in [True, False]:
+            use_orjson(enabled)
+            self.assertEqual(json.loads(dumps(obj)), json.loads(json.dumps(obj)))
+
+    def test_dumps_surrogates(self):
+        """Test whether the strings with lone surrogates are encoded"""
+
+        for enabled in [True, False]:
+            use_orjson(enabled)
+            self.assertEqual(dumps({"a": "\ud800"}), '{"a": "\\ud800"}')
+
+    def test_use_orjson(self):
+        """Test whether orjson can be disabled"""
+
+        self.assertFalse(use_orjson(False))
+        self.assertFalse(codec.ORJSON_LIB)
+        self.assertEqual(use_orjson(True), codec.orjson is not None)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from perceval.backends.core.git import Git
+
+from grimoire_elk.commits_store import CommitsStore
+from grimoire_elk.elastic_bulk import BulkResult
+from grimoire_elk.enriched.git import GitEnrich
+from grimoire_elk.raw.git import GitOcean
+
+HASH_1 = "456a68ee1407a77f3e804a30dff245bb6c6b872f"
+HASH_2 = "51a3b654f252210572297f47597b31527c475fb8"
+HASH_3 = "bc57a9209f096a130dcc5ba7089a8663f758a703"
+ORIGIN = "http://example.com/repo.git"
+
+
+class TestCommitsStore(unittest.TestCase):
+    """Unit tests for CommitsStore class"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='commits_store_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_save_load(self):
+        """Test whether the hashes are stored sorted and without duplicates"""
+
+        store = CommitsStore(self.tmp_path, 'git_raw', ORIGIN)
+        self.assertIsNone(store.load())
+
+        store.save([HASH_3, HASH_1, HASH_3, 'not a hash'])
+        self.assertListEqual(store.load(), [HASH_1, HASH_3])
+
+        store = CommitsStore(self.tmp_path, 'git_raw', ORIGIN)
+        self.assertListEqual(store.load(), [HASH_1, HASH_3])
+
+        store.save([])
+        self.assertListEqual(store.load(), [])
+
+    def test_add_remove(self):
+        """Test whether the hashes are added and removed"""
+
+        store = CommitsStore(self.tmp_path, 'git_raw', ORIGIN)
+        store.remove([HASH_1])
+        self.assertIsNone(store.load())
+
+        store.add([HASH_2])
+        store.add([HASH_1, HASH_3])
+        self.assertListEqual(store.load(), [HASH_1, HASH_2, HASH_3])
+
+        store.remove([HASH_2, HASH_3])
+        self.assertListEqual(store.load(), [HASH_1])
+
+    def test_corrupted(self):
+        """Test whether a corrupted store is not loaded"""
+
+        store = CommitsStore(self.tmp_path, 'git_raw', ORIGIN)
+        store.save([HASH_1])
+        with open(store.file_path, 'ab') as fd:
+            fd.write(b'\x01')
+
+        self.assertIsNone(store.load())
+
+
+class TestGitCommitsStore(unittest.TestCase):
+    """Unit tests for the commits store of the git raw and enriched backends"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='commits_store_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def get_ocean_backend(self):
+        ocean_backend = GitOcean(Git(ORIGIN, '/tmp/foo'))
+        ocean_backend.commits_store_dir = self.tmp_path
+        ocean_backend.elastic = unittest.mock.MagicMock(max_items_bulk=10, index='git_raw')
+        ocean_backend.elastic.bulk_upload_result.side_effect = lambda items, field_id: BulkResult(len(items))
+        return ocean_backend
+
+    def test_feed_items(self):
+        """Test whether the commits fed are added to the store"""
+
+        items = [
+            {
+                'uuid': _hash,
+                'updated_on': 1500000000.0,
+                'timestamp': 1500000000.0,
+                'origin': ORIGIN,
+                'tag': ORIGIN,
+                'data': {'commit': _hash}
+            }
+            for _hash in [HASH_2, HASH_1]
+        ]
+
+        ocean_backend = self.get_ocean_backend()
+        ocean_backend.feed_items(iter(items))
+
+        self.assertListEqual(ocean_backend.get_commits_store().load(), [HASH_1, HASH_2])
+
+    def test_feed_items_failed(self):
+        """Test whether the commits of the packs with failed items are not added to the store"""
+
+        hashes = [HASH_1, HASH_2, HASH_3]
+        items = [
+            {
+                'uuid': _hash,
+                'updated_on': 1500000000.0,
+                'timestamp': 1500000000.0,
+                'origin': ORIGIN,
+                'tag': ORIGIN,
+                'backend_name': 'Git',
+                'backend_version': '1.0',
+                'data': {'commit': _hash}
+            }
+            for _hash in hashes
+        ]
+
+        def bulk_upload_result(items, field_id):
+            if items[0]['uuid'] == HASH_2:
+                return BulkResult(len(items) - 1, permanent=1)
+            return BulkResult(len(items))
+
+        ocean_backend = self.get_ocean_backend()
+        ocean_backend.elastic.max_items_bulk = 1
+        ocean_backend.elastic.bulk_upload_result.side_effect = bulk_upload_result
+        ocean_backend.feed_items(iter(items))
+
+        self.assertEqual(ocean_backend.feed_result.failed, 1)
+        self.assertListEqual(ocean_backend.get_commits_store().load(), [HASH_1, HASH_3])
+
+    def test_get_commits_origin_raw(self):
+        """Test whether the commits are read from the store when it has the commits of the raw index"""
+
+        fltr = {'name': 'origin', 'value': [ORIGIN]}
+        raw_items = [{'data': {'commit': HASH_1}}, {'data': {'commit': HASH_3}}]
+
+        ocean_backend = self.get_ocean_backend()
+        ocean_backend.fetch = unittest.mock.MagicMock(side_effect=lambda **kwargs: iter(raw_items))
+        ocean_backend.elastic.count_documents.return_value = 2
+        enrich_backend = GitEnrich()
+
+        # The store doesn't exist, so the raw index is scanned
+        hashes = enrich_backend.get_commits_origin_raw(ocean_backend, fltr)
+        self.assertSetEqual(set(hashes), {HASH_1, HASH_3})
+        self.assertEqual(ocean_backend.fetch.call_count, 1)
+        self.assertListEqual(ocean_backend.get_commits_store().load(), [HASH_1, HASH_3])
+
+        hashes = enrich_backend.get_commits_origin_raw(ocean_backend, fltr)
+        self.assertListEqual(hashes, [HASH_1, HASH_3])
+        self.assertEqual(ocean_backend.fetch.call_count, 1)
+        ocean_backend.elastic.count_documents.assert_called_with([{'name': 'origin', 'value': ORIGIN}])
+
+        # The raw index has other commits, so it is scanned again
+        ocean_backend.elastic.count_documents.return_value = 3
+        raw_items.append({'data': {'commit': HASH_2}})
+        hashes = enrich_backend.get_commits_origin_raw(ocean_backend, fltr)
+        self.assertSetEqual(set(hashes), {HASH_1, HASH_2, HASH_3})
+        self.assertEqual(ocean_backend.fetch.call_count, 2)
+        self.assertListEqual(ocean_backend.get_commits_store().load(), [HASH_1, HASH_2, HASH_3])
+
+    def test_update_items_invalidate_raw_store(self):
+        """Test whether the raw store is invalidated when commits are deleted"""
+
+        ocean_backend = self.get_ocean_backend()
+        ocean_backend.elastic.index_url = 'http://es.test:9200/git_raw'
+        ocean_backend.invalidate_raw_store = unittest.mock.MagicMock()
+        enriched = unittest.mock.MagicMock()
+        enriched.elastic.index_url = 'http://es.test:9200/git_enriched'
+        enrich_backend = GitEnrich()
+        enrich_backend.perceval_backend = ocean_backend.perceval_backend
+        enrich_backend.remove_commits = unittest.mock.MagicMock()
+
+        with unittest.mock.patch.object(GitEnrich, 'get_diff_commits_origin_raw', return_value=[HASH_1]):
+            enrich_backend.update_items(ocean_backend, enriched)
+        ocean_backend.invalidate_raw_store.assert_called_once_with()
+
+        with unittest.mock.patch.object(GitEnrich, 'get_diff_commits_origin_raw', return_value=[]):
+            enrich_backend.update_items(ocean_backend, enriched)
+        ocean_backend.invalidate_raw_store.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
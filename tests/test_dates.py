@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime
+import unittest
+import unittest.mock
+
+from grimoirelab_toolkit.datetime import InvalidDateError, str_to_datetime
+
+from grimoire_elk.enriched.dates import get_date_parts, parse_date
+
+
+class TestParseDate(unittest.TestCase):
+    """Unit tests for parse_date"""
+
+    def setUp(self):
+        parse_date.cache_clear()
+
+    def test_formats(self):
+        """Test whether the dates are the same returned by str_to_datetime"""
+
+        dates = [
+            "2023-01-31",
+            "2023-01-31T10:20:30",
+            "2023-01-31T10:20:30Z",
+            "2023-01-31 10:20:30.5+01:00",
+            "2023-01-31T10:20:30.123456-0530",
+            "2012-05-22T00:00:00+00:00",
+            "Tue, 31 Jan 2023 10:20:30 +0100",
+            "31 Jan 2023 10:20:30 -0000",
+            "Tue Jan 31 10:20:30 2023 +0100",
+            "Tue Feb 11 22:10:39 2014 -0800",
+            "Wed, 26 Oct 2005 15:20:32 -0100 (GMT+1)",
+            "2023-01-31T10:20",
+            "2023-01-31T10:20:30+99:00"
+        ]
+        for date in dates:
+            expected = str_to_datetime(date)
+            result = parse_date(date)
+            self.assertEqual(result, expected, date)
+            self.assertEqual(result.isoformat(), expected.isoformat(), date)
+            self.assertEqual(result.strftime("%z"), expected.strftime("%z"), date)
+
+    def test_fallback(self):
+        """Test whether the dates in other formats are parsed by str_to_datetime"""
+
+        with unittest.mock.patch('grimoire_elk.enriched.dates.str_to_datetime',
+                                 wraps=str_to_datetime) as mock_parser:
+            parse_date("2023-01-31T10:20:30+01:00")
+            parse_date("Tue Jan 31 10:20:30 2023 +0100")
+            self.assertEqual(mock_parser.call_count, 0)
+
+            parse_date("31/01/2023 10:20")
+            self.assertEqual(mock_parser.call_count, 1)
+
+    def test_invalid(self):
+        """Test whether an exception is raised for invalid dates"""
+
+        for date in ["2023-02-30", "2023-13-01T10:20:30", "not a date", "", None]:
+            with self.assertRaises(InvalidDateError):
+                parse_date(date)
+
+    def test_memo(self):
+        """Test whether the dates parsed are memoized"""
+
+        self.assertIs(parse_date("2023-01-31T10:20:30"), parse_date("2023-01-31T10:20:30"))
+        self.assertEqual(parse_date.cache_info().hits, 1)
+
+
+class TestGetDateParts(unittest.TestCase):
+    """Unit tests for get_date_parts"""
+
+    def test_parts(self):
+        """Test whether the local and UTC fields are derived from a date"""
+
+        parts = get_date_parts(parse_date("Sun Jan 1 01:30:00 2023 +0200"))
+
+        self.assertEqual(parts.isoformat, "2023-01-01T01:30:00")
+        self.assertEqual(parts.weekday, 7)
+        self.assertEqual(parts.hour, 1)
+        self.assertEqual(parts.utc_isoformat, "2022-12-31T23:30:00")
+        self.assertEqual(parts.utc_weekday, 6)
+        self.assertEqual(parts.utc_hour, 23)
+
+    def test_same_instant(self):
+        """Test whether the dates of the same instant with different offsets have their own fields"""
+
+        date = parse_date("2023-01-01T10:00:00+02:00")
+        utc_date = date.astimezone(datetime.timezone.utc)
+        self.assertEqual(date, utc_date)
+
+        self.assertEqual(get_date_parts(date).isoformat, "2023-01-01T10:00:00")
+        self.assertEqual(get_date_parts(utc_date).isoformat, "2023-01-01T08:00:00")
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
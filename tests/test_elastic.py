@@ -32,6 +32,9 @@ import requests
 
 from grimoire_elk.elastic import (ElasticSearch,
                                   ElasticError,
+                                  REFRESH_NONE,
+                                  REFRESH_TRUE,
+                                  REFRESH_WAIT_FOR,
                                   logger)
 from grimoire_elk.raw.git import GitOcean
 from grimoire_elk.raw.kitsune import KitsuneOcean
@@ -829,5 +832,386 @@ class TestElastic(unittest.TestCase):
             self.assertRegex(cm.output[0], 'ERROR:grimoire_elk.elastic:\\[items retention\\] Error deleted items*')
 
 
+class TestElasticRefresh(unittest.TestCase):
+    """Test the refresh of the indexes"""
+
+    url = "http://localhost:9200"
+    index = "test_refresh"
+    index_url = url + "/" + index
+
+    def tearDown(self):
+        ElasticSearch.refresh_policy = REFRESH_TRUE
+
+    @staticmethod
+    def register_settings(index_settings):
+        httpretty.register_uri(httpretty.GET,
+                               TestElasticRefresh.index_url + "/_settings",
+                               body=json.dumps({TestElasticRefresh.index: {"settings": index_settings}}),
+                               status=200)
+        httpretty.register_uri(httpretty.PUT,
+                               TestElasticRefresh.index_url + "/_settings",
+                               body='{"acknowledged": true}',
+                               status=200)
+        httpretty.register_uri(httpretty.POST,
+                               TestElasticRefresh.index_url + "/_refresh",
+                               body='{}',
+                               status=200)
+
+    @staticmethod
+    def latest_requests():
+        # httpretty records twice the requests with a body
+        reqs = []
+        for req in httpretty.latest_requests():
+            if reqs and (req.method, req.path, req.body) == (reqs[-1].method, reqs[-1].path, reqs[-1].body):
+                continue
+            reqs.append(req)
+        return reqs
+
+    @httpretty.activate
+    def test_safe_put_bulk_refresh_policy(self):
+        """Test whether the refresh policy is used in the bulk requests"""
+
+        bulk_url = self.index_url + "/_bulk"
+        httpretty.register_uri(httpretty.PUT,
+                               bulk_url,
+                               body='{"errors": false, "items": [{"index": {"_id": "1"}}]}',
+                               status=200)
+        bulk_json = '{"index" : {"_id" : "1" } }\n{"value": 1}\n'
+
+        elastic = MockElasticSearch(self.url, self.index)
+
+        expected = {
+            REFRESH_TRUE: {'refresh': ['true']},
+            REFRESH_WAIT_FOR: {'refresh': ['wait_for']},
+            REFRESH_NONE: {}
+        }
+        for policy, querystring in expected.items():
+            ElasticSearch.refresh_policy = policy
+            inserted = elastic.safe_put_bulk(bulk_url, bulk_json)
+
+            self.assertEqual(inserted, 1)
+            self.assertDictEqual(httpretty.last_request().querystring, querystring)
+
+    @httpretty.activate
+    def test_refresh_pending(self):
+        """Test whether the index is refreshed only when the bulks don't refresh it"""
+
+        self.register_settings({})
+        elastic = MockElasticSearch(self.url, self.index)
+
+        elastic.refresh_pending()
+        self.assertEqual(len(self.latest_requests()), 0)
+
+        ElasticSearch.refresh_policy = REFRESH_NONE
+        elastic.refresh_pending()
+        self.assertEqual(len(self.latest_requests()), 1)
+        self.assertEqual(httpretty.last_request().method, httpretty.POST)
+        self.assertEqual(httpretty.last_request().path, "/" + self.index + "/_refresh")
+
+    @httpretty.activate
+    def test_bulk_load(self):
+        """Test whether the settings of the index are restored after a bulk load"""
+
+        self.register_settings({"index.number_of_replicas": "1",
+                                "index.refresh_interval": "30s"})
+        elastic = MockElasticSearch(self.url, self.index)
+
+        with elastic.bulk_load():
+            pass
+
+        reqs = self.latest_requests()
+        self.assertEqual(len(reqs), 4)
+        self.assertEqual(reqs[0].method, httpretty.GET)
+        self.assertDictEqual(json.loads(reqs[1].body),
+                             {"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+        self.assertDictEqual(json.loads(reqs[2].body),
+                             {"index": {"refresh_interval": "30s", "number_of_replicas": "1"}})
+        self.assertEqual(reqs[3].path, "/" + self.index + "/_refresh")
+
+    @httpretty.activate
+    def test_bulk_load_error(self):
+        """Test whether the settings are restored when the bulk load fails"""
+
+        self.register_settings({"index.number_of_replicas": "1"})
+        elastic = MockElasticSearch(self.url, self.index)
+
+        with self.assertRaises(ValueError):
+            with elastic.bulk_load():
+                raise ValueError("failed")
+
+        reqs = self.latest_requests()
+        self.assertEqual(len(reqs), 4)
+        self.assertDictEqual(json.loads(reqs[2].body),
+                             {"index": {"refresh_interval": None, "number_of_replicas": "1"}})
+
+    @httpretty.activate
+    def test_bulk_load_interrupted(self):
+        """Test whether the default refresh is restored after an interrupted bulk load"""
+
+        self.register_settings({"index.number_of_replicas": "0",
+                                "index.refresh_interval": "-1"})
+        elastic = MockElasticSearch(self.url, self.index)
+
+        with elastic.bulk_load():
+            pass
+
+        reqs = self.latest_requests()
+        self.assertDictEqual(json.loads(reqs[2].body),
+                             {"index": {"refresh_interval": None, "number_of_replicas": "0"}})
+
+
+class TestElasticPutBulk(unittest.TestCase):
+    """Test the retries of the bulk requests"""
+
+    url = "http://localhost:9200"
+    index = "test_bulk"
+    bulk_url = url + "/" + index + "/_bulk"
+
+    @staticmethod
+    def bulk_body(ids):
+        body = ''
+        for _id in ids:
+            body += '{"index" : {"_id" : "%s" } }\n{"id": "%s"}\n' % (_id, _id)
+        return body
+
+    @staticmethod
+    def bulk_response(statuses):
+        items = []
+        for _id, status in statuses:
+            item = {"_id": _id, "status": status}
+            if status == 429:
+                item['error'] = {"type": "es_rejected_execution_exception", "reason": "rejected"}
+            elif status >= 400:
+                item['error'] = {"type": "mapper_parsing_exception", "reason": "failed to parse"}
+            items.append({"index": item})
+        return json.dumps({"errors": any(status >= 400 for _, status in statuses), "items": items})
+
+    def setUp(self):
+        self.elastic = MockElasticSearch(self.url, self.index)
+        self.elastic.bulk_retry_wait = 0
+
+    @httpretty.activate
+    def test_put_bulk_retry(self):
+        """Test whether only the rejected items are sent again"""
+
+        httpretty.register_uri(httpretty.PUT,
+                               self.bulk_url,
+                               responses=[
+                                   httpretty.Response(body=self.bulk_response([("1", 201), ("2", 429),
+                                                                               ("3", 400), ("4", 429)])),
+                                   httpretty.Response(body=self.bulk_response([("2", 201), ("4", 429)])),
+                                   httpretty.Response(body=self.bulk_response([("4", 201)]))
+                               ])
+
+        with self.assertLogs(logger, level='WARNING') as cm:
+            result = self.elastic.put_bulk(self.bulk_url, self.bulk_body(["1", "2", "3", "4"]))
+
+        self.assertEqual(result.inserted, 3)
+        self.assertEqual(result.permanent, 1)
+        self.assertEqual(result.transient, 0)
+        self.assertEqual(result.rejected, 3)
+        self.assertListEqual(list(result.errors.keys()), ["mapper_parsing_exception"])
+
+        bodies = []
+        for req in httpretty.latest_requests():
+            body = req.body.decode('utf-8')
+            if not bodies or bodies[-1] != body:
+                bodies.append(body)
+        self.assertListEqual(bodies, [self.bulk_body(["1", "2", "3", "4"]),
+                                      self.bulk_body(["2", "4"]),
+                                      self.bulk_body(["4"])])
+        self.assertRegex(cm.output[0], "2 items rejected by .*, retrying them in 0 seconds \\(1/5\\)")
+        self.assertRegex(cm.output[-1], "ERROR:grimoire_elk.elastic:Failed to insert data to ES: 0 transient, "
+                                        "1 permanent errors.*mapper_parsing_exception \\(1 items\\)")
+
+    @httpretty.activate
+    def test_put_bulk_transient(self):
+        """Test whether the items rejected after all the retries are transient failures"""
+
+        httpretty.register_uri(httpretty.PUT,
+                               self.bulk_url,
+                               body=self.bulk_response([("1", 429)]))
+        self.elastic.max_bulk_retries = 2
+
+        with self.assertLogs(logger, level='ERROR'):
+            result = self.elastic.put_bulk(self.bulk_url, self.bulk_body(["1"]))
+        inserted = self.elastic.safe_put_bulk(self.bulk_url, self.bulk_body(["1"]))
+
+        self.assertEqual(result.inserted, 0)
+        self.assertEqual(result.transient, 1)
+        self.assertEqual(result.permanent, 0)
+        self.assertEqual(result.rejected, 3)
+        self.assertEqual(inserted, 0)
+
+
+class TestElasticGetDocuments(unittest.TestCase):
+    """Test the retrieval of documents with the multi get API"""
+
+    url = "http://localhost:9200"
+    index = "test_mget"
+    mget_url = url + "/" + index + "/_mget"
+
+    @httpretty.activate
+    def test_get_documents(self):
+        """Test whether the documents found are returned by id"""
+
+        response = {
+            "docs": [
+                {"_id": "1", "found": True, "_source": {"metadata__updated_on": "2023-01-01T00:00:00"}},
+                {"_id": "2", "found": False}
+            ]
+        }
+        httpretty.register_uri(httpretty.POST, self.mget_url, body=json.dumps(response), status=200)
+
+        elastic = MockElasticSearch(self.url, self.index)
+        documents = elastic.get_documents(["1", "2"], fields=["metadata__updated_on"])
+
+        self.assertDictEqual(documents, {"1": {"metadata__updated_on": "2023-01-01T00:00:00"}})
+        body = json.loads(httpretty.last_request().body)
+        self.assertDictEqual(body, {"docs": [{"_id": "1", "_source": ["metadata__updated_on"]},
+                                             {"_id": "2", "_source": ["metadata__updated_on"]}]})
+
+    @httpretty.activate
+    def test_get_documents_chunks(self):
+        """Test whether the documents are requested in chunks of max_items_clause ids"""
+
+        httpretty.register_uri(httpretty.POST, self.mget_url, body='{"docs": []}', status=200)
+
+        elastic = MockElasticSearch(self.url, self.index)
+        elastic.max_items_clause = 2
+        documents = elastic.get_documents(["1", "2", "3"])
+
+        self.assertDictEqual(documents, {})
+        bodies = [json.loads(req.body) for req in httpretty.latest_requests() if req.body]
+        ids = [doc['_id'] for body in bodies for doc in body['docs']]
+        self.assertEqual(sorted(set(ids)), ["1", "2", "3"])
+        self.assertNotIn('_source', bodies[0]['docs'][0])
+
+    @httpretty.activate
+    def test_count_documents(self):
+        """Test whether the documents matching the filters are counted"""
+
+        httpretty.register_uri(httpretty.POST, self.url + "/" + self.index + "/_count",
+                               body='{"count": 42}', status=200)
+
+        elastic = MockElasticSearch(self.url, self.index)
+        count = elastic.count_documents([{'name': 'origin', 'value': 'https://example.org/repo.git'}, None])
+
+        self.assertEqual(count, 42)
+        body = json.loads(httpretty.last_request().body)
+        self.assertDictEqual(body, {"query": {"bool": {"filter": [
+            {"term": {"origin": "https://example.org/repo.git"}}]}}})
+
+
+class TestElasticMetadataCache(unittest.TestCase):
+    """Test the cache of the setup of the indexes"""
+
+    url = "http://localhost:9200"
+    index = "test_metadata"
+    index_url = url + "/" + index
+
+    def setUp(self):
+        ElasticSearch.clear_metadata_cache()
+
+    def tearDown(self):
+        ElasticSearch.skip_index_setup = False
+        ElasticSearch.clear_metadata_cache()
+
+    def register(self, index_status=200):
+        version = {"version": {"number": "7.10.0"}, "tagline": "You Know, for Search"}
+        httpretty.register_uri(httpretty.GET, self.url + "/", body=json.dumps(version), status=200)
+        httpretty.register_uri(httpretty.HEAD, self.index_url, body='', status=index_status)
+        httpretty.register_uri(httpretty.GET, self.index_url, body='{}', status=index_status)
+        httpretty.register_uri(httpretty.PUT, self.index_url, body='{}', status=200)
+        httpretty.register_uri(httpretty.PUT, self.index_url + "/_mapping", body='{}', status=200)
+
+    @staticmethod
+    def requests_sent():
+        # httpretty records twice the requests with a body
+        reqs = []
+        for req in httpretty.latest_requests():
+            if req.body and reqs and (req.method, req.path, req.body) == reqs[-1]:
+                continue
+            reqs.append((req.method, req.path, req.body))
+        return [(method, path) for method, path, _ in reqs]
+
+    @httpretty.activate
+    def test_cached_setup(self):
+        """Test whether an index already set up is not set up again"""
+
+        self.register()
+
+        ElasticSearch(self.url, self.index, GitOcean.mapping)
+        n_requests = len(self.requests_sent())
+
+        elastic = ElasticSearch(self.url, self.index, GitOcean.mapping)
+        self.assertEqual(elastic.major, '7')
+        self.assertListEqual(self.requests_sent()[n_requests:], [('HEAD', '/' + self.index)])
+
+    @httpretty.activate
+    def test_different_metadata(self):
+        """Test whether the index is set up when the metadata changes"""
+
+        self.register()
+
+        ElasticSearch(self.url, self.index, GitOcean.mapping)
+        n_requests = len(self.requests_sent())
+
+        ElasticSearch(self.url, self.index, KitsuneOcean.mapping)
+        sent = self.requests_sent()[n_requests:]
+        self.assertIn(('PUT', '/' + self.index + '/_mapping'), sent)
+
+    @httpretty.activate
+    def test_clean(self):
+        """Test whether the index is always set up when it is cleaned"""
+
+        self.register()
+
+        ElasticSearch(self.url, self.index, GitOcean.mapping)
+        n_requests = len(self.requests_sent())
+
+        httpretty.register_uri(httpretty.DELETE, self.index_url, body='{}', status=200)
+        ElasticSearch(self.url, self.index, GitOcean.mapping, clean=True)
+        sent = self.requests_sent()[n_requests:]
+        self.assertIn(('DELETE', '/' + self.index), sent)
+        self.assertIn(('PUT', '/' + self.index + '/_mapping'), sent)
+
+    @httpretty.activate
+    def test_deleted_index(self):
+        """Test whether the index is set up again when it doesn't exist"""
+
+        self.register()
+        ElasticSearch(self.url, self.index, GitOcean.mapping)
+
+        self.register(index_status=404)
+        n_requests = len(self.requests_sent())
+        ElasticSearch(self.url, self.index, GitOcean.mapping)
+        sent = self.requests_sent()[n_requests:]
+        self.assertIn(('PUT', '/' + self.index), sent)
+
+    @httpretty.activate
+    def test_skip_index_setup(self):
+        """Test whether the setup of existing indexes is skipped"""
+
+        self.register()
+        ElasticSearch.skip_index_setup = True
+
+        ElasticSearch(self.url, self.index, GitOcean.mapping)
+        self.assertListEqual(self.requests_sent(), [('GET', '/'), ('HEAD', '/' + self.index)])
+
+    @httpretty.activate
+    def test_metadata_ttl(self):
+        """Test whether the instances cache expires"""
+
+        self.register()
+        ElasticSearch.get_instance(self.url, True)
+        ElasticSearch.get_instance(self.url, True)
+        self.assertEqual(len(self.requests_sent()), 1)
+
+        with unittest.mock.patch.object(ElasticSearch, 'metadata_ttl', 0):
+            ElasticSearch.get_instance(self.url, True)
+        self.assertEqual(len(self.requests_sent()), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import threading
+import unittest
+
+from grimoire_elk.codec import dumps
+from grimoire_elk.elastic_bulk import BulkResult, BulkWriter
+
+
+class MockBulkAPI:
+    """Store the bodies of the bulks received"""
+
+    def __init__(self, fail_after=None):
+        self.bodies = []
+        self.threads = set()
+        self.fail_after = fail_after
+
+    def send(self, body):
+        if self.fail_after is not None and len(self.bodies) >= self.fail_after:
+            raise ValueError("bulk failed")
+
+        self.bodies.append(body)
+        self.threads.add(threading.get_ident())
+        return len(body.splitlines()) // 2
+
+    def documents(self):
+        docs = []
+        for body in self.bodies:
+            lines = body.splitlines()
+            for action, doc in zip(lines[::2], lines[1::2]):
+                docs.append((json.loads(action)['index']['_id'], json.loads(doc)))
+        return docs
+
+
+class TestBulkWriter(unittest.TestCase):
+    """Unit tests for BulkWriter class"""
+
+    def test_add(self):
+        """Test whether the documents are sent in bulks of max_items"""
+
+        api = MockBulkAPI()
+        writer = BulkWriter(api.send, max_items=2)
+
+        items = [{"id": str(i), "value": i} for i in range(5)]
+        for item in items:
+            writer.add(item['id'], item)
+
+        self.assertEqual(len(api.bodies), 2)
+
+        total = writer.close()
+        self.assertEqual(total, 5)
+        self.assertEqual(writer.bulks, 3)
+        self.assertEqual(len(api.bodies), 3)
+
+        expected = '{"index" : {"_id" : "0" } }\n' + dumps(items[0]) + '\n' + \
+                   '{"index" : {"_id" : "1" } }\n' + dumps(items[1]) + '\n'
+        self.assertEqual(api.bodies[0], expected)
+        self.assertListEqual(api.documents(), [(item['id'], item) for item in items])
+
+    def test_max_bytes(self):
+        """Test whether the bulks are sent before exceeding max_bytes"""
+
+        api = MockBulkAPI()
+        writer = BulkWriter(api.send, max_items=1000, max_bytes=200)
+
+        for i in range(10):
+            writer.add(str(i), {"text": "x" * 50})
+        writer.close()
+
+        self.assertEqual(len(api.documents()), 10)
+        for body in api.bodies:
+            self.assertLessEqual(len(body.encode('utf-8')), 200)
+
+    def test_max_bytes_non_ascii(self):
+        """Test whether the size of non ASCII documents is measured in bytes"""
+
+        api = MockBulkAPI()
+        writer = BulkWriter(api.send, max_items=1000, max_bytes=200)
+
+        for i in range(10):
+            writer.add_json(str(i), '{"text": "%s"}' % ("ñ" * 40))
+        writer.close()
+
+        self.assertEqual(len(api.bodies), 10)
+        for body in api.bodies:
+            self.assertLessEqual(len(body.encode('utf-8')), 200)
+
+    def test_big_document(self):
+        """Test whether a document bigger than max_bytes is sent alone"""
+
+        api = MockBulkAPI()
+        writer = BulkWriter(api.send, max_items=1000, max_bytes=100)
+
+        writer.add("1", {"text": "x"})
+        writer.add("2", {"text": "x" * 500})
+        writer.add("3", {"text": "x"})
+        total = writer.close()
+
+        self.assertEqual(total, 3)
+        self.assertEqual(len(api.bodies), 3)
+
+    def test_close_empty(self):
+        """Test whether nothing is sent when there are no documents"""
+
+        api = MockBulkAPI()
+        writer = BulkWriter(api.send)
+        total = writer.close()
+
+        self.assertEqual(total, 0)
+        self.assertListEqual(api.bodies, [])
+
+    def test_background(self):
+        """Test whether the bulks are sent by a background thread"""
+
+        api = MockBulkAPI()
+
+        with BulkWriter(api.send, max_items=3, queue_size=1) as writer:
+            for i in range(10):
+                writer.add(str(i), {"value": i})
+
+        self.assertEqual(writer.total, 10)
+        self.assertEqual(len(api.bodies), 4)
+        self.assertGreater(writer.send_time, 0)
+        self.assertGreater(writer.wait_time, 0)
+        self.assertNotIn(threading.get_ident(), api.threads)
+        self.assertListEqual([doc['value'] for _, doc in api.documents()], list(range(10)))
+
+    def test_background_error(self):
+        """Test whether errors in the background thread are raised"""
+
+        api = MockBulkAPI(fail_after=1)
+        writer = BulkWriter(api.send, max_items=1, queue_size=1)
+
+        with self.assertRaises(ValueError):
+            for i in range(10):
+                writer.add(str(i), {"value": i})
+            writer.close()
+
+        self.assertIsNone(writer._thread)
+
+    def test_error(self):
+        """Test whether errors sending the bulks are raised"""
+
+        api = MockBulkAPI(fail_after=0)
+
+        with self.assertRaises(ValueError):
+            with BulkWriter(api.send, max_items=1) as writer:
+                writer.add("1", {"value": 1})
+                writer.add("2", {"value": 2})
+
+    def test_result(self):
+        """Test whether the results of the bulks are added"""
+
+        results = [BulkResult(inserted=1, permanent=1), BulkResult(inserted=2, transient=1, rejected=3)]
+        results[0].add_error("mapper_parsing_exception", {"reason": "failed"})
+        results[1].add_error("es_rejected_execution_exception", {"reason": "rejected"})
+
+        def send(body):
+            return results.pop(0)
+
+        with BulkWriter(send, max_items=2) as writer:
+            for i in range(4):
+                writer.add(str(i), {"value": i})
+
+        self.assertEqual(writer.total, 3)
+        self.assertEqual(writer.result.inserted, 3)
+        self.assertEqual(writer.result.transient, 1)
+        self.assertEqual(writer.result.permanent, 1)
+        self.assertEqual(writer.result.failed, 2)
+        self.assertEqual(writer.result.rejected, 3)
+        self.assertDictEqual(writer.result.errors,
+                             {"mapper_parsing_exception": (1, {"reason": "failed"}),
+                              "es_rejected_execution_exception": (1, {"reason": "rejected"})})
+
+    def test_adaptive(self):
+        """Test whether the size of the bulks adapts to the rejections"""
+
+        sizes = []
+
+        def send(body):
+            n_items = len(body.splitlines()) // 2
+            sizes.append(n_items)
+            rejected = 1 if len(sizes) in (1, 2) else 0
+            return BulkResult(inserted=n_items, rejected=rejected)
+
+        with BulkWriter(send, max_items=100, adaptive=True) as writer:
+            for i in range(1000):
+                writer.add(str(i), {"value": i})
+
+        self.assertEqual(writer.total, 1000)
+        self.assertListEqual(sizes[:5], [100, 50, 25, 35, 45])
+        self.assertLessEqual(max(sizes[5:]), 100)
+        self.assertEqual(writer.bulk_items, 100)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
@@ -23,12 +23,15 @@ import configparser
 import logging
 import json
 import os
+import threading
 import unittest
+import unittest.mock
 
 import requests
 
 from grimoire_elk.elastic import ElasticSearch
 from grimoire_elk.elastic_items import (ElasticItems,
+                                        include_source_field,
                                         logger)
 from grimoirelab_toolkit.datetime import str_to_datetime
 from grimoire_elk.raw.kitsune import KitsuneOcean
@@ -556,6 +559,436 @@ class TestElasticItems(unittest.TestCase):
             self.assertRegex(cm.output[-1], 'DEBUG:grimoire_elk.elastic_items:No results found from*')
 
 
+class TestIncludeSourceField(unittest.TestCase):
+    """Unit tests for include_source_field"""
+
+    def test_include_source_field(self):
+        """Test whether the field is added to the fields included"""
+
+        self.assertIsNone(include_source_field(None, "uuid"))
+        self.assertListEqual(include_source_field(["data.commit"], "uuid"), ["data.commit", "uuid"])
+        self.assertListEqual(include_source_field(["uuid"], "uuid"), ["uuid"])
+        self.assertDictEqual(include_source_field({"includes": ["data.commit"], "excludes": ["data.files"]}, "uuid"),
+                             {"includes": ["data.commit", "uuid"], "excludes": ["data.files"]})
+
+        # Only the fields excluded are not affected
+        _source = {"excludes": ["data.files"]}
+        self.assertDictEqual(include_source_field(_source, "uuid"), {"excludes": ["data.files"]})
+
+
+class MockElastic:
+    """Minimal ElasticSearch object to be used by the mocked tests"""
+
+    def __init__(self, url, index):
+        self.url = url
+        self.index = index
+        self.index_url = url + "/" + index
+
+
+class MockResponse:
+
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.text = json.dumps(data)
+        self.content = self.text.encode('utf-8')
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+
+class MockSlicedScroll:
+    """Emulate a sliced scroll over a list of items.
+
+    The object is shared by all the sessions created by `grimoire_con`,
+    which are used concurrently by the slice workers.
+    """
+
+    def __init__(self, items, page_size):
+        self.items = items
+        self.page_size = page_size
+        self.queries = []
+        self.scrolls = {}
+        self.released = []
+        self.lock = threading.Lock()
+
+    def __call__(self, insecure=True):
+        return self
+
+    def close(self):
+        pass
+
+    def page(self, scroll_id):
+        pending = self.scrolls[scroll_id]
+        hits, self.scrolls[scroll_id] = pending[:self.page_size], pending[self.page_size:]
+        return {
+            "_scroll_id": scroll_id,
+            "hits": {
+                "total": {"value": len(hits)},
+                "hits": [{"_source": item} for item in hits]
+            }
+        }
+
+    def post(self, url, data=None, headers=None):
+        query = json.loads(data)
+        with self.lock:
+            if 'scroll_id' in query:
+                return MockResponse(self.page(query['scroll_id']))
+
+            self.queries.append(query)
+            slice_id, max_slices = query['slice']['id'], query['slice']['max']
+            items = [item for i, item in enumerate(self.items) if i % max_slices == slice_id]
+            if 'sort' in query:
+                items.sort(key=lambda item: item['metadata__timestamp'])
+
+            scroll_id = "scroll-{}".format(slice_id)
+            self.scrolls[scroll_id] = items
+            return MockResponse(self.page(scroll_id))
+
+    def delete(self, url, data=None, headers=None):
+        with self.lock:
+            self.released.append(json.loads(data)['scroll_id'])
+        return MockResponse({})
+
+
+class TestElasticItemsSliced(unittest.TestCase):
+    """Unit tests for the sliced scroll of ElasticItems"""
+
+    es_con = "http://es-sliced.com"
+    target_index = "elastic_items_sliced"
+
+    def setUp(self):
+        self.perceval_backend = Git('http://example.com', '/tmp/foo')
+        # Timestamps are not sorted in the index
+        self.items = [
+            {
+                "uuid": str(i),
+                "origin": "http://example.com",
+                "metadata__timestamp": "2020-01-{:02d}T00:00:00+00:00".format((i * 7) % 20 + 1)
+            }
+            for i in range(20)
+        ]
+        self.mock = MockSlicedScroll(self.items, page_size=2)
+
+        patcher = unittest.mock.patch('grimoire_elk.elastic_items.grimoire_con', new=self.mock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_eitems(self, slices):
+        eitems = ElasticItems(self.perceval_backend)
+        eitems.elastic = MockElastic(self.es_con, self.target_index)
+        eitems.scroll_size = 2
+        eitems.scroll_slices = slices
+        return eitems
+
+    def test_fetch_sliced(self):
+        """Test whether all the items are fetched from all the slices"""
+
+        eitems = self._get_eitems(slices=3)
+        items = [item for item in eitems.fetch(ordered=False)]
+
+        self.assertEqual(len(items), len(self.items))
+        self.assertListEqual(sorted(item['uuid'] for item in items),
+                             sorted(item['uuid'] for item in self.items))
+
+        self.assertEqual(len(self.mock.queries), 3)
+        slices = sorted(query['slice']['id'] for query in self.mock.queries)
+        self.assertListEqual(slices, [0, 1, 2])
+        for query in self.mock.queries:
+            self.assertEqual(query['slice']['max'], 3)
+            self.assertNotIn('sort', query)
+            self.assertDictEqual(query['query']['bool']['filter'][0],
+                                 {"term": {"origin": "http://example.com"}})
+
+        self.assertListEqual(sorted(self.mock.released), ["scroll-0", "scroll-1", "scroll-2"])
+
+    def test_fetch_sliced_ordered(self):
+        """Test whether the items from all the slices are returned sorted"""
+
+        eitems = self._get_eitems(slices=4)
+        items = [item for item in eitems.fetch()]
+
+        expected = sorted(self.items, key=lambda item: item['metadata__timestamp'])
+        self.assertListEqual([item['metadata__timestamp'] for item in items],
+                             [item['metadata__timestamp'] for item in expected])
+
+        self.assertEqual(len(self.mock.queries), 4)
+        for query in self.mock.queries:
+            self.assertDictEqual(query['sort'], {"metadata__timestamp": {"order": "asc"}})
+
+    def test_fetch_sliced_source(self):
+        """Test whether the source filtering is sent in the queries of the slices"""
+
+        eitems = self._get_eitems(slices=2)
+        items = [item for item in eitems.fetch(ordered=False, _source=["uuid"])]
+        self.assertEqual(len(items), len(self.items))
+        for query in self.mock.queries:
+            self.assertListEqual(query['_source'], ["uuid"])
+
+        # The field used to merge the slices is always retrieved
+        self.mock.queries = []
+        items = [item for item in eitems.fetch(_source=["uuid"])]
+        self.assertEqual(len(items), len(self.items))
+        for query in self.mock.queries:
+            self.assertListEqual(query['_source'], ["uuid", "metadata__timestamp"])
+
+    def test_fetch_sliced_stop(self):
+        """Test whether the workers finish when the generator is closed"""
+
+        eitems = self._get_eitems(slices=2)
+        items = eitems.fetch()
+        item = next(items)
+        self.assertIn('uuid', item)
+        items.close()
+
+        self.assertListEqual(sorted(self.mock.released), ["scroll-0", "scroll-1"])
+
+    def test_fetch_not_sliced(self):
+        """Test whether the sliced scroll is not used by default"""
+
+        eitems = self._get_eitems(slices=1)
+        eitems.requests = self.mock
+
+        with unittest.mock.patch.object(self.mock, 'post',
+                                        return_value=MockResponse({"_scroll_id": "scroll-0",
+                                                                   "hits": {"total": {"value": 0},
+                                                                            "hits": []}})) as post:
+            items = [item for item in eitems.fetch()]
+
+        self.assertListEqual(items, [])
+        query = json.loads(post.call_args.kwargs['data'])
+        self.assertNotIn('slice', query)
+
+
+class MockPointInTime:
+    """Emulate point in time readers and search_after pagination"""
+
+    def __init__(self, items, distribution='elasticsearch', open_status=200, search_status=200):
+        self.items = sorted(items, key=lambda item: (item['metadata__timestamp'], item['uuid']))
+        self.distribution = distribution
+        self.open_status = open_status
+        self.search_status = search_status
+        self.opened = []
+        self.released = []
+        self.queries = []
+
+    def post(self, url, data=None, headers=None):
+        if 'keep_alive' in url:
+            self.opened.append(url)
+            if self.open_status != 200:
+                return MockResponse({"error": "no handler found"}, status_code=self.open_status)
+            key = 'pit_id' if self.distribution == 'opensearch' else 'id'
+            return MockResponse({key: "pit-1"})
+
+        query = json.loads(data)
+        self.queries.append(query)
+        if self.search_status != 200:
+            return MockResponse({"error": "search failed"}, status_code=self.search_status)
+
+        # The position of the items is their _shard_doc
+        items = list(enumerate(self.items))
+        for fltr in query['query']['bool']['filter']:
+            if 'range' in fltr and 'format' in fltr['range'].get('metadata__timestamp', {}):
+                items = [(i, item) for i, item in items
+                         if item['metadata__timestamp'] >= fltr['range']['metadata__timestamp']['gte']]
+        if 'search_after' in query:
+            after = tuple(query['search_after'])
+            items = [(i, item) for i, item in items if (item['metadata__timestamp'], i) > after]
+        hits = [{"_source": item, "sort": [item['metadata__timestamp'], i]}
+                for i, item in items[:query['size']]]
+
+        return MockResponse({"pit_id": "pit-1", "hits": {"hits": hits}})
+
+    def delete(self, url, data=None, headers=None):
+        self.released.append((url, json.loads(data)))
+        return MockResponse({})
+
+
+class TestElasticItemsPit(unittest.TestCase):
+    """Unit tests for the point in time pagination of ElasticItems"""
+
+    es_con = "http://es-pit.com"
+    target_index = "elastic_items_pit"
+
+    def setUp(self):
+        self.perceval_backend = Git('http://example.com', '/tmp/foo')
+        self.items = [
+            {
+                "uuid": str(i),
+                "origin": "http://example.com",
+                "metadata__timestamp": "2020-01-{:02d}T00:00:00+00:00".format((i * 7) % 5 + 1)
+            }
+            for i in range(10)
+        ]
+        ElasticItems.pit_unsupported.discard(self.es_con)
+
+    def _get_eitems(self, mock):
+        eitems = ElasticItems(self.perceval_backend)
+        eitems.elastic = MockElastic(self.es_con, self.target_index)
+        eitems.elastic.distribution = mock.distribution
+        eitems.scroll_size = 3
+        eitems.pagination = 'pit'
+        eitems.requests = mock
+        return eitems
+
+    def _use_scroll(self, eitems, mock):
+        scroll = MockSlicedScroll(self.items, page_size=3)
+
+        def post(url, data=None, headers=None):
+            if 'keep_alive' in url:
+                return mock.post(url, data=data, headers=headers)
+            query = json.loads(data)
+            if 'scroll_id' not in query:
+                query['slice'] = {"id": 0, "max": 1}
+            return scroll.post(url, data=json.dumps(query), headers=headers)
+
+        eitems.requests = unittest.mock.Mock(post=post, delete=scroll.delete)
+
+    def test_fetch_pit(self):
+        """Test whether the items are fetched using a point in time"""
+
+        mock = MockPointInTime(self.items)
+        eitems = self._get_eitems(mock)
+        items = [item for item in eitems.fetch()]
+
+        self.assertListEqual(items, mock.items)
+        self.assertListEqual(eitems.cursor, [mock.items[-1]['metadata__timestamp'], len(mock.items) - 1])
+
+        self.assertListEqual(mock.opened, [self.es_con + "/" + self.target_index + "/_pit?keep_alive=10m"])
+        self.assertListEqual(mock.released, [(self.es_con + "/_pit", {"id": "pit-1"})])
+
+        # 4 pages with items plus the empty one
+        self.assertEqual(len(mock.queries), 5)
+        query = mock.queries[0]
+        self.assertNotIn('search_after', query)
+        self.assertDictEqual(query['pit'], {"id": "pit-1", "keep_alive": "10m"})
+        self.assertDictEqual(query['query']['bool']['filter'][0],
+                             {"term": {"origin": "http://example.com"}})
+        self.assertEqual(query['sort'][0]['metadata__timestamp']['order'], 'asc')
+        self.assertDictEqual(query['sort'][1], {"_shard_doc": "asc"})
+        self.assertListEqual(mock.queries[1]['search_after'], [mock.items[2]['metadata__timestamp'], 2])
+
+    def test_fetch_pit_source(self):
+        """Test whether the source filtering is sent in the searches"""
+
+        mock = MockPointInTime(self.items)
+        eitems = self._get_eitems(mock)
+        items = [item for item in eitems.fetch(_source={"excludes": ["data.files"]})]
+
+        self.assertListEqual(items, mock.items)
+        for query in mock.queries:
+            self.assertDictEqual(query['_source'], {"excludes": ["data.files"]})
+
+        mock.queries = []
+        items = [item for item in eitems.fetch()]
+        self.assertNotIn('_source', mock.queries[0])
+
+    def test_fetch_pit_search_after(self):
+        """Test whether the fetch is resumed from the date of a cursor"""
+
+        mock = MockPointInTime(self.items)
+        eitems = self._get_eitems(mock)
+
+        fetched = eitems.fetch()
+        for _ in range(4):
+            next(fetched)
+        fetched.close()
+        cursor = eitems.cursor
+        self.assertEqual(len(mock.released), 1)
+
+        # The items with the date of the cursor are read again, because
+        # the tiebreaker of the cursor belongs to the previous point in time
+        mock.queries = []
+        eitems.set_search_after(cursor)
+        items = [item for item in eitems.fetch()]
+        self.assertEqual(cursor[0], mock.items[2]['metadata__timestamp'])
+        self.assertListEqual(items, mock.items[2:])
+        self.assertNotIn('search_after', mock.queries[0])
+        self.assertDictEqual(mock.queries[0]['query']['bool']['filter'][-1],
+                             {"range": {"metadata__timestamp": {"gte": cursor[0], "format": "epoch_millis"}}})
+        self.assertIsNone(eitems.search_after)
+
+        # The cursor is only used once
+        items = [item for item in eitems.fetch()]
+        self.assertListEqual(items, mock.items)
+
+    def test_fetch_pit_opensearch(self):
+        """Test whether the OpenSearch endpoints are used"""
+
+        mock = MockPointInTime(self.items, distribution='opensearch')
+        eitems = self._get_eitems(mock)
+        items = [item for item in eitems.fetch()]
+
+        self.assertListEqual(items, mock.items)
+        self.assertListEqual(mock.opened,
+                             [self.es_con + "/" + self.target_index + "/_search/point_in_time?keep_alive=10m"])
+        self.assertListEqual(mock.released,
+                             [(self.es_con + "/_search/point_in_time", {"pit_id": ["pit-1"]})])
+
+    def test_fetch_pit_fallback(self):
+        """Test whether scroll is used when point in time is not supported"""
+
+        mock = MockPointInTime(self.items, open_status=405)
+        eitems = self._get_eitems(mock)
+        self._use_scroll(eitems, mock)
+
+        items = [item for item in eitems.fetch()]
+        self.assertEqual(len(items), len(self.items))
+        self.assertIn(self.es_con, ElasticItems.pit_unsupported)
+        self.assertEqual(len(mock.opened), 1)
+
+        # The cluster is not asked again
+        items = [item for item in eitems.fetch()]
+        self.assertEqual(len(items), len(self.items))
+        self.assertEqual(len(mock.opened), 1)
+
+    def test_fetch_pit_open_error(self):
+        """Test whether scroll is used, without flagging the cluster, when the point in time fails to open"""
+
+        mock = MockPointInTime(self.items, open_status=503)
+        eitems = self._get_eitems(mock)
+        self._use_scroll(eitems, mock)
+
+        items = [item for item in eitems.fetch()]
+        self.assertEqual(len(items), len(self.items))
+        self.assertNotIn(self.es_con, ElasticItems.pit_unsupported)
+
+        # The point in time is tried again
+        items = [item for item in eitems.fetch()]
+        self.assertEqual(len(items), len(self.items))
+        self.assertEqual(len(mock.opened), 2)
+
+    def test_fetch_pit_old_version(self):
+        """Test whether the point in time is not opened in versions which don't support it"""
+
+        mock = MockPointInTime(self.items)
+        eitems = self._get_eitems(mock)
+        eitems.elastic.major = '6'
+        self._use_scroll(eitems, mock)
+
+        items = [item for item in eitems.fetch()]
+        self.assertEqual(len(items), len(self.items))
+        self.assertListEqual(mock.opened, [])
+        self.assertIn(self.es_con, ElasticItems.pit_unsupported)
+
+    def test_fetch_pit_search_error(self):
+        """Test whether the errors of the searches are raised and the point in time is released"""
+
+        mock = MockPointInTime(self.items, search_status=500)
+        eitems = self._get_eitems(mock)
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            _ = [item for item in eitems.fetch()]
+
+        self.assertEqual(len(mock.queries), 1)
+        self.assertListEqual(mock.released, [(self.es_con + "/_pit", {"id": "pit-1"})])
+        self.assertNotIn(self.es_con, ElasticItems.pit_unsupported)
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
     unittest.main()
@@ -19,9 +19,19 @@
 #     Valerio Cosentino <valcos@bitergia.com>
 #
 
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
+import unittest.mock
 
-from grimoire_elk.raw.elastic import ElasticOcean
+from grimoire_elk.elastic_bulk import BulkResult
+from grimoire_elk.elastic_items import ElasticItems
+from grimoire_elk.raw.elastic import CONTENT_HASH_FIELD, ElasticOcean, logger
+from grimoire_elk.raw_store import INDEX_FILE
 from perceval.backends.core.git import Git
 from grimoire_elk.errors import ELKError
 
@@ -64,6 +74,285 @@ class TestElasticOcean(unittest.TestCase):
         eitems = ElasticOcean(perceval_backend)
         self.assertEqual(eitems.get_field_date(), 'metadata__updated_on')
 
+    def test_feed_items(self):
+        """Test whether the packs of items are uploaded in background keeping the counters"""
+
+        class DropOcean(ElasticOcean):
+            def drop_item(self, item):
+                return item['uuid'] == 'drop'
+
+        threads = set()
+
+        def bulk_upload_result(items, field_id):
+            threads.add(threading.get_ident())
+            uploaded.extend(item['uuid'] for item in items)
+            # The items of the second pack are not inserted
+            if items[0]['uuid'] == '2':
+                return BulkResult(inserted=0, permanent=len(items))
+            return BulkResult(inserted=len(items))
+
+        uploaded = []
+        items = [
+            {
+                'uuid': uuid,
+                'updated_on': 1500000000.0,
+                'timestamp': 1500000000.0,
+                'backend_name': 'Git',
+                'backend_version': '0.12.0',
+                'origin': 'http://example.com'
+            }
+            for uuid in ['0', '1', 'drop', '2', '3', '4']
+        ]
+
+        eitems = DropOcean(Git('http://example.com', '/tmp/foo'))
+        eitems.elastic = unittest.mock.MagicMock(max_items_bulk=2, index='git_raw')
+        eitems.elastic.bulk_upload_result.side_effect = bulk_upload_result
+
+        with self.assertLogs(logger, level='WARNING') as cm:
+            eitems.feed_items(iter(items))
+
+        self.assertListEqual(uploaded, ['0', '1', '2', '3', '4'])
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(eitems.feed_result.inserted, 3)
+        self.assertEqual(eitems.feed_result.permanent, 2)
+        self.assertEqual(eitems.elastic.bulk_upload_result.call_count, 3)
+        eitems.elastic.refresh_pending.assert_called_once_with()
+
+        self.assertEqual(len(cm.output), 2)
+        self.assertIn("2/2 missing JSON items for backend Git [ver. 0.12.0], origin http://example.com", cm.output[0])
+        self.assertIn("Lost 2 items in index git_raw: 0 transient and 2 permanent errors", cm.output[1])
+
+    def test_get_content_hash(self):
+        """Test whether the hash of an item doesn't depend on the date it was fetched"""
+
+        item = {'uuid': '1', 'timestamp': 1500000000.0, 'metadata__timestamp': '2017-07-14T02:40:00',
+                'metadata__updated_on': '2017-07-14T02:40:00', 'data': {'a': 1, 'b': [1, 2]}}
+        refetched = dict(item, timestamp=1600000000.0, metadata__timestamp='2020-09-13T12:26:40')
+        refetched[CONTENT_HASH_FIELD] = 'x'
+        changed = dict(item, data={'a': 2, 'b': [1, 2]})
+
+        content_hash = ElasticOcean.get_content_hash(item)
+        self.assertEqual(ElasticOcean.get_content_hash(refetched), content_hash)
+        self.assertNotEqual(ElasticOcean.get_content_hash(changed), content_hash)
+
+    def test_feed_items_skip_unchanged(self):
+        """Test whether the items already stored without changes are not uploaded"""
+
+        items = [
+            {
+                'uuid': uuid,
+                'updated_on': updated_on,
+                'timestamp': 1600000000.0,
+                'backend_name': 'Git',
+                'backend_version': '0.12.0',
+                'origin': 'http://example.com',
+                'data': {'commit': uuid}
+            }
+            for uuid, updated_on in [('1', 1500000000.0), ('2', 1500000000.0), ('3', 1500000000.0)]
+        ]
+
+        stored_item = dict(items[0])
+        ElasticOcean.add_update_date(None, stored_item)
+        stored = {
+            # Same content fetched before
+            '1': {'metadata__updated_on': stored_item['metadata__updated_on'],
+                  CONTENT_HASH_FIELD: ElasticOcean.get_content_hash(stored_item)},
+            # Stored before the content hashes
+            '2': {'metadata__updated_on': stored_item['metadata__updated_on']}
+        }
+
+        uploaded = []
+
+        def bulk_upload_result(json_items, field_id):
+            uploaded.extend(item['uuid'] for item in json_items)
+            return BulkResult(inserted=len(json_items))
+
+        eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'))
+        eitems.skip_unchanged = True
+        eitems.elastic = unittest.mock.MagicMock(max_items_bulk=10, index='git_raw')
+        eitems.elastic.get_documents.return_value = stored
+        eitems.elastic.bulk_upload_result.side_effect = bulk_upload_result
+
+        eitems.feed_items(iter(items))
+
+        self.assertListEqual(uploaded, ['2', '3'])
+        self.assertEqual(eitems.feed_unchanged, 1)
+        self.assertEqual(eitems.feed_result.inserted, 2)
+        self.assertIn(CONTENT_HASH_FIELD, items[2])
+        eitems.elastic.get_documents.assert_called_once_with(
+            ['1', '2', '3'], fields=['metadata__updated_on', CONTENT_HASH_FIELD])
+
+    def test_raw_store(self):
+        """Test whether the items fed are stored and read from the raw store"""
+
+        tmp_path = tempfile.mkdtemp(prefix='raw_store_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        items = [
+            {
+                'uuid': str(i),
+                'updated_on': 1500000000.0,
+                'timestamp': 1500000000.0 + i * 86400,
+                'backend_name': 'Git',
+                'backend_version': '0.12.0',
+                'origin': 'http://example.com'
+            }
+            for i in range(5)
+        ]
+
+        eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'))
+        eitems.raw_store_dir = tmp_path
+        eitems.elastic = unittest.mock.MagicMock(max_items_bulk=2, index='git_raw')
+        eitems.elastic.bulk_upload_result.side_effect = lambda json_items, field_id: BulkResult(len(json_items))
+        eitems.feed_from_scratch = True
+        eitems.feed_items(iter(items))
+
+        self.assertTrue(eitems.raw_store.readable())
+
+        with unittest.mock.patch.object(ElasticItems, 'fetch') as mock_fetch:
+            eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'),
+                                  from_date=datetime.datetime(2017, 7, 16))
+            eitems.raw_store_dir = tmp_path
+            eitems.elastic = unittest.mock.MagicMock(index='git_raw')
+
+            fetched = list(eitems.fetch())
+            self.assertListEqual([item['uuid'] for item in fetched], ['2', '3', '4'])
+            self.assertEqual(fetched[0]['metadata__updated_on'], '2017-07-14T02:40:00+00:00')
+
+            fetched = list(eitems.fetch(ignore_incremental=True))
+            self.assertEqual(len(fetched), 5)
+            mock_fetch.assert_not_called()
+
+            # The items filtered by other fields or until a date are read from the index
+            eitems.to_date = datetime.datetime(2017, 7, 20)
+            list(eitems.fetch())
+            mock_fetch.assert_called_once()
+
+            eitems.to_date = None
+            eitems.set_filter_raw("data.product:Add-on SDK")
+            list(eitems.fetch())
+            self.assertEqual(mock_fetch.call_count, 2)
+
+            # Once items are deleted from the raw index, the store is not read
+            eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'))
+            eitems.raw_store_dir = tmp_path
+            eitems.elastic = unittest.mock.MagicMock(index='git_raw')
+            eitems.invalidate_raw_store()
+            list(eitems.fetch())
+            self.assertEqual(mock_fetch.call_count, 3)
+
+        # Without origin there is no store
+        eitems = ElasticOcean(None)
+        eitems.raw_store_dir = tmp_path
+        eitems.elastic = unittest.mock.MagicMock(index='git_raw')
+        self.assertIsNone(eitems.get_raw_store())
+
+    def test_raw_store_incremental(self):
+        """Test whether the stores not fed from scratch are not read"""
+
+        tmp_path = tempfile.mkdtemp(prefix='raw_store_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        item = {'uuid': '1', 'updated_on': 1500000000.0, 'timestamp': 1500000000.0,
+                'backend_name': 'Git', 'backend_version': '0.12.0', 'origin': 'http://example.com'}
+
+        eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'))
+        eitems.raw_store_dir = tmp_path
+        eitems.elastic = unittest.mock.MagicMock(max_items_bulk=2, index='git_raw')
+        eitems.elastic.bulk_upload_result.return_value = BulkResult(1)
+        eitems.feed_items(iter([item]))
+
+        self.assertTrue(eitems.raw_store.exists())
+        self.assertFalse(eitems.raw_store.readable())
+
+        with unittest.mock.patch.object(ElasticItems, 'fetch', return_value=iter([])) as mock_fetch:
+            self.assertListEqual(list(eitems.fetch()), [])
+            mock_fetch.assert_called_once()
+
+    def test_raw_store_skip_unchanged(self):
+        """Test whether the unchanged items are stored when the origin is fed from scratch"""
+
+        tmp_path = tempfile.mkdtemp(prefix='raw_store_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        items = [
+            {
+                'uuid': str(i),
+                'updated_on': 1500000000.0,
+                'timestamp': 1500000000.0,
+                'backend_name': 'Git',
+                'backend_version': '0.12.0',
+                'origin': 'http://example.com'
+            }
+            for i in range(3)
+        ]
+        stored_item = dict(items[0])
+        ElasticOcean.add_update_date(None, stored_item)
+        stored = {
+            '0': {'metadata__updated_on': stored_item['metadata__updated_on'],
+                  CONTENT_HASH_FIELD: ElasticOcean.get_content_hash(stored_item)}
+        }
+
+        def get_ocean():
+            eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'))
+            eitems.raw_store_dir = tmp_path
+            eitems.skip_unchanged = True
+            eitems.elastic = unittest.mock.MagicMock(max_items_bulk=10, index='git_raw')
+            eitems.elastic.get_documents.return_value = stored
+            eitems.elastic.bulk_upload_result.side_effect = lambda json_items, field_id: BulkResult(len(json_items))
+            return eitems
+
+        eitems = get_ocean()
+        eitems.feed_from_scratch = True
+        eitems.feed_items(iter([dict(item) for item in items]))
+
+        self.assertEqual(eitems.feed_unchanged, 1)
+        self.assertTrue(eitems.raw_store.readable())
+        self.assertListEqual([item['uuid'] for item in eitems.raw_store.read()], ['0', '1', '2'])
+
+        # The incremental feeds only store the changed items
+        eitems = get_ocean()
+        eitems.feed_items(iter([dict(item) for item in items]))
+        self.assertTrue(eitems.raw_store.readable())
+        with open(os.path.join(eitems.raw_store.path, INDEX_FILE)) as fd:
+            frames = [json.loads(line) for line in fd]
+        self.assertListEqual([frame['items'] for frame in frames], [3, 2])
+
+    def test_raw_store_failed(self):
+        """Test whether the raw store is invalidated when some items can't be uploaded"""
+
+        tmp_path = tempfile.mkdtemp(prefix='raw_store_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        items = [
+            {
+                'uuid': str(i),
+                'updated_on': 1500000000.0,
+                'timestamp': 1500000000.0,
+                'backend_name': 'Git',
+                'backend_version': '0.12.0',
+                'origin': 'http://example.com'
+            }
+            for i in range(4)
+        ]
+
+        def bulk_upload_result(json_items, field_id):
+            if json_items[0]['uuid'] == '2':
+                return BulkResult(inserted=len(json_items) - 1, permanent=1)
+            return BulkResult(inserted=len(json_items))
+
+        eitems = ElasticOcean(Git('http://example.com', '/tmp/foo'))
+        eitems.raw_store_dir = tmp_path
+        eitems.elastic = unittest.mock.MagicMock(max_items_bulk=2, index='git_raw')
+        eitems.elastic.bulk_upload_result.side_effect = bulk_upload_result
+        eitems.feed_from_scratch = True
+
+        with self.assertLogs(logger, level='WARNING'):
+            eitems.feed_items(iter(items))
+
+        self.assertTrue(eitems.raw_store.exists())
+        self.assertFalse(eitems.raw_store.readable())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -22,9 +22,11 @@
 
 import configparser
 import logging
+import threading
 import unittest
+import unittest.mock
 
-from grimoire_elk.elk import anonymize_params, enrich_backend, feed_backend, logger
+from grimoire_elk.elk import anonymize_params, enrich_backend, feed_backend, feed_backends, logger
 
 
 CONFIG_FILE = 'tests.conf'
@@ -95,6 +97,51 @@ class TestElk(unittest.TestCase):
             self.assertEqual(cm.records[0].msg, expected_msg)
 
 
+class TestFeedBackends(unittest.TestCase):
+    """Unit tests for feed_backends"""
+
+    def test_feed_backends(self):
+        """Test whether the backends are fed at the same time and their errors are isolated"""
+
+        barrier = threading.Barrier(2, timeout=5)
+
+        def mock_feed_backend(url, clean, fetch_archive, backend_name, backend_params, es_index=None, stats=None):
+            if backend_name == 'jira':
+                raise RuntimeError("Unknown backend jira")
+
+            # Both git backends must be fed at the same time to pass the barrier
+            barrier.wait()
+            stats['origin'] = backend_params[0]
+            if backend_params[0].endswith('error.git'):
+                return "Error feeding raw from git"
+            stats['items'] = 10
+            return None
+
+        backends = [
+            ('git', ['https://example.org/repo.git'], 'git_raw'),
+            ('jira', ['https://jira.example.org'], 'jira_raw'),
+            ('git', ['https://example.org/error.git'], 'git_raw')
+        ]
+
+        with unittest.mock.patch('grimoire_elk.elk.feed_backend', side_effect=mock_feed_backend):
+            with self.assertLogs(logger, level='INFO') as cm:
+                results = feed_backends('http://es.test:9200', False, False, backends, workers=3)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['origin'], 'https://example.org/repo.git')
+        self.assertEqual(results[0]['items'], 10)
+        self.assertIsNone(results[0]['error'])
+        self.assertEqual(results[1]['error'], "Error feeding raw from jira: Unknown backend jira")
+        self.assertEqual(results[2]['items'], 0)
+        self.assertEqual(results[2]['error'], "Error feeding raw from git")
+        for stats in results:
+            self.assertGreaterEqual(stats['seconds'], 0)
+
+        summary = [record.getMessage() for record in cm.records if 'items/s' in record.getMessage()]
+        self.assertEqual(len(summary), 3)
+        self.assertRegex(summary[0], r"^\[git\] Fed 10 items \(0 failed\) in .* for https://example.org/repo.git$")
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
     unittest.main()
@@ -21,17 +21,24 @@
 
 import configparser
 import json
+import os
+import re
+import shutil
 
 import httpretty
 import requests
 import sys
+import tempfile
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from grimoire_elk.elastic import logger
 from grimoire_elk.enriched.enrich import (Enrich,
                                           HEADER_JSON,
-                                          anonymize_url)
+                                          anonymize_url,
+                                          invalidate_identities_caches)
+from grimoire_elk.cache import get_cache
+from grimoire_elk.enriched.identity_cache import IdentityCache
 from grimoire_elk.utils import get_connectors, get_elastic
 
 # Make sure we use our code and not any other could we have installed
@@ -825,5 +832,386 @@ class TestEnrich(unittest.TestCase):
         self.assertEqual(self._enrich.get_item_id(item), item['_id'])
 
 
+class ParallelEnrich(Enrich):
+    """Enricher which doubles the value of the items"""
+
+    def get_rich_item(self, item):
+        if item['value'] < 0:
+            raise ValueError("negative value")
+
+        self.enrich_counters['items'] += 1
+        return {"uuid": item['uuid'], "value": item['value'] * 2, "pid": os.getpid()}
+
+
+class TestEnrichParallel(unittest.TestCase):
+    """Test the enrichment of the items in a pool of processes"""
+
+    def setUp(self):
+        self.items = [{"uuid": str(i), "value": i} for i in range(25)]
+
+    def test_serial(self):
+        """Test whether the items are enriched in the main process by default"""
+
+        enricher = ParallelEnrich()
+
+        with enricher.enrich_pool() as pool:
+            self.assertIsNone(pool)
+            rich_items = list(enricher.enrich_raw_items(self.items, pool=pool))
+
+        self.assertListEqual([_id for _id, _ in rich_items], [item['uuid'] for item in self.items])
+        for (_, data_json), item in zip(rich_items, self.items):
+            self.assertDictEqual(json.loads(data_json),
+                                 {"uuid": item['uuid'], "value": item['value'] * 2, "pid": os.getpid()})
+        self.assertEqual(enricher.enrich_counters['items'], 25)
+
+        # The time enriching and serializing the items is measured
+        self.assertEqual(enricher.enrich_stats.items('enrich'), 25)
+        self.assertEqual(enricher.enrich_stats.items('serialize'), 25)
+
+    def test_parallel(self):
+        """Test whether the items are enriched by the processes in order"""
+
+        enricher = ParallelEnrich()
+        enricher.enrich_workers = 2
+        enricher.enrich_chunk_size = 3
+
+        with enricher.enrich_pool() as pool:
+            self.assertIsNotNone(pool)
+            rich_items = list(enricher.enrich_raw_items(iter(self.items), pool=pool))
+
+        self.assertListEqual([_id for _id, _ in rich_items], [item['uuid'] for item in self.items])
+        pids = set()
+        for (_, data_json), item in zip(rich_items, self.items):
+            rich_item = json.loads(data_json)
+            self.assertEqual(rich_item['value'], item['value'] * 2)
+            pids.add(rich_item['pid'])
+        self.assertNotIn(os.getpid(), pids)
+
+        # The counters of the processes are added to the enricher
+        self.assertEqual(enricher.enrich_counters['items'], 25)
+
+    def test_parallel_error(self):
+        """Test whether the errors of the processes are raised"""
+
+        self.items[10]['value'] = -1
+
+        enricher = ParallelEnrich()
+        enricher.enrich_workers = 2
+        enricher.enrich_chunk_size = 3
+
+        with self.assertRaisesRegex(ValueError, "negative value"):
+            with enricher.enrich_pool() as pool:
+                list(enricher.enrich_raw_items(self.items, pool=pool))
+
+
+class TestIndexIndividuals(unittest.TestCase):
+    """Test the index of individuals used to refresh the identities"""
+
+    def setUp(self):
+        self.individuals = [
+            {"mk": "mk1", "identities": [{"uuid": "id1"}, {"uuid": "id2"}]},
+            {"mk": "mk2", "identities": [{"uuid": "mk2"}, {"uuid": "id2"}]}
+        ]
+
+    def test_index_individuals(self):
+        """Test whether the individuals are indexed by mk and identity uuid"""
+
+        index = Enrich.index_individuals(self.individuals)
+
+        self.assertListEqual(sorted(index.keys()), ["id1", "id2", "mk1", "mk2"])
+        self.assertIs(index["id1"], self.individuals[0])
+        self.assertIs(index["mk2"], self.individuals[1])
+        self.assertDictEqual(Enrich.index_individuals(None), {})
+
+    def test_find_individual(self):
+        """Test whether the individuals found in the index and in the list are the same"""
+
+        index = Enrich.index_individuals(self.individuals)
+
+        for sh_id in ["mk1", "id1", "id2", "mk2", "id3"]:
+            self.assertIs(Enrich.find_individual(index, sh_id),
+                          Enrich.find_individual(self.individuals, sh_id))
+        self.assertIsNone(Enrich.find_individual(index, "id3"))
+
+
+class TestAddIdentityCache(unittest.TestCase):
+    """Test the cache of the identities added to SortingHat"""
+
+    def setUp(self):
+        invalidate_identities_caches()
+
+    def test_add_sh_identity_cache(self):
+        """Test whether the identities are added once for each data source"""
+
+        identity = (('name', 'John Smith'), ('email', 'jsmith@example.com'), ('username', None))
+
+        enrichers = []
+        for backend_name in ['git', 'github', 'git']:
+            enricher = Enrich()
+            enricher.get_sh_backend_name = MagicMock(return_value=backend_name)
+            enricher.add_sh_identity = MagicMock()
+            enricher.add_sh_identity_cache(identity)
+            enrichers.append(enricher)
+
+        enrichers[0].add_sh_identity.assert_called_once_with(dict(identity))
+        enrichers[1].add_sh_identity.assert_called_once_with(dict(identity))
+        enrichers[2].add_sh_identity.assert_not_called()
+
+
+class TestEnrollmentsPeriods(unittest.TestCase):
+    """Test the enrollments of the individuals at the date of the items"""
+
+    def setUp(self):
+        invalidate_identities_caches()
+        self.enricher = Enrich()
+        self.enrollments = [
+            {"group": {"name": "Bitergia", "type": "organization", "parentOrg": None},
+             "start": "2015-01-01T00:00:00+00:00", "end": "2018-01-01T00:00:00+00:00"},
+            {"group": {"name": "Eng", "type": "team", "parentOrg": {"name": "CHAOSS"}},
+             "start": "2017-06-01T00:00:00+00:00", "end": "2100-01-01T00:00:00+00:00"},
+            {"group": {"name": "Example", "type": "organization", "parentOrg": None},
+             "start": "1900-01-01T00:00:00+00:00", "end": "2016-01-01T00:00:00.500000+00:00"}
+        ]
+
+    def test_multi_enrollments(self):
+        """Test whether the enrollments at the date of the item are returned in order"""
+
+        def get_enrollments(date):
+            return self.enricher.get_sh_item_multi_enrollments(self.enrollments, date)
+
+        self.assertListEqual(get_enrollments("2014-01-01T00:00:00"), ["Example"])
+        self.assertListEqual(get_enrollments("2015-06-01T00:00:00+02:00"), ["Bitergia", "Example"])
+        self.assertListEqual(get_enrollments("2017-07-01T00:00:00"), ["Bitergia", "CHAOSS::Eng"])
+        self.assertListEqual(get_enrollments("2020-01-01T00:00:00"), ["CHAOSS::Eng"])
+        self.assertListEqual(get_enrollments(None), ["Bitergia", "CHAOSS::Eng", "Example"])
+        self.assertListEqual(self.enricher.get_sh_item_multi_enrollments([], "2020-01-01"), ["Unknown"])
+        self.assertListEqual(self.enricher.get_sh_item_multi_enrollments(self.enrollments[:1], "2020-01-01"),
+                             ["Unknown"])
+
+    def test_limits(self):
+        """Test whether the items are in an enrollment after its start until its end"""
+
+        def get_enrollments(date):
+            return self.enricher.get_sh_item_multi_enrollments(self.enrollments[:1], date)
+
+        self.assertListEqual(get_enrollments("2015-01-01T00:00:00"), ["Unknown"])
+        self.assertListEqual(get_enrollments("2015-01-01T00:00:00.000001"), ["Bitergia"])
+        self.assertListEqual(get_enrollments("2018-01-01T00:00:00"), ["Bitergia"])
+        self.assertListEqual(get_enrollments("2018-01-01T00:00:00.000001"), ["Unknown"])
+
+        enrollments = self.enrollments[2:]
+        self.assertListEqual(self.enricher.get_sh_item_multi_enrollments(enrollments, "2016-01-01T00:00:00.5"),
+                             ["Example"])
+        self.assertListEqual(self.enricher.get_sh_item_multi_enrollments(enrollments, "2016-01-01T00:00:00.6"),
+                             ["Unknown"])
+
+    def test_periods_cached(self):
+        """Test whether the periods are computed once for each list of enrollments"""
+
+        periods = self.enricher.get_enrollments_periods(self.enrollments)
+        self.assertListEqual(periods[0], ["Bitergia", "CHAOSS::Eng", "Example"])
+        self.assertListEqual([pos for _, _, pos in periods[2]], [2, 0, 1])
+        self.assertListEqual(periods[1], sorted(periods[1]))
+
+        self.assertIs(self.enricher.get_enrollments_periods(self.enrollments), periods)
+        self.assertIsNot(self.enricher.get_enrollments_periods(list(self.enrollments)), periods)
+
+
+class IdentitiesEnrich(Enrich):
+    """Enricher which adds the SortingHat fields of the author of the items"""
+
+    def get_sh_backend_name(self):
+        return "test"
+
+    def get_identities(self, item):
+        yield {"name": item['author'], "email": None, "username": None}
+
+    def get_rich_item(self, item):
+        identity = {"name": item['author'], "email": None, "username": None}
+        sh_item = self.get_sh_item_from_identity(identity, self.get_sh_backend_name())
+        return {"uuid": item['uuid'], "author_uuid": sh_item.get('uuid')}
+
+
+class MockSortingHatClient:
+    """Return an individual for each identity requested with an alias"""
+
+    ALIAS_REGEX = re.compile(r'(e\d+): individuals\(filters: \{uuid: "(\w+)"\}\)')
+
+    def __init__(self, missing=None):
+        self.queries = []
+        self.missing = missing or set()
+
+    def execute(self, op):
+        query = str(op)
+        self.queries.append(query)
+
+        data = {}
+        for alias, uuid in self.ALIAS_REGEX.findall(query):
+            entities = []
+            if uuid not in self.missing:
+                entities.append({"mk": "mk-" + uuid,
+                                 "identities": [{"uuid": uuid, "name": None, "email": None, "username": None}],
+                                 "profile": None,
+                                 "enrollments": []})
+            data[alias] = {"entities": entities}
+        return {"data": data}
+
+
+class TestEnrichPrefetchIdentities(unittest.TestCase):
+    """Test the prefetch of the SortingHat individuals of the raw items"""
+
+    def setUp(self):
+        self.items = [{"uuid": str(i), "author": "author{}".format(i % 4)} for i in range(25)]
+        invalidate_identities_caches()
+
+    def _get_enricher(self, client):
+        enricher = IdentitiesEnrich()
+        enricher.sortinghat = True
+        enricher.sh_db = client
+        enricher.enrich_chunk_size = 10
+        return enricher
+
+    def test_prefetch(self):
+        """Test whether the individuals of the items are retrieved with one query"""
+
+        client = MockSortingHatClient()
+        enricher = self._get_enricher(client)
+
+        rich_items = [json.loads(data_json) for _, data_json in enricher.enrich_raw_items(self.items)]
+
+        # A query for the first chunk of 10 items, none for each identity; the
+        # next chunks have the same authors, which were already retrieved
+        self.assertEqual(len(client.queries), 1)
+        self.assertEqual(client.queries[0].count("individuals("), 4)
+
+        for rich_item, item in zip(rich_items, self.items):
+            uuid = enricher.generate_uuid("test", name=item['author'])
+            self.assertEqual(rich_item['author_uuid'], "mk-" + uuid)
+        self.assertEqual(enricher.enrich_stats.items('identities'), 25)
+
+    def test_prefetch_not_found(self):
+        """Test whether the identities not found are not requested again"""
+
+        missing = IdentitiesEnrich().generate_uuid("test", name="author1")
+        client = MockSortingHatClient(missing={missing})
+        enricher = self._get_enricher(client)
+
+        enricher.prefetch_sh_entities(self.items[:10])
+
+        self.assertEqual(len(client.queries), 1)
+        self.assertIsNone(enricher.get_entity(missing))
+        self.assertEqual(len(client.queries), 1)
+
+    def test_prefetch_identities_cache(self):
+        """Test whether the individuals in the persistent cache are not requested"""
+
+        tmp_path = tempfile.mkdtemp(prefix='identities_cache_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        client = MockSortingHatClient()
+        enricher = self._get_enricher(client)
+        enricher.identities_cache = IdentityCache(tmp_path)
+
+        enricher.prefetch_sh_entities(self.items[:10])
+        self.assertEqual(client.queries[0].count("individuals("), 4)
+
+        # The individuals were stored in the persistent cache, so nothing
+        # is requested once the caches of the process are emptied
+        invalidate_identities_caches()
+        enricher.prefetch_sh_entities(self.items[10:20])
+        self.assertEqual(len(client.queries), 1)
+        self.assertEqual(len(enricher.sh_entities), 4)
+
+        uuid = enricher.generate_uuid("test", name="author0")
+        self.assertEqual(enricher.get_entity(uuid)['mk'], "mk-" + uuid)
+        self.assertEqual(len(client.queries), 1)
+
+    def test_prefetch_shared_cache(self):
+        """Test whether the individuals already retrieved by the process are not requested again"""
+
+        client = MockSortingHatClient()
+        enricher = self._get_enricher(client)
+
+        enricher.prefetch_sh_entities(self.items[:10])
+        self.assertEqual(len(client.queries), 1)
+        self.assertEqual(len(enricher.sh_entities), 4)
+
+        # The second page has the same authors
+        enricher.prefetch_sh_entities(self.items[10:20])
+        self.assertEqual(len(client.queries), 1)
+        self.assertDictEqual(enricher.sh_entities, {})
+
+        uuid = enricher.generate_uuid("test", name="author0")
+        self.assertEqual(enricher.get_entity(uuid)['mk'], "mk-" + uuid)
+        self.assertEqual(len(client.queries), 1)
+
+        # Other enrichers of the process use them too
+        enricher = self._get_enricher(client)
+        enricher.prefetch_sh_entities(self.items[20:])
+        self.assertEqual(len(client.queries), 1)
+
+    def test_no_sortinghat(self):
+        """Test whether nothing is prefetched without SortingHat"""
+
+        client = MockSortingHatClient()
+        enricher = self._get_enricher(client)
+        enricher.sortinghat = False
+
+        enricher.prefetch_sh_entities(self.items)
+
+        self.assertDictEqual(enricher.sh_entities, {})
+        self.assertListEqual(client.queries, [])
+
+
+class TestSyncIdentitiesCache(unittest.TestCase):
+    """Test the synchronization of the persistent cache of individuals"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='identities_cache_')
+        self.addCleanup(shutil.rmtree, self.tmp_path)
+
+        patcher = patch.multiple(Enrich, identities_cache_dir=self.tmp_path, identities_cache=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        invalidate_identities_caches()
+
+    @patch('grimoire_elk.enriched.enrich.SortingHat', create=True)
+    def test_sync(self, sortinghat):
+        """Test whether the cache is synchronized each time and the modified individuals are updated"""
+
+        entity = {"mk": "mk1", "identities": [{"uuid": "id1"}], "profile": None, "enrollments": []}
+        sortinghat.search_last_modified_identities.return_value = []
+
+        Enrich.sync_identities_cache()
+        cache = Enrich.identities_cache
+        self.assertIsInstance(cache, IdentityCache)
+        get_cache('sh_entities').set('id1', {"mk": "old"})
+
+        # Nothing was modified, so the SortingHat caches are kept
+        Enrich.sync_identities_cache()
+        self.assertIs(Enrich.identities_cache, cache)
+        self.assertEqual(sortinghat.search_last_modified_identities.call_count, 1)
+        self.assertEqual(get_cache('sh_entities').get('id1'), {"mk": "old"})
+
+        sortinghat.search_last_modified_identities.return_value = [[entity]]
+        Enrich.sync_identities_cache()
+        self.assertIs(Enrich.identities_cache, cache)
+        self.assertEqual(cache.get('id1')['mk'], "mk1")
+        self.assertIsNone(get_cache('sh_entities').get('id1'))
+
+    @patch('grimoire_elk.enriched.enrich.SortingHat', create=True)
+    def test_sync_error(self, sortinghat):
+        """Test whether the cache is not used when it can't be synchronized"""
+
+        sortinghat.search_last_modified_identities.return_value = []
+        Enrich.sync_identities_cache()
+        self.assertIsNotNone(Enrich.identities_cache)
+
+        sortinghat.search_last_modified_identities.side_effect = RuntimeError("unavailable")
+        with self.assertLogs('grimoire_elk.enriched.enrich', level='WARNING'):
+            Enrich.sync_identities_cache()
+        self.assertIsNone(Enrich.identities_cache)
+
+
 if __name__ == '__main__':
     unittest.main()
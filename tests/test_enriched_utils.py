@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import gzip
+import json
+import unittest
+
+import httpretty
+
+from grimoire_elk.enriched.utils import (GzipAdapter,
+                                         disable_compression,
+                                         enable_compression,
+                                         get_compression_stats,
+                                         get_es_client,
+                                         get_pool_stats,
+                                         get_session,
+                                         grimoire_con)
+
+ES_URL = "http://localhost:9200"
+BULK_URL = ES_URL + "/test/_bulk"
+
+
+class TestGzipAdapter(unittest.TestCase):
+    """Unit tests for the compression of the requests"""
+
+    def setUp(self):
+        enable_compression(ES_URL)
+
+    def tearDown(self):
+        disable_compression(ES_URL)
+
+    @staticmethod
+    def bulk_body(n_items):
+        body = ''
+        for i in range(n_items):
+            body += '{"index" : {"_id" : "%s" } }\n' % i
+            body += json.dumps({"id": i, "text": "grimoirelab"}) + '\n'
+        return body
+
+    @httpretty.activate
+    def test_compress_bulk(self):
+        """Test whether the bulk requests are compressed"""
+
+        httpretty.register_uri(httpretty.PUT, BULK_URL, body='{}', status=200)
+
+        stats = get_compression_stats()
+        body = self.bulk_body(100)
+
+        session = grimoire_con()
+        self.assertIsInstance(session.get_adapter(BULK_URL), GzipAdapter)
+        session.put(BULK_URL, data=body, headers={"Content-Type": "application/x-ndjson"})
+
+        request = httpretty.last_request()
+        self.assertEqual(request.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(request.headers['Accept-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(request.body).decode('utf-8'), body)
+
+        new_stats = get_compression_stats()
+        self.assertEqual(new_stats['requests'], stats['requests'] + 1)
+        self.assertEqual(new_stats['raw_bytes'], stats['raw_bytes'] + len(body))
+        self.assertEqual(new_stats['wire_bytes'], stats['wire_bytes'] + len(request.body))
+        self.assertLess(len(request.body), len(body))
+
+    @httpretty.activate
+    def test_not_compressed(self):
+        """Test whether small bodies and other endpoints are not compressed"""
+
+        mapping_url = ES_URL + "/test/_mapping"
+        httpretty.register_uri(httpretty.PUT, BULK_URL, body='{}', status=200)
+        httpretty.register_uri(httpretty.PUT, mapping_url, body='{}', status=200)
+
+        session = grimoire_con()
+
+        body = self.bulk_body(1)
+        session.put(BULK_URL, data=body)
+        request = httpretty.last_request()
+        self.assertNotIn('Content-Encoding', request.headers)
+        self.assertEqual(request.body.decode('utf-8'), body)
+
+        body = json.dumps({"properties": {"field_%s" % i: {"type": "keyword"} for i in range(100)}})
+        session.put(mapping_url, data=body)
+        request = httpretty.last_request()
+        self.assertNotIn('Content-Encoding', request.headers)
+        self.assertEqual(request.body.decode('utf-8'), body)
+
+    @httpretty.activate
+    def test_disabled(self):
+        """Test whether the requests are not compressed for other urls"""
+
+        httpretty.register_uri(httpretty.PUT, BULK_URL, body='{}', status=200)
+        disable_compression(ES_URL)
+
+        session = grimoire_con()
+        self.assertNotIsInstance(session.get_adapter(BULK_URL), GzipAdapter)
+
+        body = self.bulk_body(100)
+        session.put(BULK_URL, data=body)
+
+        request = httpretty.last_request()
+        self.assertNotIn('Content-Encoding', request.headers)
+        self.assertEqual(request.body.decode('utf-8'), body)
+
+
+class TestConnectionRegistry(unittest.TestCase):
+    """Unit tests for the shared sessions and clients"""
+
+    def test_get_session(self):
+        """Test whether the sessions are shared by URL and TLS settings"""
+
+        session = get_session(ES_URL)
+
+        self.assertIs(get_session(ES_URL + "/"), session)
+        self.assertIs(get_session(ES_URL, insecure=True), session)
+        self.assertIsNot(get_session(ES_URL, insecure=False), session)
+        self.assertIsNot(get_session("http://localhost:9201"), session)
+        self.assertFalse(session.verify)
+        self.assertTrue(get_session(ES_URL, insecure=False).verify)
+
+    def test_get_es_client(self):
+        """Test whether the clients are shared by URL, TLS settings and options"""
+
+        client = get_es_client(ES_URL, timeout=100, retry_on_timeout=True)
+
+        self.assertIs(get_es_client(ES_URL, retry_on_timeout=True, timeout=100), client)
+        self.assertIsNot(get_es_client(ES_URL, timeout=120, retry_on_timeout=True), client)
+        self.assertIsNot(get_es_client(ES_URL, insecure=False, timeout=100, retry_on_timeout=True), client)
+
+    @httpretty.activate
+    def test_pool_stats(self):
+        """Test whether the requests sent by the shared sessions are counted"""
+
+        url = "http://localhost:9202"
+        httpretty.register_uri(httpretty.GET, url + "/test", body='{}', status=200)
+
+        session = get_session(url)
+        for _ in range(3):
+            session.get(url + "/test")
+
+        stats = get_pool_stats()["http://localhost:9202"]
+        self.assertEqual(stats['requests'], 3)
+        self.assertGreaterEqual(stats['connections'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime
+import shutil
+import tempfile
+import unittest
+
+from grimoirelab_toolkit.datetime import datetime_utcnow
+
+from grimoire_elk.enriched.identity_cache import IdentityCache
+
+
+def get_entity(mk, uuids, name=None):
+    return {
+        "mk": mk,
+        "identities": [{"uuid": uuid, "name": name, "email": None, "username": None} for uuid in uuids],
+        "profile": {"name": name},
+        "enrollments": []
+    }
+
+
+class TestIdentityCache(unittest.TestCase):
+    """Unit tests for IdentityCache class"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='identities_cache_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_add_get(self):
+        """Test whether the individuals are found by the uuids of their identities and their mk"""
+
+        cache = IdentityCache(self.tmp_path)
+        entity = get_entity("mk1", ["id1", "id2"], name="John")
+        cache.add([entity, None])
+
+        self.assertDictEqual(cache.get("id1"), entity)
+        self.assertDictEqual(cache.get("id2"), entity)
+        self.assertDictEqual(cache.get("mk1"), entity)
+        self.assertIsNone(cache.get("id3"))
+
+        entities = cache.get_many(["id1", "id3", "mk1"])
+        self.assertListEqual(sorted(entities.keys()), ["id1", "mk1"])
+
+    def test_persistent(self):
+        """Test whether the individuals are kept between instances"""
+
+        cache = IdentityCache(self.tmp_path)
+        entity = get_entity("mk1", ["id1"])
+        cache.add([entity])
+
+        cache = IdentityCache(self.tmp_path)
+        self.assertDictEqual(cache.get("id1"), entity)
+
+    def test_replace(self):
+        """Test whether the identities moved to another individual are replaced"""
+
+        cache = IdentityCache(self.tmp_path)
+        cache.add([get_entity("mk1", ["id1", "id2"]), get_entity("mk3", ["id3"])])
+
+        # id2 is moved to the individual mk3
+        cache.add([get_entity("mk1", ["id1"]), get_entity("mk3", ["id3", "id2"])])
+
+        self.assertEqual(cache.get("id1")['mk'], "mk1")
+        self.assertEqual(cache.get("id2")['mk'], "mk3")
+        self.assertEqual(len(cache.get("id2")['identities']), 2)
+
+    def test_merge(self):
+        """Test whether the rows of the individuals merged into others are removed"""
+
+        cache = IdentityCache(self.tmp_path)
+        cache.add([get_entity("mk1", ["id1", "id2"], name="John"), get_entity("mk3", ["id3"], name="Smith")])
+
+        # mk1 is merged into mk3
+        cache.add([get_entity("mk3", ["id3", "id1", "id2"], name="John Smith")])
+
+        for uuid in ["id1", "id2", "id3", "mk3"]:
+            self.assertEqual(cache.get(uuid)['profile']['name'], "John Smith")
+        self.assertIsNone(cache.get("mk1"))
+
+    def test_add_outdated(self):
+        """Test whether the individuals retrieved before the last sync started are not added"""
+
+        cache = IdentityCache(self.tmp_path)
+        fetched_at = None
+
+        def search_modified(after):
+            yield [get_entity("mk1", ["id1"], name="John Smith")]
+            # The individual retrieved before the sync is added while it runs
+            cache.add([get_entity("mk1", ["id1"], name="John")], fetched_at=fetched_at)
+
+        cache.sync(search_modified)
+        cache.add([get_entity("mk1", ["id1"], name="John")])
+
+        # The individual is retrieved from SortingHat before the next sync
+        fetched_at = datetime_utcnow()
+        cache.sync(search_modified)
+        self.assertEqual(cache.get("id1")['profile']['name'], "John Smith")
+
+        # Also once it finished
+        cache.add([get_entity("mk1", ["id1"], name="John")], fetched_at=fetched_at)
+        self.assertEqual(cache.get("id1")['profile']['name'], "John Smith")
+
+        # The individuals retrieved after the sync started are added
+        cache.add([get_entity("mk1", ["id1"], name="J. Smith")], fetched_at=datetime_utcnow())
+        self.assertEqual(cache.get("id1")['profile']['name'], "J. Smith")
+
+    def test_sync(self):
+        """Test whether the individuals modified since the last sync are updated"""
+
+        searches = []
+
+        def search_modified(after):
+            searches.append(after)
+            yield [get_entity("mk1", ["id1"], name="John Smith")]
+
+        cache = IdentityCache(self.tmp_path)
+        cache.add([get_entity("mk1", ["id1"], name="John")])
+
+        # The first sync doesn't search for modifications
+        self.assertEqual(cache.sync(search_modified), 0)
+        self.assertListEqual(searches, [])
+        last_sync = cache.get_last_sync()
+        self.assertIsInstance(last_sync, datetime.datetime)
+
+        self.assertEqual(cache.sync(search_modified), 1)
+        self.assertListEqual(searches, [last_sync])
+        self.assertEqual(cache.get("id1")['profile']['name'], "John Smith")
+        self.assertGreaterEqual(cache.get_last_sync(), last_sync)
+
+    def test_sync_error(self):
+        """Test whether the date of the last sync is kept when it fails"""
+
+        def search_modified(after):
+            raise ValueError("SortingHat not available")
+
+        cache = IdentityCache(self.tmp_path)
+        cache.sync(search_modified)
+        last_sync = cache.get_last_sync()
+
+        with self.assertRaises(ValueError):
+            cache.sync(search_modified)
+        self.assertEqual(cache.get_last_sync(), last_sync)
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
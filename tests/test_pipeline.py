@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import unittest
+
+from grimoire_elk.pipeline import StageStats, consume, prefetch
+
+
+class TestStageStats(unittest.TestCase):
+    """Unit tests for StageStats class"""
+
+    def test_add(self):
+        """Test whether the time and items of the stages are added"""
+
+        stats = StageStats()
+        stats.add('fetch', 1.5, 10)
+        stats.add('fetch', 0.5, 5)
+        stats.add('upload', 2)
+
+        self.assertEqual(stats.seconds('fetch'), 2.0)
+        self.assertEqual(stats.items('fetch'), 15)
+        self.assertEqual(stats.seconds('upload'), 2)
+        self.assertEqual(stats.items('upload'), 0)
+        self.assertEqual(stats.seconds('enrich'), 0)
+        self.assertEqual(stats.summary(), "fetch 2.00s (15 items), upload 2.00s (0 items)")
+
+    def test_timer(self):
+        """Test whether the time of a block is added to a stage"""
+
+        stats = StageStats()
+        with stats.timer('enrich', items=3):
+            pass
+
+        self.assertGreaterEqual(stats.seconds('enrich'), 0)
+        self.assertEqual(stats.items('enrich'), 3)
+
+
+class TestPrefetch(unittest.TestCase):
+    """Unit tests for prefetch"""
+
+    def test_prefetch(self):
+        """Test whether the items are read by a background thread"""
+
+        threads = set()
+
+        def items():
+            for i in range(25):
+                threads.add(threading.get_ident())
+                yield i
+
+        stats = StageStats()
+        result = list(prefetch(items(), queue_size=2, chunk_size=10, stats=stats))
+
+        self.assertListEqual(result, list(range(25)))
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(stats.items('fetch'), 25)
+        self.assertIn('fetch wait', stats.stages)
+
+    def test_no_prefetch(self):
+        """Test whether the items are read in the calling thread when the queue size is 0"""
+
+        threads = set()
+
+        def items():
+            for i in range(5):
+                threads.add(threading.get_ident())
+                yield i
+
+        result = list(prefetch(items(), queue_size=0))
+
+        self.assertListEqual(result, list(range(5)))
+        self.assertSetEqual(threads, {threading.get_ident()})
+
+    def test_error(self):
+        """Test whether the errors reading the items are raised"""
+
+        def items():
+            yield 1
+            raise ValueError("fetch failed")
+
+        result = []
+        with self.assertRaisesRegex(ValueError, "fetch failed"):
+            for item in prefetch(items(), chunk_size=1):
+                result.append(item)
+
+        self.assertListEqual(result, [1])
+
+    def test_close(self):
+        """Test whether the items are not read once the generator is closed"""
+
+        closed = threading.Event()
+
+        def items():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+
+        fetched = prefetch(items(), queue_size=1, chunk_size=10)
+        self.assertEqual(next(fetched), 0)
+        fetched.close()
+
+        self.assertTrue(closed.is_set())
+
+
+class TestConsume(unittest.TestCase):
+    """Unit tests for consume"""
+
+    def test_consume(self):
+        """Test whether the values are consumed in order by a background thread"""
+
+        consumed = []
+        threads = set()
+
+        def func(value):
+            threads.add(threading.get_ident())
+            consumed.append(value)
+
+        stats = StageStats()
+        with consume(func, queue_size=2, stats=stats, stage='upload') as put:
+            for i in range(10):
+                put(i)
+
+        self.assertListEqual(consumed, list(range(10)))
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(stats.items('upload'), 10)
+        self.assertIn('upload wait', stats.stages)
+
+    def test_no_consume(self):
+        """Test whether the values are consumed in the calling thread when the queue size is 0"""
+
+        threads = set()
+
+        with consume(lambda value: threads.add(threading.get_ident()), queue_size=0) as put:
+            put(1)
+
+        self.assertSetEqual(threads, {threading.get_ident()})
+
+    def test_error(self):
+        """Test whether the errors consuming the values are raised and the next values discarded"""
+
+        consumed = []
+        failed = threading.Event()
+
+        def func(value):
+            if value == 1:
+                failed.set()
+                raise ValueError("upload failed")
+            consumed.append(value)
+
+        with self.assertRaisesRegex(ValueError, "upload failed"):
+            with consume(func, queue_size=1) as put:
+                put(0)
+                put(1)
+                failed.wait(5)
+                put(2)
+
+        self.assertListEqual(consumed, [0])
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
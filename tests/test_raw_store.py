@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from grimoire_elk.raw_store import INDEX_FILE, RawStore, decompress
+
+
+def get_items(uuids, day):
+    return [{'uuid': uuid, 'metadata__timestamp': '2023-01-{:02d}T00:00:00+00:00'.format(day), 'data': {'id': uuid}}
+            for uuid in uuids]
+
+
+class TestRawStore(unittest.TestCase):
+    """Unit tests for RawStore class"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='raw_store_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_append_read(self):
+        """Test whether the items are read in the order they were appended"""
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        self.assertFalse(store.exists())
+
+        store.create(complete=True)
+        store.append(get_items(['1', '2'], 1))
+        store.append([])
+        store.append(get_items(['3', '1'], 2))
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        self.assertTrue(store.exists())
+        self.assertTrue(store.readable())
+        # Only the last version of the items is read
+        items = list(store.read())
+        self.assertListEqual([item['uuid'] for item in items], ['2', '3', '1'])
+        self.assertEqual(items[2]['metadata__timestamp'], '2023-01-02T00:00:00+00:00')
+
+        # The stores are kept by index and origin
+        other = RawStore(self.tmp_path, 'git_raw', 'https://example.org/other.git')
+        self.assertFalse(other.exists())
+        self.assertListEqual(list(other.read()), [])
+
+    def test_incomplete(self):
+        """Test whether the stores created by an incremental feed can't be read"""
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        store.append(get_items(['1'], 1))
+
+        self.assertTrue(store.exists())
+        self.assertFalse(store.readable())
+
+        store.create(complete=True)
+        self.assertTrue(store.readable())
+        self.assertListEqual(list(store.read()), [])
+
+    def test_invalidate(self):
+        """Test whether an invalidated store is not read until it is created again"""
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        store.create(complete=True)
+        store.append(get_items(['1'], 1))
+        store.invalidate()
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        self.assertTrue(store.exists())
+        self.assertFalse(store.readable())
+
+        store.create(complete=True)
+        self.assertTrue(store.readable())
+
+    def test_read_from_date(self):
+        """Test whether the frames and items older than a date are skipped"""
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        store.create(complete=True)
+        store.append(get_items(['1', '2'], 1))
+        store.append(get_items(['3'], 2) + get_items(['4'], 4))
+        store.append(get_items(['5'], 5))
+
+        from_date = datetime.datetime(2023, 1, 3)
+        with unittest.mock.patch('grimoire_elk.raw_store.decompress', wraps=decompress) as mock_decompress:
+            uuids = [item['uuid'] for item in store.read(from_date=from_date)]
+
+        self.assertListEqual(uuids, ['4', '5'])
+        # Each frame read is decompressed twice to find the last versions
+        self.assertEqual(mock_decompress.call_count, 4)
+
+    def test_segments(self):
+        """Test whether a new segment is started when the current one is full"""
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        store.create(complete=True)
+
+        with unittest.mock.patch('grimoire_elk.raw_store.SEGMENT_SIZE', 1):
+            store.append(get_items(['1'], 1))
+            store.append(get_items(['2'], 1))
+            store.append(get_items(['3'], 1))
+
+        segments = [name for name in os.listdir(store.path) if name.startswith('00')]
+        self.assertEqual(len(segments), 3)
+        self.assertListEqual([item['uuid'] for item in store.read()], ['1', '2', '3'])
+
+    def test_interrupted_frame(self):
+        """Test whether the frames not written in the index are not read"""
+
+        store = RawStore(self.tmp_path, 'git_raw', 'https://example.org/repo.git')
+        store.create(complete=True)
+        store.append(get_items(['1'], 1))
+
+        # A frame was written but not its line of the index
+        segment = [name for name in os.listdir(store.path) if name.startswith('00')][0]
+        with open(os.path.join(store.path, segment), 'ab') as fd:
+            fd.write(b'incomplete frame')
+        with open(os.path.join(store.path, INDEX_FILE), 'a') as fd:
+            fd.write('{"segment": 1')
+
+        store.append(get_items(['2'], 2))
+
+        self.assertListEqual([item['uuid'] for item in store.read()], ['1', '2'])
+
+
+if __name__ == "__main__":
+    unittest.main(warnings='ignore')
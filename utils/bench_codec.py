@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2023 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Microbenchmark of the JSON codec using the test fixtures.
+
+It compares the decoding of search responses and the encoding of bulk
+documents done before the codec module (stdlib json with the surrogates
+cleanup) with the codec, with and without orjson.
+
+    usage: python3 utils/bench_codec.py [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+from grimoire_elk import codec
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests', 'data')
+
+
+def legacy_loads(data):
+    obj = json.loads(data.decode('utf-8', errors='replace'))
+    return json.loads(json.dumps(obj, ensure_ascii=False).encode('utf-8', errors='ignore').decode('utf-8'))
+
+
+def read_fixtures():
+    """Build a search response with the items of each fixture"""
+
+    responses = []
+    for filename in sorted(os.listdir(DATA_DIR)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(DATA_DIR, filename), 'rb') as f:
+            try:
+                items = json.loads(f.read())
+            except ValueError:
+                continue
+        if not isinstance(items, list):
+            items = [items]
+        hits = [{"_index": "bench", "_id": str(i), "_source": item} for i, item in enumerate(items)]
+        response = {"_scroll_id": "bench", "hits": {"total": {"value": len(hits)}, "hits": hits}}
+        responses.append(json.dumps(response).encode('utf-8'))
+
+    return responses
+
+
+def bench(name, func, repeat):
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    print("{:<32} {:>10.2f} ms".format(name, seconds * 1000))
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(usage="usage: bench_codec.py [options]",
+                                     description="Benchmark of the JSON codec")
+    parser.add_argument('--repeat', default=5, type=int, help="Number of runs of each benchmark")
+    args = parser.parse_args()
+
+    responses = read_fixtures()
+    documents = [hit['_source'] for response in responses for hit in json.loads(response)['hits']['hits']]
+    size = sum(len(response) for response in responses) / (1024 * 1024)
+
+    print("{} responses ({:.2f} MB), {} documents, orjson: {}\n".format(
+          len(responses), size, len(documents), codec.orjson is not None))
+
+    print("Decoding search responses")
+    bench("legacy (json x3)", lambda: [legacy_loads(r) for r in responses], args.repeat)
+    codec.use_orjson(False)
+    bench("codec (json)", lambda: [codec.loads(r) for r in responses], args.repeat)
+    if codec.use_orjson(True):
+        bench("codec (orjson)", lambda: [codec.loads(r) for r in responses], args.repeat)
+
+    print("\nEncoding bulk documents")
+    bench("legacy (json)", lambda: [json.dumps(d) for d in documents], args.repeat)
+    if codec.use_orjson(True):
+        bench("codec (orjson)", lambda: [codec.dumps(d) for d in documents], args.repeat)
+
+
+if __name__ == '__main__':
+    main()
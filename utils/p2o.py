@@ -24,9 +24,14 @@ import logging
 from datetime import datetime
 from os import sys
 
+from grimoire_elk.cache import configure_caches
 from grimoire_elk.elk import feed_backend, enrich_backend
 from grimoire_elk.elastic import ElasticSearch
 from grimoire_elk.elastic_items import ElasticItems
+from grimoire_elk.enriched.enrich import Enrich
+from grimoire_elk.enriched.utils import enable_compression, set_pool_size
+from grimoire_elk.raw.elastic import ElasticOcean
+from grimoire_elk.raw.git import GitOcean
 from grimoire_elk.utils import get_params, config_logging
 
 
@@ -50,14 +55,48 @@ if __name__ == '__main__':
             # Configure elastic bulk size and scrolling
             if args.bulk_size:
                 ElasticSearch.max_items_bulk = args.bulk_size
+            if args.bulk_bytes:
+                ElasticSearch.max_bytes_bulk = args.bulk_bytes
+            if args.bulk_queue_size is not None:
+                ElasticSearch.bulk_queue_size = args.bulk_queue_size
+            if args.feed_queue_size is not None:
+                ElasticOcean.feed_queue_size = args.feed_queue_size
+            if args.skip_unchanged:
+                ElasticOcean.skip_unchanged = True
+            if args.raw_store_dir:
+                ElasticOcean.raw_store_dir = args.raw_store_dir
+            if args.commits_store_dir:
+                GitOcean.commits_store_dir = args.commits_store_dir
+            if args.es_pool_size:
+                set_pool_size(args.es_pool_size)
+            if args.es_gzip:
+                enable_compression(url)
+                if args.elastic_url_enrich:
+                    enable_compression(args.elastic_url_enrich)
+            if args.refresh_policy:
+                ElasticSearch.refresh_policy = args.refresh_policy
+            if args.skip_index_setup:
+                ElasticSearch.skip_index_setup = True
             if args.scroll_size:
                 ElasticItems.scroll_size = args.scroll_size
             if args.scroll_wait:
                 ElasticItems.scroll_wait = args.scroll_wait
+            if args.scroll_slices:
+                ElasticItems.scroll_slices = args.scroll_slices
+            if args.pagination:
+                ElasticItems.pagination = args.pagination
+            if args.enrich_workers:
+                Enrich.enrich_workers = args.enrich_workers
+            if args.checkpoint_bulks:
+                Enrich.checkpoint_bulks = args.checkpoint_bulks
+            configure_caches(size=args.cache_size, ttl=args.cache_ttl, policy=args.cache_policy)
+            if args.identities_cache_dir:
+                Enrich.identities_cache_dir = args.identities_cache_dir
             if not args.enrich_only:
                 feed_backend(url, clean, args.fetch_cache,
                              args.backend, args.backend_args,
-                             args.index, args.index_enrich, args.project)
+                             args.index, args.index_enrich, args.project,
+                             bulk_load=args.bulk_load)
                 logging.info("Backend feed completed")
 
             studies_args = None
@@ -86,7 +125,8 @@ if __name__ == '__main__':
                                args.author_id, args.author_uuid,
                                args.filter_raw,
                                args.jenkins_rename_file, unaffiliated_group,
-                               args.pair_programming, studies_args)
+                               args.pair_programming, studies_args,
+                               bulk_load=args.bulk_load)
                 logging.info("Enrich backend completed")
             elif args.events_enrich:
                 logging.info("Enrich option is needed for events_enrich")